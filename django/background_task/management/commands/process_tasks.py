@@ -29,6 +29,8 @@ class Command(BaseCommand):
 
     def close_event_loop(self):
         if self.loop:
+            from finances.electrum_pool import close_pool
+            close_pool(self.loop)
             self.loop.close()
 
     def run(self, *args, **options):
@@ -306,7 +306,9 @@ class StratumClient:
             # it's a future which is done now
             full_req, rv = inf
 
-            response_map = {resp['id']: resp for resp in msg}
+            # failed requests get their ElectrumErrorResponse in place of
+            # a result, so one bad request doesn't fail the whole batch
+            response_map = {resp.get('id'): resp for resp in msg}
             results = []
             for request in full_req:
                 req_id = request.get('id', None)
@@ -314,16 +316,19 @@ class StratumClient:
                 response = response_map.get(req_id, None)
                 if not response:
                     logger.error("Incoming server message had missing ID: %s" % req_id)
+                    results.append(ElectrumErrorResponse("missing response", request))
+                    continue
 
                 error = response.get('error', None)
                 if error:
                     logger.info("Error response: '%s'" % error)
-                    rv.set_exception(ElectrumErrorResponse(error, request))
+                    results.append(ElectrumErrorResponse(error, request))
+                    continue
 
-                result = response.get('result')
-                results.append(result)
+                results.append(response.get('result'))
 
-            rv.set_result(results)
+            if not rv.done():
+                rv.set_result(results)
             return
 
         resp_id = msg.get('id', None)
@@ -340,7 +345,8 @@ class StratumClient:
 
             logger.debug("Traffic on subscription: %s" % method)
 
-            subs = self.subscriptions.get(method)
+            # subscriptions sent with RPC or batch_rpc have no queue
+            subs = self.subscriptions.get(method, [])
             for q in subs:
                 self.loop.create_task(q.put(result))
 
@@ -350,13 +356,16 @@ class StratumClient:
         result = msg.get('result')
 
         # fetch and forget about the request
-        inf = self.inflight.pop(resp_id)
+        inf = self.inflight.pop(resp_id, None)
         if not inf:
             logger.error("Incoming server message had unknown ID in it: %s" % resp_id)
             return
 
         # it's a future which is done now
         req, rv = inf
+        if rv.done():
+            # the caller gave up waiting, see ElectrumPool.rpc
+            return
 
         if 'error' in msg:
             err = msg['error']
@@ -400,8 +409,10 @@ class StratumClient:
             .. and sometimes take arguments, all of which are positional.
 
             Returns a future which will you should await for the list of results for each command
-            from the server. Failures are returned as exceptions.
+            from the server. Failed commands have an ElectrumErrorResponse in place of their
+            result.
         '''
+        assert requests, "empty batch"
         for request in requests:
             assert isinstance(request, tuple)
             method, *params = request
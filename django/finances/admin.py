@@ -8,6 +8,7 @@ class OutputStatAdmin(admin.ModelAdmin):
                     'confirmed_at_block_time',
                     'get_spent_status',
                     'spent',
+                    'spent_at_block_time',
                     'network',
                     'user',
                     'next_enc_input_attrs',
@@ -17,7 +18,7 @@ class OutputStatAdmin(admin.ModelAdmin):
     ordering = ('-confirmed_at_block_time',)
 
 class HistoricalPriceAdmin(admin.ModelAdmin):
-    list_display = ('timestamp', 'usd_price', 'eur_price', 'gbp_price')
+    list_display = ('timestamp', 'usd_minor', 'eur_minor', 'gbp_minor')
     search_fields = ('timestamp',)
     ordering = ('-timestamp',)
 
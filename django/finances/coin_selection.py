@@ -0,0 +1,395 @@
+"""
+Coin selection and consolidation planning for the spendable outputs of a
+labelbase.
+
+Sizes and fees come from the ``tx_math`` model and the values from the
+``OutputStat`` of each output. Every output is valued by its effective
+value, its value minus the fee of the input spending it.
+
+``plan_spend`` picks the inputs paying ``target`` sats: branch and bound
+looks for a selection without change and with the least waste, a
+randomized knapsack search is the fallback when there is none and largest
+first the last resort. The searches stop at a time budget and return the
+best selection found so far, so the planner stays interactive for
+labelbases with many thousand outputs. ``plan_consolidation`` picks the
+outputs worth merging into one output at a low fee rate.
+"""
+import random
+import time
+from collections import namedtuple
+
+from django.conf import settings
+
+from .tx_math import OUTPUT_SIZES, calculate_transaction_sizes, get_input_type_size
+
+
+# Consensus limit for standard transactions
+MAX_STANDARD_TX_WEIGHT = 400000
+
+BNB_MAX_TRIES = 100000
+KNAPSACK_ITERATIONS = 1000
+
+Candidate = namedtuple("Candidate", "label_id ref value input_type")
+
+
+def get_input_vbytes(input_type):
+    base, witness = get_input_type_size(*input_type)
+    return (base * 4 + witness) / 4
+
+
+def get_candidates(labelbase):
+    """
+    Returns the spendable unspent outputs of ``labelbase`` with a known
+    value as ``Candidate``.
+    """
+    from labelbase.models import Label
+    from .fee_health import get_spend_input
+
+    labels = Label.objects.filter(
+        labelbase=labelbase, type=Label.TYPE_OUTPUT, output_stat__spent=False,
+    ).select_related("output_stat")
+    candidates = []
+    for label in labels:
+        # spendable is encrypted, it can't be filtered in the database
+        if not label.spendable or not label.output_stat.value:
+            continue
+        spend_input = get_spend_input(label)
+        input_type = (spend_input['input_script'], spend_input['input_m'], spend_input['input_n'])
+        candidates.append(Candidate(label.id, label.ref, label.output_stat.value, input_type))
+    return candidates
+
+
+class CoinSelection:
+    """
+    Shared state of one planning request: the fee rates, the cost of the
+    inputs and outputs and the deadline of the search.
+    """
+
+    def __init__(self, candidates, fee_rate, long_term_fee_rate=None,
+                 output_type='p2wpkh', change_type='p2wpkh', time_budget=None):
+        if fee_rate <= 0:
+            raise ValueError("The fee rate must be positive.")
+        if output_type not in OUTPUT_SIZES or change_type not in OUTPUT_SIZES:
+            raise ValueError("Unsupported output type.")
+        self.fee_rate = fee_rate
+        self.long_term_fee_rate = fee_rate if long_term_fee_rate is None else long_term_fee_rate
+        self.output_type = output_type
+        self.change_type = change_type
+        if time_budget is None:
+            time_budget = settings.COIN_SELECTION_TIME_BUDGET
+        self.deadline = time.monotonic() + time_budget
+        self.complete = True
+
+        self.candidates = []
+        self.fees = {}
+        self.waste = {}
+        for candidate in candidates:
+            vbytes = get_input_vbytes(candidate.input_type)
+            fee = vbytes * fee_rate
+            # inputs which cost more than they are worth are left out
+            if candidate.value <= fee:
+                continue
+            self.candidates.append(candidate)
+            self.fees[candidate] = fee
+            self.waste[candidate] = fee - vbytes * self.long_term_fee_rate
+
+        # creating the change output now and spending it later
+        change_spend_vbytes = get_input_vbytes(("P2WPKH", 0, 0))
+        self.cost_of_change = (OUTPUT_SIZES[change_type] * fee_rate +
+                               change_spend_vbytes * self.long_term_fee_rate)
+
+    def effective_value(self, candidate):
+        return candidate.value - self.fees[candidate]
+
+    def timed_out(self):
+        if time.monotonic() > self.deadline:
+            self.complete = False
+            return True
+        return False
+
+    def get_sizes(self, selected, outputs):
+        input_counts = {}
+        for candidate in selected:
+            input_counts[candidate.input_type] = [input_counts.get(candidate.input_type, [0])[0] + 1]
+        output_counts = {}
+        for output_type in outputs:
+            output_counts[output_type] = [output_counts.get(output_type, [0])[0] + 1]
+        sizes = calculate_transaction_sizes(input_counts, output_counts, self.fee_rate)
+        return {key: values[0] for key, values in sizes.items()}
+
+    def get_fixed_fee(self, outputs):
+        """
+        Fee of the transaction without inputs, with the segwit marker and
+        half a vbyte for the rounding of the size.
+        """
+        return (self.get_sizes([], outputs)['txWeight'] + 2 + 2) / 4 * self.fee_rate
+
+    def branch_and_bound(self, target):
+        """
+        Depth first search over the candidates sorted by effective value
+        for a selection in ``[target, target + cost_of_change]`` with the
+        least waste, as in Bitcoin Core's SelectCoinsBnB.
+        """
+        pool = sorted(self.candidates, key=self.effective_value, reverse=True)
+        values = [self.effective_value(c) for c in pool]
+        waste = [self.waste[c] for c in pool]
+        available = sum(values)
+        if available < target:
+            return None
+        upper = target + self.cost_of_change
+        # with a fee rate above the long term rate, more inputs add waste
+        prune_on_waste = self.fee_rate > self.long_term_fee_rate
+
+        best = None
+        best_waste = float('inf')
+        selection = []
+        value = 0
+        curr_waste = 0
+        i = 0
+        for tries in range(BNB_MAX_TRIES):
+            if tries % 1000 == 0 and self.timed_out():
+                break
+            if (value + available < target or value > upper or
+                    (prune_on_waste and curr_waste > best_waste)):
+                backtrack = True
+            elif value >= target:
+                # a hit, the excess is lost to fees
+                excess_waste = curr_waste + value - target
+                if excess_waste <= best_waste:
+                    best = list(selection)
+                    best_waste = excess_waste
+                backtrack = True
+            else:
+                backtrack = False
+
+            if backtrack:
+                if not selection:
+                    break
+                # walk back to the last included input, then exclude it
+                i -= 1
+                while i > selection[-1]:
+                    available += values[i]
+                    i -= 1
+                value -= values[i]
+                curr_waste -= waste[i]
+                selection.pop()
+            else:
+                available -= values[i]
+                # excluding an input and including an equal one next is
+                # the same selection
+                if (selection and selection[-1] != i - 1 and values[i] == values[i - 1]
+                        and pool[i].input_type == pool[i - 1].input_type):
+                    pass
+                else:
+                    selection.append(i)
+                    value += values[i]
+                    curr_waste += waste[i]
+            i += 1
+        else:
+            self.complete = False
+
+        if best is None:
+            return None
+        return [pool[i] for i in best]
+
+    def knapsack(self, target):
+        """
+        Randomized search for the smallest selection above ``target`` plus
+        a minimum change, as in Bitcoin Core's KnapsackSolver.
+        """
+        min_change = self.cost_of_change
+        smaller = []
+        lowest_larger = None
+        for candidate in self.candidates:
+            value = self.effective_value(candidate)
+            if value == target:
+                return [candidate]
+            if value < target + min_change:
+                smaller.append(candidate)
+            elif lowest_larger is None or value < self.effective_value(lowest_larger):
+                lowest_larger = candidate
+
+        total_smaller = sum(self.effective_value(c) for c in smaller)
+        if total_smaller == target:
+            return smaller
+        if total_smaller < target:
+            return [lowest_larger] if lowest_larger is not None else None
+
+        smaller.sort(key=self.effective_value, reverse=True)
+        values = [self.effective_value(c) for c in smaller]
+        best, best_value = self.approximate_best_subset(values, total_smaller, target)
+        if best_value != target and total_smaller >= target + min_change:
+            best, best_value = self.approximate_best_subset(
+                values, total_smaller, target + min_change)
+
+        if lowest_larger is not None and (
+                (best_value != target and best_value < target + min_change) or
+                self.effective_value(lowest_larger) <= best_value):
+            return [lowest_larger]
+        return [smaller[i] for i, included in enumerate(best) if included]
+
+    def approximate_best_subset(self, values, total, target):
+        # seeded, the same request gives the same plan
+        rng = random.Random(0)
+        best = [True] * len(values)
+        best_value = total
+        for _ in range(KNAPSACK_ITERATIONS):
+            if best_value == target or self.timed_out():
+                break
+            included = [False] * len(values)
+            value = 0
+            reached = False
+            for npass in range(2):
+                if reached:
+                    break
+                for i, v in enumerate(values):
+                    # the first pass picks inputs at random, the second
+                    # fills up with the ones not picked yet
+                    if (rng.random() < 0.5) if npass == 0 else not included[i]:
+                        value += v
+                        included[i] = True
+                        if value >= target:
+                            reached = True
+                            if value < best_value:
+                                best_value = value
+                                best = list(included)
+                            value -= v
+                            included[i] = False
+        return best, best_value
+
+    def largest_first(self, target):
+        selected = []
+        value = 0
+        for candidate in sorted(self.candidates, key=self.effective_value, reverse=True):
+            selected.append(candidate)
+            value += self.effective_value(candidate)
+            if value >= target:
+                return selected
+        return None
+
+    def result(self, mode, algorithm, selected, outputs, target):
+        sizes = self.get_sizes(selected, outputs)
+        return {
+            'mode': mode,
+            'algorithm': algorithm,
+            'complete': self.complete,
+            'fee_rate': self.fee_rate,
+            'long_term_fee_rate': self.long_term_fee_rate,
+            'inputs': [{'label_id': c.label_id, 'ref': c.ref, 'value': c.value,
+                        'input_script': c.input_type[0]} for c in selected],
+            'input_value': sum(c.value for c in selected),
+            'target': target,
+            'fee': sizes['fee'],
+            'vbytes': sizes['txVBytes'],
+            'weight': sizes['txWeight'],
+        }
+
+
+def plan_spend(candidates, target, fee_rate, long_term_fee_rate=None,
+               output_type='p2wpkh', change_type='p2wpkh', time_budget=None):
+    """
+    Selects inputs from ``candidates`` paying ``target`` sats to one
+    output of ``output_type`` at ``fee_rate`` sats per vbyte. Raises
+    ``ValueError`` if the candidates can't pay for it.
+    """
+    if target <= 0:
+        raise ValueError("The target must be positive.")
+    selection = CoinSelection(candidates, fee_rate, long_term_fee_rate,
+                              output_type, change_type, time_budget)
+    # the effective values pay for the inputs, the rest of the fee is fixed
+    changeless_target = target + selection.get_fixed_fee([output_type])
+    change_target = target + selection.get_fixed_fee([output_type, change_type])
+
+    algorithm = 'bnb'
+    selected = selection.branch_and_bound(changeless_target)
+    if selected is None:
+        algorithm = 'knapsack'
+        selected = selection.knapsack(change_target)
+    if selected is None:
+        algorithm = 'largest-first'
+        selected = selection.largest_first(change_target)
+    if selected is None:
+        raise ValueError("The spendable outputs can't pay {} sats at {} sat/vB.".format(
+            target, fee_rate))
+
+    # the effective values are estimates per input, the fee of the
+    # transaction is rounded and grows with the input count varint
+    remaining = sorted(set(selection.candidates) - set(selected),
+                       key=selection.effective_value, reverse=True)
+    input_value = sum(c.value for c in selected)
+    fee = selection.get_sizes(selected, [output_type])['fee']
+    while input_value - fee < target:
+        if not remaining:
+            raise ValueError("The spendable outputs can't pay {} sats at {} sat/vB.".format(
+                target, fee_rate))
+        selected.append(remaining.pop())
+        input_value = sum(c.value for c in selected)
+        fee = selection.get_sizes(selected, [output_type])['fee']
+    outputs = [output_type]
+    change = 0
+    # change below its cost is left to the fee
+    if input_value - target - fee > selection.cost_of_change:
+        outputs.append(change_type)
+        change = input_value - target - selection.get_sizes(selected, outputs)['fee']
+    result = selection.result('spend', algorithm, selected, outputs, target)
+    result['change'] = change
+    result['waste'] = round(sum(selection.waste[c] for c in selected) + (
+        selection.cost_of_change if change else input_value - target - result['fee']))
+    return result
+
+
+def plan_consolidation(candidates, fee_rate, long_term_fee_rate=None,
+                       output_type='p2wpkh', max_weight=MAX_STANDARD_TX_WEIGHT):
+    """
+    Selects the outputs worth consolidating into one output of
+    ``output_type`` at ``fee_rate``, smallest first and within
+    ``max_weight``. ``savings`` is what spending them individually at
+    ``long_term_fee_rate`` would cost more.
+    """
+    selection = CoinSelection(candidates, fee_rate, long_term_fee_rate,
+                              output_type, time_budget=0)
+    selected = []
+    weight = selection.get_sizes([], [output_type])['txWeight']
+    for candidate in sorted(selection.candidates, key=lambda c: c.value):
+        base, witness = get_input_type_size(*candidate.input_type)
+        # inputs beyond the first one byte varint and the segwit marker
+        # are covered by the margin of a few weight units
+        if weight + base * 4 + witness + 16 > max_weight:
+            break
+        selected.append(candidate)
+        weight += base * 4 + witness
+
+    if len(selected) < 2:
+        raise ValueError("There are no outputs worth consolidating at {} sat/vB.".format(fee_rate))
+    result = selection.result('consolidate', 'smallest-first', selected, [output_type], None)
+    result['target'] = result['input_value'] - result['fee']
+    result['change'] = 0
+    result['waste'] = round(sum(selection.waste[c] for c in selected))
+    result['savings'] = -result['waste']
+    return result
+
+
+def plan_for_labelbase(labelbase, params):
+    """
+    Plans a spend or a consolidation of the outputs of ``labelbase`` from
+    the request parameters ``mode`` (spend or consolidate), ``fee_rate``
+    (defaults to the owner's fee), ``long_term_fee_rate``, ``target`` and
+    ``output_type``. Raises ``ValueError`` on invalid parameters.
+    """
+    mode = params.get('mode') or 'spend'
+    try:
+        fee_rate = float(params.get('fee_rate') or labelbase.user.profile.my_fee)
+        long_term_fee_rate = params.get('long_term_fee_rate')
+        if long_term_fee_rate:
+            long_term_fee_rate = float(long_term_fee_rate)
+        target = int(params.get('target') or 0)
+    except (TypeError, ValueError):
+        raise ValueError("Fee rates and target must be numbers.")
+    output_type = params.get('output_type') or 'p2wpkh'
+
+    candidates = get_candidates(labelbase)
+    if mode == 'consolidate':
+        return plan_consolidation(candidates, fee_rate, long_term_fee_rate or None, output_type)
+    if mode == 'spend':
+        return plan_spend(candidates, target, fee_rate, long_term_fee_rate or None, output_type)
+    raise ValueError("Unknown mode: {}".format(mode))
@@ -1,48 +1,105 @@
-from connectrum.client import StratumClient
+from django.conf import settings
 from connectrum.svr_info import ServerInfo
 from connectrum import ElectrumErrorResponse
 from labelbase.models import Label
 from finances.models import OutputStat, HistoricalPrice
+from finances.electrum_pool import get_pool
+from finances.tx_math import detect_script_type
+from finances.tx_store import ELECTRUM, load_transactions, store_transactions
 import logging
 
 logger = logging.getLogger('labelbase')
 
-async def interact(conn, server_info, method, utxo):
+async def fetch_transaction(pool, conn, method, txid):
     try:
-        await conn.connect(server_info, "s", use_tor=server_info.is_onion,
-                           disable_cert_verify=True, short_term=True)
-        txid, index = utxo.split(":")
+        return await pool.rpc(conn, method, txid, True)
+    except ElectrumErrorResponse as ex:
+        logger.error(f"ERROR: {ex} {conn.last_error}")
+
+
+def get_output(txn, utxo):
+    txid, index = utxo.split(":")
+    if txn:
         try:
-            txn = await conn.RPC(method, txid, True)
-            if txn:
-                try:
-                    blocktime = int(txn.get('blocktime', 0))
-                    logger.debug(f"blocktime: {blocktime}")
-                except Exception as ex:
-                    blocktime = 0
-                    logger.error(f"Can't get blocktime: {ex}")
-                utxo = txn.get('vout')[int(index)]
-                address = txn.get('vout')[int(index)].get('scriptPubKey', {}).get('address')
-                value = txn.get('vout')[int(index)].get('value') * 100000000
-                return txid, index, address, value, blocktime, utxo
-        except ElectrumErrorResponse as ex:
-            logger.error(f"ERROR: {ex} {conn.last_error}")
-    finally:
-        conn.close()
-
-
-async def interact_addr(conn, server_info, method, addr):
+            blocktime = int(txn.get('blocktime', 0))
+            logger.debug(f"blocktime: {blocktime}")
+        except Exception as ex:
+            blocktime = 0
+            logger.error(f"Can't get blocktime: {ex}")
+        utxo = txn.get('vout')[int(index)]
+        address = txn.get('vout')[int(index)].get('scriptPubKey', {}).get('address')
+        value = txn.get('vout')[int(index)].get('value') * 100000000
+        return txid, index, address, value, blocktime, utxo
+
+
+async def interact_addr(pool, conn, method, addr):
     try:
-        await conn.connect(server_info, "s", use_tor=server_info.is_onion,
-                           disable_cert_verify=True, short_term=True)
-        try:
-            hextx = await conn.RPC(method, addr)
-            if hextx is not None:
-                return hextx
-        except ElectrumErrorResponse as ex:
-            logger.error(ex)
-    finally:
-        conn.close()
+        hextx = await pool.rpc(conn, method, addr)
+        if hextx is not None:
+            return hextx
+    except ElectrumErrorResponse as ex:
+        logger.error(ex)
+
+
+async def fetch_transactions(pool, conn, txids):
+    """
+    Returns ``{txid: transaction}`` of ``txids``, fetched in batches of
+    ``ELECTRUM_BATCH_SIZE``. The failed ones are left out.
+    """
+    txns = {}
+    batch_size = settings.ELECTRUM_BATCH_SIZE
+    for i in range(0, len(txids), batch_size):
+        chunk = txids[i:i + batch_size]
+        responses = await pool.batch_rpc(
+            conn, [("blockchain.transaction.get", txid, True) for txid in chunk])
+        for txid, txn in zip(chunk, responses):
+            if isinstance(txn, ElectrumErrorResponse):
+                logger.error(txn)
+            elif txn:
+                txns[txid] = txn
+    return txns
+
+
+def find_spend_time(loop, pool, conn, address, txid, index):
+    """
+    Returns the block time of the transaction of the history of ``address``
+    spending ``txid:index``, 0 if it is unconfirmed or not found.
+    """
+    history = loop.run_until_complete(interact_addr(
+        pool, conn, "blockchain.address.get_history", address))
+    candidates = sorted({entry.get('tx_hash') for entry in history or []
+                         if entry.get('tx_hash') != txid and entry.get('height', 0) > 0})
+
+    # Fetch the ones not stored yet, see finances/tx_store.py
+    txns = load_transactions(candidates, ELECTRUM)
+    fetched = loop.run_until_complete(fetch_transactions(
+        pool, conn, [candidate for candidate in candidates if candidate not in txns]))
+    store_transactions(fetched, ELECTRUM)
+    txns.update(fetched)
+
+    for txn in txns.values():
+        for vin in txn.get('vin', []):
+            if vin.get('txid') == txid and vin.get('vout') == int(index):
+                return int(txn.get('blocktime', 0) or 0)
+    return 0
+
+
+def get_server_info(labelbase):
+    """
+    Returns the ``ServerInfo`` of the Electrum server the owner of
+    ``labelbase`` configured for its network.
+    """
+    # Determine server info based on network
+    profile = labelbase.user.profile
+    if labelbase.is_mainnet:
+        electrum_hostname = profile.electrum_hostname or "fulcrum.sethforprivacy.com"
+        electrum_ports = profile.electrum_ports or "s50002"
+    elif labelbase.is_testnet:
+        electrum_hostname = profile.electrum_hostname_test or "testnet.qtornado.com"
+        electrum_ports = profile.electrum_ports_test or "s51002"
+    else:
+        raise ValueError("Unknown network type.")
+    return ServerInfo(electrum_hostname, electrum_hostname, ports=(electrum_ports))
 
 
 def is_valid_output_ref(ref):
@@ -55,12 +112,9 @@ def checkup_label(label_id, loop):
         return
 
     try:
-        elem = Label.objects.get(id=label_id)
-        output = OutputStat.objects.filter(
-            user=elem.labelbase.user,
-            type_ref_hash=elem.type_ref_hash,
-            network=elem.labelbase.network
-        ).last()
+        elem = Label.objects.select_related(
+            "output_stat", "labelbase__user__profile").get(id=label_id)
+        output = elem.output_stat
 
         if not output:
             output = OutputStat(
@@ -77,23 +131,23 @@ def checkup_label(label_id, loop):
 
         if elem.type == "output" and is_valid_output_ref(elem.ref) and (
             output.spent is not True or output.confirmed_at_block_time is None
+            or (output.spent and not output.spent_at_block_time)
         ):
-            # Determine server info based on network
-            if elem.labelbase.is_mainnet:
-                electrum_hostname = elem.labelbase.user.profile.electrum_hostname or "fulcrum.sethforprivacy.com"
-                electrum_ports = elem.labelbase.user.profile.electrum_ports or "s50002"
-            elif elem.labelbase.is_testnet:
-                electrum_hostname = elem.labelbase.user.profile.electrum_hostname_test or "testnet.qtornado.com"
-                electrum_ports = elem.labelbase.user.profile.electrum_ports_test or "s51002"
-            else:
-                raise ValueError("Unknown network type.")
-
-            server_info = ServerInfo(electrum_hostname, electrum_hostname, ports=(electrum_ports))
-            conn = StratumClient()
+            server_info = get_server_info(elem.labelbase)
+            # warm connection of the worker's loop, see electrum_pool.py
+            pool = get_pool(loop)
+            conn = loop.run_until_complete(pool.get_client(
+                server_info, elem.labelbase.network, use_tor=server_info.is_onion))
             utxo = elem.ref
 
-            # Fetch transaction details
-            utxo_resp = loop.run_until_complete(interact(conn, server_info, "blockchain.transaction.get", utxo))
+            # Fetch transaction details, once if confirmed, see finances/tx_store.py
+            txid = utxo.split(":")[0]
+            txn = load_transactions([txid], ELECTRUM).get(txid)
+            if txn is None:
+                txn = loop.run_until_complete(fetch_transaction(
+                    pool, conn, "blockchain.transaction.get", txid))
+                store_transactions({txid: txn}, ELECTRUM)
+            utxo_resp = get_output(txn, utxo)
 
             if utxo_resp:
                 txid, index, address, value, blocktime, utxo_data = utxo_resp
@@ -102,12 +156,23 @@ def checkup_label(label_id, loop):
                     output.confirmed_at_block_time = blocktime
                     HistoricalPrice.get_or_create_from_api(None, timestamp=blocktime)
 
+                # The script type decides the size of the input spending
+                # this output, see finances.fee_health.
+                script_pubkey = utxo_data.get('scriptPubKey', {})
+                input_script = detect_script_type(script_pubkey.get('hex'),
+                                                  address,
+                                                  script_pubkey.get('type'))
+                if input_script:
+                    attrs = output.next_input_attributes()
+                    attrs['input_script'] = input_script
+                    output.set_next_input_attributes(attrs)
+
                 # Fetch all unspents for the address
                 try:
-                    unspents = loop.run_until_complete(interact_addr(conn, server_info, "blockchain.address.listunspent", address))
+                    unspents = loop.run_until_complete(interact_addr(pool, conn, "blockchain.address.listunspent", address))
                 except:
                     conn.last_error = None
-                    unspents = loop.run_until_complete(interact_addr(conn, server_info, "blockchain.scripthash.listunspent", address))
+                    unspents = loop.run_until_complete(interact_addr(pool, conn, "blockchain.scripthash.listunspent", address))
 
                 logger.debug(f"Unspents for address {address}: {unspents}")
 
@@ -134,6 +199,12 @@ def checkup_label(label_id, loop):
                 if not utxo_found:
                     output.spent = True
                     logger.warning(f"UTXO {txid}:{index} not found in unspent outputs.")
+                    # The spend time places the output in the holdings
+                    # timeline, see finances.timeline. It's looked up once.
+                    if not output.spent_at_block_time:
+                        conn.last_error = None
+                        output.spent_at_block_time = find_spend_time(
+                            loop, pool, conn, address, txid, index)
 
             elif conn.last_error:
                 output.last_error = conn.last_error
@@ -0,0 +1,158 @@
+"""
+Electrum connections shared by the tasks of the ``process_tasks`` worker.
+
+A connection is opened once per server, network and Tor flag and kept
+open on the event loop of the worker, with the keepalive of
+``StratumClient``, so a checkup pays for its RPCs and not for a TLS (or
+Tor) handshake and ``server.version`` each. The loop only runs while a
+task runs, so a connection which was idle for a while is pinged before
+it's reused and reopened if the server dropped it.
+
+A call which times out fails alone: its connection is retired, new calls
+get a new connection, and it is closed once the calls still running on
+it are done, so the other chunks of a refresh sharing it carry on.
+"""
+import asyncio
+import logging
+import time
+import weakref
+from collections import OrderedDict
+
+from django.conf import settings
+
+from connectrum import ElectrumErrorResponse
+from connectrum.client import StratumClient
+
+logger = logging.getLogger('labelbase')
+
+_pools = weakref.WeakKeyDictionary()
+
+
+def get_pool(loop):
+    """Returns the pool of ``loop``, created on first use."""
+    pool = _pools.get(loop)
+    if pool is None:
+        pool = _pools[loop] = ElectrumPool(loop)
+    return pool
+
+
+def close_pool(loop):
+    pool = _pools.pop(loop, None)
+    if pool is not None:
+        pool.close()
+
+
+class ElectrumPool:
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.max_connections = settings.ELECTRUM_POOL_MAX_CONNECTIONS
+        self.idle_check = settings.ELECTRUM_POOL_IDLE_CHECK
+        self.timeout = settings.ELECTRUM_TIMEOUT
+        self.clients = OrderedDict()  # key -> (client, last used)
+        self.retired = set()  # timed out, closed when idle
+        self.locks = {}
+        self.connects = 0
+
+    @staticmethod
+    def get_key(server_info, network, use_tor, proto_code="s"):
+        return (server_info['hostname'], tuple(server_info['ports']),
+                proto_code, network, bool(use_tor))
+
+    async def get_client(self, server_info, network, use_tor=False, proto_code="s"):
+        """
+        Returns a connected ``StratumClient`` for the server, reusing the
+        open connection if it is still alive.
+        """
+        key = self.get_key(server_info, network, use_tor, proto_code)
+        lock = self.locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            entry = self.clients.get(key)
+            if entry is not None:
+                client, last_used = entry
+                if client.protocol is not None and (
+                        time.monotonic() - last_used < self.idle_check or
+                        await self.ping(client)):
+                    self.clients.move_to_end(key)
+                    self.clients[key] = (client, time.monotonic())
+                    client.last_error = None
+                    return client
+                logger.debug("Reconnecting to {}".format(key[0]))
+                self.discard(key)
+
+            client = StratumClient(loop=self.loop)
+            client.pool_key = key
+            client.pool_calls = 0
+            try:
+                await asyncio.wait_for(
+                    client.connect(server_info, proto_code, use_tor=use_tor,
+                                   disable_cert_verify=True),
+                    self.timeout)
+            except BaseException:
+                client.close()
+                raise
+            self.connects += 1
+            self.clients[key] = (client, time.monotonic())
+            while len(self.clients) > self.max_connections:
+                self.discard(next(iter(self.clients)))
+            return client
+
+    async def ping(self, client):
+        try:
+            await asyncio.wait_for(client.RPC('server.ping'), self.timeout)
+            return True
+        except (asyncio.TimeoutError, OSError, ElectrumErrorResponse):
+            return False
+
+    async def call(self, client, request):
+        client.pool_calls += 1
+        try:
+            result = await asyncio.wait_for(request, self.timeout)
+        except asyncio.TimeoutError:
+            self.retire(client)
+            raise
+        finally:
+            client.pool_calls -= 1
+            if client in self.retired and not client.pool_calls:
+                self.retired.discard(client)
+                client.close()
+        self.touch(client)
+        return result
+
+    async def rpc(self, client, method, *params):
+        """``client.RPC`` with a timeout, which retires the connection."""
+        return await self.call(client, client.RPC(method, *params))
+
+    async def batch_rpc(self, client, requests):
+        """
+        ``client.batch_rpc`` with a timeout. Failed requests have an
+        ``ElectrumErrorResponse`` in place of their result.
+        """
+        return await self.call(client, client.batch_rpc(requests))
+
+    def touch(self, client):
+        entry = self.clients.get(client.pool_key)
+        if entry is not None and entry[0] is client:
+            self.clients[client.pool_key] = (client, time.monotonic())
+
+    def retire(self, client):
+        """
+        Stops handing out ``client``, it's closed by the last call still
+        running on it.
+        """
+        entry = self.clients.get(client.pool_key)
+        if entry is not None and entry[0] is client:
+            del self.clients[client.pool_key]
+        self.retired.add(client)
+
+    def discard(self, key):
+        entry = self.clients.pop(key, None)
+        if entry is not None:
+            entry[0].close()
+
+    def close(self):
+        for key in list(self.clients):
+            self.discard(key)
+        for client in self.retired:
+            client.close()
+        self.retired.clear()
@@ -0,0 +1,395 @@
+"""
+Batched refresh of the outputs of many labels.
+
+``refresh_outputs`` does what ``electrum.checkup_label`` does for one
+label for all the outputs which need a refresh: the transactions are
+requested in ``blockchain.transaction.get`` batches, one request per txid,
+the unspents in ``blockchain.scripthash.listunspent`` batches, one request
+per address, and the outputs are written with one ``bulk_update``. The
+batch size is ``ELECTRUM_BATCH_SIZE``. Confirmed transactions are
+fetched once, see finances/tx_store.py.
+
+The outputs are refreshed in chunks of one batch, run concurrently on the
+loop of the task worker: at most ``ELECTRUM_REFRESH_CONCURRENCY`` chunks
+at a time and ``ELECTRUM_SERVER_CONCURRENCY`` per Electrum server. The
+progress of a labelbase refresh is kept in the shared cache, see
+``get_refresh_progress``.
+
+The status hash of ``blockchain.scripthash.subscribe`` of the address of
+each output is kept with the output (``OutputStat.watch_state``). The
+outputs of addresses whose status didn't change since the last refresh
+are skipped after one batch of ``subscribe`` requests, the others are
+refreshed in full. The worker's loop only runs during tasks, so the
+statuses are compared at refresh time and the notifications the server
+pushes are ignored.
+"""
+import asyncio
+import hashlib
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from connectrum import ElectrumErrorResponse
+
+from labelbase.models import Label
+
+from .electrum import get_server_info, is_valid_output_ref
+from .electrum_pool import get_pool
+from .models import OutputStat
+from .prices import HOUR
+from .tx_math import detect_script_type
+from .tx_store import ELECTRUM, load_transactions, store_transactions
+
+logger = logging.getLogger('labelbase')
+
+REFRESH_FIELDS = [
+    "spent", "value", "confirmed_at_block_height", "confirmed_at_block_time",
+    "spent_at_block_time", "network", "next_enc_input_attrs", "last_error",
+    "enc_watch_state",
+]
+
+REFRESH_PROGRESS_KEY = "finances:refresh:{}"
+
+
+def get_refresh_progress(labelbase_id):
+    """
+    Returns ``{"state", "total", "done", "errors", "updated"}`` of the last
+    refresh of the labelbase, ``None`` if there was none lately. ``state``
+    is "queued", "running" or "done". ``total`` counts the outputs to check,
+    ``done`` the ones checked and ``errors`` the ones which failed.
+    """
+    return cache.get(REFRESH_PROGRESS_KEY.format(labelbase_id))
+
+
+def set_refresh_progress(labelbase_id, state, total=0, done=0, errors=0):
+    # expires, so the refresh of a worker which died isn't shown forever
+    cache.set(REFRESH_PROGRESS_KEY.format(labelbase_id), {
+        "state": state, "total": total, "done": done, "errors": errors,
+        "updated": int(time.time()),
+    }, HOUR)
+
+
+def get_script_hash(script_pubkey):
+    """Electrum script hash of a scriptPubKey in hex."""
+    return hashlib.sha256(bytes.fromhex(script_pubkey)).digest()[::-1].hex()
+
+
+def needs_refresh(output):
+    return (output.spent is not True or output.confirmed_at_block_time is None
+            or needs_spend_time(output))
+
+
+def needs_spend_time(output):
+    # spent before the spend times were kept, or by an unconfirmed transaction
+    return bool(output.spent) and not output.spent_at_block_time
+
+
+class OutputRefresh:
+    """An output to refresh, with what was learned about it on the way."""
+
+    def __init__(self, output, txid, index):
+        self.output = output
+        self.txid = txid
+        self.index = index
+        watch_state = output.watch_state()
+        self.script_hash = watch_state.get("script_hash")
+        self.status = watch_state.get("status")
+        self.address = None
+        self.blocktime = 0
+
+
+async def batched(pool, server, method, params_list, batch_size):
+    """
+    Returns ``{params: result}`` of ``method`` called with each of
+    ``params_list`` on ``server``, ``(server_info, network)``, sent in
+    batches. Failed calls map to their ``ElectrumErrorResponse``.
+    """
+    server_info, network = server
+    results = {}
+    for i in range(0, len(params_list), batch_size):
+        chunk = params_list[i:i + batch_size]
+        # Shared by the chunks of the server. A connection on which a
+        # batch timed out is retired, the next batch gets a new one.
+        conn = await pool.get_client(server_info, network, use_tor=server_info.is_onion)
+        responses = await pool.batch_rpc(conn, [(method, *params) for params in chunk])
+        results.update(zip(chunk, responses))
+    return results
+
+
+class Transactions:
+    """
+    The transactions of a refresh: the stored ones, loaded before the
+    refresh, and the ones fetched by its chunks, stored after it, see
+    finances/tx_store.py.
+    """
+
+    def __init__(self, stored):
+        self.txns = dict(stored)
+        self.fetched = {}
+
+    def get(self, txid):
+        return self.txns.get(txid)
+
+    async def fetch(self, pool, server, txids, batch_size):
+        missing = sorted(set(txids) - set(self.txns))
+        results = await batched(pool, server, "blockchain.transaction.get",
+                                [(txid, True) for txid in missing], batch_size)
+        for (txid, _), txn in results.items():
+            self.txns[txid] = txn
+            if txn and not isinstance(txn, ElectrumErrorResponse):
+                self.fetched[txid] = txn
+
+
+async def get_statuses(pool, server, script_hashes, batch_size):
+    return await batched(pool, server, "blockchain.scripthash.subscribe",
+                         [(script_hash,) for script_hash in sorted(script_hashes)],
+                         batch_size)
+
+
+async def refresh_chunk(pool, server_info, network, refreshes, txns, batch_size):
+    """
+    Refreshes the outputs of ``refreshes``, all on the Electrum server of
+    ``server_info``, with the ``Transactions`` of the refresh ``txns``.
+    The outputs are updated in place, not saved. Returns
+    the refreshes of the outputs which were refreshed, the others are
+    unchanged.
+    """
+    server = (server_info, network)
+
+    watched = [refresh for refresh in refreshes if refresh.script_hash]
+    statuses = await get_statuses(
+        pool, server, {refresh.script_hash for refresh in watched}, batch_size) if watched else {}
+    refreshes = [
+        refresh for refresh in refreshes
+        if not refresh.script_hash or statuses.get((refresh.script_hash,)) != refresh.status
+        or needs_spend_time(refresh.output)
+    ]
+    if not refreshes:
+        return refreshes
+
+    await txns.fetch(pool, server, {refresh.txid for refresh in refreshes}, batch_size)
+
+    found = []
+    for refresh in refreshes:
+        output = refresh.output
+        txn = txns.get(refresh.txid)
+        if isinstance(txn, ElectrumErrorResponse):
+            output.last_error = {"error": str(txn)}
+            continue
+        if not txn:
+            output.last_error = {"error": "Unknown issue"}
+            continue
+        try:
+            vout = txn['vout'][refresh.index]
+        except (KeyError, IndexError):
+            output.last_error = {"error": "No output {} in {}".format(refresh.index, refresh.txid)}
+            continue
+        script_pubkey = vout.get('scriptPubKey', {})
+        refresh.address = script_pubkey.get('address')
+        refresh.blocktime = int(txn.get('blocktime', 0) or 0)
+        if refresh.blocktime:
+            output.confirmed_at_block_time = refresh.blocktime
+        if not output.value and vout.get('value') is not None:
+            output.value = round(vout['value'] * 100000000)
+
+        # The script type decides the size of the input spending
+        # this output, see finances.fee_health.
+        input_script = detect_script_type(script_pubkey.get('hex'), refresh.address,
+                                          script_pubkey.get('type'))
+        if input_script:
+            attrs = output.next_input_attributes()
+            attrs['input_script'] = input_script
+            output.set_next_input_attributes(attrs)
+
+        if script_pubkey.get('hex'):
+            refresh.script_hash = get_script_hash(script_pubkey['hex'])
+            found.append(refresh)
+
+    # The statuses are taken before the unspents are listed, so a change
+    # in between is seen by the next refresh.
+    unknown = {refresh.script_hash for refresh in found} - {key[0] for key in statuses}
+    if unknown:
+        statuses.update(await get_statuses(pool, server, unknown, batch_size))
+    for refresh in found:
+        status = statuses.get((refresh.script_hash,))
+        if not isinstance(status, ElectrumErrorResponse):
+            refresh.output.set_watch_state(refresh.script_hash, status)
+
+    script_hashes = sorted({refresh.script_hash for refresh in found})
+    unspents = await batched(pool, server, "blockchain.scripthash.listunspent",
+                             [(script_hash,) for script_hash in script_hashes], batch_size)
+
+    newly_spent = []
+    for refresh in found:
+        output = refresh.output
+        utxos = unspents.get((refresh.script_hash,))
+        if isinstance(utxos, ElectrumErrorResponse):
+            output.last_error = {"error": str(utxos)}
+            continue
+        for unspent in utxos or []:
+            if unspent.get('tx_hash') == refresh.txid and unspent.get('tx_pos') == refresh.index:
+                output.spent = False
+                output.network = network
+                if unspent.get('height'):
+                    output.confirmed_at_block_height = unspent['height']
+                if unspent.get('value') is not None:
+                    output.value = unspent['value']
+                break
+        else:
+            output.spent = True
+            if not output.spent_at_block_time:
+                newly_spent.append(refresh)
+
+    if newly_spent:
+        await find_spend_times(pool, server, newly_spent, txns, batch_size)
+    return refreshes
+
+
+async def find_spend_times(pool, server, refreshes, txns, batch_size):
+    """
+    Sets the spend time of the outputs of ``refreshes`` from the history
+    of their addresses, see finances.timeline.
+    """
+    script_hashes = sorted({refresh.script_hash for refresh in refreshes})
+    histories = await batched(pool, server, "blockchain.scripthash.get_history",
+                              [(script_hash,) for script_hash in script_hashes], batch_size)
+    candidates = set()
+    for refresh in refreshes:
+        history = histories.get((refresh.script_hash,))
+        if isinstance(history, ElectrumErrorResponse):
+            continue
+        for entry in history or []:
+            if entry.get('tx_hash') != refresh.txid and entry.get('height', 0) > 0:
+                candidates.add(entry['tx_hash'])
+
+    await txns.fetch(pool, server, candidates, batch_size)
+
+    spends = {}
+    for txid in candidates:
+        txn = txns.get(txid)
+        if not txn or isinstance(txn, ElectrumErrorResponse):
+            continue
+        for vin in txn.get('vin', []):
+            spends[(vin.get('txid'), vin.get('vout'))] = int(txn.get('blocktime', 0) or 0)
+    for refresh in refreshes:
+        refresh.output.spent_at_block_time = spends.get((refresh.txid, refresh.index), 0)
+
+
+def collect_refreshes(labels):
+    """
+    Groups the outputs of ``labels`` (loaded with ``select_related(
+    "output_stat", "labelbase__user__profile")``) which need a refresh by
+    Electrum server. Returns ``{server key: (server_info, network,
+    [OutputRefresh])}``.
+    """
+    groups = {}
+    seen = set()
+    for label in labels:
+        if label.type != "output" or not is_valid_output_ref(label.ref):
+            continue
+        output = label.output_stat
+        if output is None:
+            output = OutputStat(
+                user=label.labelbase.user,
+                type_ref_hash=label.type_ref_hash,
+                network=label.labelbase.network,
+                value=0,
+                spent=None,
+                confirmed_at_block_height=0,
+                confirmed_at_block_time=0
+            )
+            # links the label, see labelbase.receivers.link_output_stat_labels
+            output.save()
+        if output.id in seen or not needs_refresh(output):
+            continue
+        seen.add(output.id)
+
+        txid, index = label.ref.split(":", 1)
+        try:
+            index = int(index)
+        except ValueError:
+            continue
+        server_info = get_server_info(label.labelbase)
+        network = label.labelbase.network
+        key = (server_info['hostname'], tuple(server_info['ports']), network)
+        groups.setdefault(key, (server_info, network, []))[2].append(
+            OutputRefresh(output, txid, index))
+    return groups
+
+
+def save_refreshes(refreshes):
+    from .valuation import get_historical_prices
+
+    if not refreshes:
+        return
+    OutputStat.objects.bulk_update([refresh.output for refresh in refreshes],
+                                   REFRESH_FIELDS, batch_size=500)
+    # prices of the new confirmation times, fetched once per bucket
+    get_historical_prices({refresh.blocktime for refresh in refreshes if refresh.blocktime})
+
+
+async def limited(server_limit, limit, coroutine):
+    async with server_limit, limit:
+        return await coroutine
+
+
+def refresh_outputs(labels, loop, batch_size=None, labelbase_id=None):
+    """
+    Refreshes the outputs of the output labels of ``labels`` which aren't
+    known to be spent, on the loop of the task worker. The progress is
+    reported for ``labelbase_id`` if given. Returns the number of outputs
+    refreshed, outputs of unchanged addresses don't count.
+    """
+    batch_size = batch_size or settings.ELECTRUM_BATCH_SIZE
+    pool = get_pool(loop)
+    limit = asyncio.Semaphore(settings.ELECTRUM_REFRESH_CONCURRENCY)
+    groups = collect_refreshes(labels)
+    txns = Transactions(load_transactions(
+        {refresh.txid for _, _, refreshes in groups.values() for refresh in refreshes}, ELECTRUM))
+    chunks = {}
+    for server_info, network, refreshes in groups.values():
+        server_limit = asyncio.Semaphore(settings.ELECTRUM_SERVER_CONCURRENCY)
+        # outputs of a transaction share a chunk, it's fetched once
+        refreshes.sort(key=lambda refresh: refresh.txid)
+        for i in range(0, len(refreshes), batch_size):
+            chunk = refreshes[i:i + batch_size]
+            task = loop.create_task(limited(server_limit, limit, refresh_chunk(
+                pool, server_info, network, chunk, txns, batch_size)))
+            chunks[task] = (server_info, chunk)
+
+    total = sum(len(chunk) for _, chunk in chunks.values())
+    refreshed = []
+    checked = errors = 0  # outputs
+    pending = set(chunks)
+    while pending:
+        # The loop only runs in run_until_complete, the progress is
+        # written in between as the ORM can't be used on a running loop.
+        if labelbase_id:
+            set_refresh_progress(labelbase_id, "running", total, checked, errors)
+        done, pending = loop.run_until_complete(
+            asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED))
+        for task in done:
+            server_info, chunk = chunks[task]
+            # cancelled if the pool was closed under it
+            exception = None if task.cancelled() else task.exception()
+            if task.cancelled() or exception is not None:
+                logger.error(f"Error refreshing outputs on {server_info['hostname']}: "
+                             f"{exception or 'cancelled'}")
+                errors += len(chunk)
+                continue
+            checked += len(chunk)
+            refreshed.extend(task.result())
+
+    save_refreshes(refreshed)
+    store_transactions(txns.fetched, ELECTRUM)
+    if labelbase_id:
+        set_refresh_progress(labelbase_id, "done", total, checked, errors)
+    return len(refreshed)
+
+
+def refresh_labelbase(labelbase_id, loop, batch_size=None):
+    labels = Label.objects.filter(labelbase_id=labelbase_id, type="output").select_related(
+        "output_stat", "labelbase__user__profile")
+    return refresh_outputs(labels, loop, batch_size, labelbase_id=labelbase_id)
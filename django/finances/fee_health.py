@@ -0,0 +1,116 @@
+"""
+Fee health of spendable outputs, computed for many labels at once.
+
+The fee to spend an output is estimated for a 1-input, 2-output transaction
+at the owner's ``my_fee`` rate. The size of the input depends on the script
+type of the output, which ``electrum.checkup_label`` stores in the input
+attributes of the ``OutputStat``; outputs of unknown type are estimated as
+P2WPKH. The fee is computed once per script type, not once per output.
+"""
+from .tx_math import DEFAULT_MULTISIG, calculate_fee, calculate_transaction_size
+
+
+DEFAULT_INPUT_SCRIPT = "P2WPKH"
+SPEND_OUTPUT_COUNTS = {"p2wpkh": 2}
+
+
+def no_fee_health(value_sats=None):
+    return {
+        'status': None,
+        'fee_sats': None,
+        'value_sats': value_sats,
+        'fee_percentage': None,
+        'threshold_healthy': None,
+        'threshold_warning': None,
+        'threshold_high': None
+    }
+
+
+def get_spend_input(label):
+    """
+    Returns the input (as used by ``calculate_transaction_size``) which
+    spends the output of ``label``.
+    """
+    attrs = {}
+    if label.output_stat is not None:
+        attrs = label.output_stat.next_input_attributes()
+    input_script = attrs.get('input_script') or DEFAULT_INPUT_SCRIPT
+    m, n = DEFAULT_MULTISIG
+    return {
+        'input_script': input_script,
+        'input_m': attrs.get('input_m', m),
+        'input_n': attrs.get('input_n', n),
+    }
+
+
+def fee_health_statuses(labels, profile=None):
+    """
+    Returns ``{label_id: fee health}`` (see ``Label.get_fee_health_status``)
+    for ``labels`` of one user and memoizes it on each label. ``profile``
+    defaults to the profile of the owner of the first label.
+    """
+    labels = list(labels)
+    if not labels:
+        return {}
+    if profile is None:
+        profile = labels[0].labelbase.user.profile
+    fee_rate = profile.my_fee  # sats per vbyte
+    threshold_healthy = profile.my_fee_threshold_healthy
+    threshold_warning = profile.my_fee_threshold_warning
+
+    fees = {}
+    statuses = {}
+    for label in labels:
+        if label.type != label.TYPE_OUTPUT or not label.spendable:
+            health = no_fee_health()
+        else:
+            try:
+                value_sats = int(label.value) if label.value else None
+            except (ValueError, TypeError):
+                value_sats = None
+
+            if not value_sats or value_sats <= 0:
+                health = no_fee_health(value_sats)
+            else:
+                spend_input = get_spend_input(label)
+                key = tuple(spend_input.values())
+                if key not in fees:
+                    tx_size = calculate_transaction_size([spend_input], SPEND_OUTPUT_COUNTS)
+                    fees[key] = calculate_fee(tx_size['txVBytes'], fee_rate)
+                fee_sats = fees[key]
+
+                # Calculate fee as percentage of output value
+                fee_percentage = (fee_sats / value_sats) * 100
+                if fee_percentage < threshold_healthy:
+                    status = 'green'
+                elif fee_percentage < threshold_warning:
+                    status = 'yellow'
+                else:
+                    status = 'red'
+                health = {
+                    'status': status,
+                    'fee_sats': fee_sats,
+                    'value_sats': value_sats,
+                    'fee_percentage': round(fee_percentage, 3),
+                    'threshold_healthy': threshold_healthy,
+                    'threshold_warning': threshold_warning,
+                    'threshold_high': threshold_warning
+                }
+        label._fee_health = health
+        statuses[label.id] = health
+    return statuses
+
+
+def labelbase_fee_health(labelbase):
+    """
+    Returns ``{label_id: fee health}`` for the spendable outputs of
+    ``labelbase``.
+    """
+    from labelbase.models import Label
+
+    # spendable is encrypted, it can't be filtered in the database
+    labels = Label.objects.filter(
+        labelbase=labelbase, type=Label.TYPE_OUTPUT,
+    ).select_related("output_stat")
+    return fee_health_statuses([label for label in labels if label.spendable],
+                               labelbase.user.profile)
@@ -0,0 +1,44 @@
+import random
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from finances.models import HistoricalPrice
+
+
+class Command(BaseCommand):
+    help = "Measure the cost of loading prices and looking them up, in memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000)
+        parser.add_argument('--lookups', type=int, default=200000)
+
+    def handle(self, *args, **options):
+        rows = [
+            HistoricalPrice(timestamp=i * 3600, **HistoricalPrice.fields_from_api(
+                {currency: Decimal(random.randint(100, 10 ** 7)) / 100
+                 for currency in settings.CURRENCIES}))
+            for i in range(options['rows'])
+        ]
+        # what loading a row from the database costs, without the query
+        fields = HistoricalPrice._meta.concrete_fields
+        attnames = [f.attname for f in fields]
+        values = [[f.get_prep_value(getattr(row, f.attname)) for f in fields] for row in rows]
+        started = time.perf_counter()
+        loaded = [HistoricalPrice.from_db('default', attnames, v) for v in values]
+        load_time = time.perf_counter() - started
+
+        currencies = list(settings.CURRENCIES)
+        picks = [(random.choice(loaded), random.choice(currencies))
+                 for _ in range(options['lookups'])]
+        started = time.perf_counter()
+        for row, currency in picks:
+            row.get_currency_price(currency)
+        lookup_time = time.perf_counter() - started
+
+        self.stdout.write("{} rows loaded in {:.1f}ms ({:.2f}us per row)".format(
+            len(loaded), load_time * 1000, load_time / len(loaded) * 1e6))
+        self.stdout.write("{} lookups in {:.1f}ms ({:.2f}us per lookup)".format(
+            len(picks), lookup_time * 1000, lookup_time / len(picks) * 1e6))
@@ -0,0 +1,97 @@
+import csv
+import json
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from finances.models import HistoricalPrice
+from finances.prices import price_series
+
+
+class Command(BaseCommand):
+    help = ("Bulk load historical BTC prices, from a CSV or JSON file or with "
+            "one request for the full history of a mempool instance. "
+            "Existing timestamps are kept.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default=None,
+            help='CSV with a timestamp (or time) column and one column per '
+                 'currency, or JSON as returned by /api/v1/historical-price',
+        )
+        parser.add_argument(
+            '--mempool', nargs='?', const='https://mempool.space', default=None,
+            dest='mempool_endpoint', metavar='ENDPOINT',
+            help='Download the history from this mempool instance instead',
+        )
+        parser.add_argument('--since', type=int, default=None,
+                            help='Skip prices before this unix timestamp')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if bool(options['path']) == bool(options['mempool_endpoint']):
+            raise CommandError("Pass either a file or --mempool.")
+
+        if options['mempool_endpoint']:
+            entries = self.read_mempool(options['mempool_endpoint'])
+        elif options['path'].lower().endswith('.csv'):
+            entries = self.read_csv(options['path'])
+        else:
+            entries = self.read_json(options['path'])
+
+        rows = []
+        skipped = 0
+        for entry in entries:
+            try:
+                timestamp = int(entry.get('timestamp', entry.get('time')))
+                if options['since'] and timestamp < options['since']:
+                    continue
+                # The exchangeRates of the API are today's rates, the rates
+                # of past rows are derived from their prices unless a row
+                # has USDEUR, ... columns.
+                fields = HistoricalPrice.fields_from_api(entry, entry)
+            except (KeyError, TypeError, ArithmeticError, ValueError):
+                skipped += 1
+                continue
+            # prices of 0 are reported for currencies without early history
+            if not all(fields[name] for name in HistoricalPrice.PRICE_FIELDS.values()):
+                skipped += 1
+                continue
+            rows.append(HistoricalPrice(timestamp=timestamp, **fields))
+
+        before = HistoricalPrice.objects.count()
+        HistoricalPrice.objects.bulk_create(
+            rows, batch_size=options['batch_size'], ignore_conflicts=True)
+        created = HistoricalPrice.objects.count() - before
+        price_series.clear()
+
+        self.stdout.write(self.style.SUCCESS(
+            "Imported {} of {} prices ({} already stored, {} incomplete).".format(
+                created, len(rows) + skipped, len(rows) - created, skipped)))
+
+    def read_mempool(self, endpoint):
+        # Without a timestamp the API returns the full history in one response.
+        try:
+            response = requests.get(f"{endpoint}/api/v1/historical-price", timeout=120)
+            response.raise_for_status()
+            return response.json()['prices']
+        except (requests.RequestException, ValueError, KeyError) as ex:
+            raise CommandError("Could not download prices from {}: {}".format(endpoint, ex))
+
+    def read_json(self, path):
+        with open(path) as f:
+            data = json.load(f)
+        return data if isinstance(data, list) else data['prices']
+
+    def read_csv(self, path):
+        with open(path, newline='') as f:
+            entries = []
+            for row in csv.DictReader(f):
+                entry = {}
+                for key, value in row.items():
+                    if value in (None, ''):
+                        continue
+                    key = key.strip()
+                    entry[key if key in ('timestamp', 'time') else key.upper()] = value.strip()
+                entries.append(entry)
+            return entries
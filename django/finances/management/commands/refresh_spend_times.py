@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from labelbase.models import Label
+from finances.tasks import queue_refresh
+
+
+class Command(BaseCommand):
+    help = ("Queue a refresh of the labelbases with spent outputs without a "
+            "spend time, e.g. outputs spent before the spend times were kept. "
+            "The refreshes run in process_tasks.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--labelbase', type=int, default=None, dest='labelbase_id',
+            help='Only refresh this labelbase',
+        )
+
+    def handle(self, *args, **options):
+        labels = Label.objects.filter(type="output", output_stat__spent=True,
+                                      output_stat__spent_at_block_time=0)
+        if options['labelbase_id']:
+            labels = labels.filter(labelbase_id=options['labelbase_id'])
+
+        labelbase_ids = sorted(set(labels.values_list("labelbase_id", flat=True)))
+        for labelbase_id in labelbase_ids:
+            queue_refresh(labelbase_id)
+        self.stdout.write(self.style.SUCCESS(
+            "Queued the refresh of {} labelbases.".format(len(labelbase_ids))))
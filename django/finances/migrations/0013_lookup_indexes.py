@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finances', '0012_auto_20240701_0932'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='outputstat',
+            index=models.Index(fields=['type_ref_hash', 'network'], name='finances_ou_type_re_54a888_idx'),
+        ),
+    ]
@@ -0,0 +1,171 @@
+# Generated by Django 3.2.25 on 2026-10-18 21:00
+
+import djmoney.models.fields
+from django.db import migrations, models
+
+
+CURRENCIES = ['usd', 'eur', 'gbp', 'cad', 'chf', 'aud', 'jpy']
+
+
+# Plain SQL, MoneyFields of historical models don't support expressions.
+def update_prices(apps, schema_editor, assignment):
+    HistoricalPrice = apps.get_model('finances', 'HistoricalPrice')
+    quote = schema_editor.quote_name
+    schema_editor.execute("UPDATE {} SET {}".format(
+        quote(HistoricalPrice._meta.db_table),
+        ", ".join(assignment.format(minor=quote(f'{currency}_minor'),
+                                    price=quote(f'{currency}_price'))
+                  for currency in CURRENCIES)))
+
+
+def prices_to_minor_units(apps, schema_editor):
+    update_prices(apps, schema_editor, "{minor} = ROUND({price} * 100)")
+
+
+def prices_from_minor_units(apps, schema_editor):
+    update_prices(apps, schema_editor, "{price} = {minor} / 100.0")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finances', '0013_lookup_indexes'),
+    ]
+
+    operations = [
+        # nullable first, so that the migration can be reversed
+        migrations.AlterField(
+            model_name='historicalprice',
+            name='usd_price',
+            field=djmoney.models.fields.MoneyField(decimal_places=2, default_currency='USD', max_digits=14, null=True),
+        ),
+        migrations.AlterField(
+            model_name='historicalprice',
+            name='eur_price',
+            field=djmoney.models.fields.MoneyField(decimal_places=2, default_currency='EUR', max_digits=14, null=True),
+        ),
+        migrations.AlterField(
+            model_name='historicalprice',
+            name='gbp_price',
+            field=djmoney.models.fields.MoneyField(decimal_places=2, default_currency='GBP', max_digits=14, null=True),
+        ),
+        migrations.AlterField(
+            model_name='historicalprice',
+            name='cad_price',
+            field=djmoney.models.fields.MoneyField(decimal_places=2, default_currency='CAD', max_digits=14, null=True),
+        ),
+        migrations.AlterField(
+            model_name='historicalprice',
+            name='chf_price',
+            field=djmoney.models.fields.MoneyField(decimal_places=2, default_currency='CHF', max_digits=14, null=True),
+        ),
+        migrations.AlterField(
+            model_name='historicalprice',
+            name='aud_price',
+            field=djmoney.models.fields.MoneyField(decimal_places=2, default_currency='AUD', max_digits=14, null=True),
+        ),
+        migrations.AlterField(
+            model_name='historicalprice',
+            name='jpy_price',
+            field=djmoney.models.fields.MoneyField(decimal_places=2, default_currency='JPY', max_digits=14, null=True),
+        ),
+        migrations.AddField(
+            model_name='historicalprice',
+            name='usd_minor',
+            field=models.BigIntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='historicalprice',
+            name='eur_minor',
+            field=models.BigIntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='historicalprice',
+            name='gbp_minor',
+            field=models.BigIntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='historicalprice',
+            name='cad_minor',
+            field=models.BigIntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='historicalprice',
+            name='chf_minor',
+            field=models.BigIntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='historicalprice',
+            name='aud_minor',
+            field=models.BigIntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='historicalprice',
+            name='jpy_minor',
+            field=models.BigIntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.RunPython(prices_to_minor_units, prices_from_minor_units),
+        migrations.RemoveField(
+            model_name='historicalprice',
+            name='usd_price',
+        ),
+        migrations.RemoveField(
+            model_name='historicalprice',
+            name='usd_price_currency',
+        ),
+        migrations.RemoveField(
+            model_name='historicalprice',
+            name='eur_price',
+        ),
+        migrations.RemoveField(
+            model_name='historicalprice',
+            name='eur_price_currency',
+        ),
+        migrations.RemoveField(
+            model_name='historicalprice',
+            name='gbp_price',
+        ),
+        migrations.RemoveField(
+            model_name='historicalprice',
+            name='gbp_price_currency',
+        ),
+        migrations.RemoveField(
+            model_name='historicalprice',
+            name='cad_price',
+        ),
+        migrations.RemoveField(
+            model_name='historicalprice',
+            name='cad_price_currency',
+        ),
+        migrations.RemoveField(
+            model_name='historicalprice',
+            name='chf_price',
+        ),
+        migrations.RemoveField(
+            model_name='historicalprice',
+            name='chf_price_currency',
+        ),
+        migrations.RemoveField(
+            model_name='historicalprice',
+            name='aud_price',
+        ),
+        migrations.RemoveField(
+            model_name='historicalprice',
+            name='aud_price_currency',
+        ),
+        migrations.RemoveField(
+            model_name='historicalprice',
+            name='jpy_price',
+        ),
+        migrations.RemoveField(
+            model_name='historicalprice',
+            name='jpy_price_currency',
+        ),
+    ]
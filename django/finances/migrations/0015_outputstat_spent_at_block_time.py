@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finances', '0014_integer_prices'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outputstat',
+            name='spent_at_block_time',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finances', '0015_outputstat_spent_at_block_time'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outputstat',
+            name='enc_watch_state',
+            field=models.TextField(default=None, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finances', '0016_outputstat_enc_watch_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RawTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('enc_data', models.TextField()),
+                ('size', models.IntegerField()),
+                ('last_used', models.IntegerField(db_index=True)),
+            ],
+        ),
+    ]
@@ -1,11 +1,11 @@
 import requests
 from django.db import models
 from django.contrib import messages
-from djmoney.models.fields import MoneyField
 from decimal import Decimal
 import datetime
 from pymempool import MempoolAPI
 from labelbase.receivers import compute_type_ref_hash
+from .prices import get_bucket, price_series
 from django.conf import settings
 from jsonfield import JSONField
 import json
@@ -41,6 +41,7 @@ class OutputStat(models.Model):
     value = models.IntegerField()  # tx output, in sats
     confirmed_at_block_height = models.IntegerField(default=0)
     confirmed_at_block_time = models.IntegerField(default=0)
+    spent_at_block_time = models.IntegerField(default=0)  # 0 if unspent or unknown
 
     last_error = JSONField(default={})
     next_enc_input_attrs = models.TextField(default=None, null=True)  # will be used for fee estimation
@@ -57,6 +58,20 @@ class OutputStat(models.Model):
             return json.loads(decrypted_data.decode('utf-8'))
         return json.loads("{}")
 
+    # Script hash and status of the address of the output, encrypted as the
+    # script hash gives the address away, see finances/electrum_sync.py
+    enc_watch_state = models.TextField(default=None, null=True)
+
+    def set_watch_state(self, script_hash, status):
+        json_data = json.dumps({"script_hash": script_hash, "status": status}).encode('utf-8')
+        self.enc_watch_state = cipher_suite.encrypt(json_data).decode('utf-8')
+
+    def watch_state(self):
+        if self.enc_watch_state:
+            decrypted_data = cipher_suite.decrypt(self.enc_watch_state.encode('utf-8'))
+            return json.loads(decrypted_data.decode('utf-8'))
+        return {}
+
     MAINNET = 'mainnet'
     TESTNET = 'testnet'
 
@@ -73,7 +88,12 @@ class OutputStat(models.Model):
     )
 
     class Meta:
+        # The unique index also serves lookups by user, type_ref_hash and
+        # network, get_or_create_from_api looks up without a user.
         unique_together = (("user", "type_ref_hash"),)
+        indexes = [
+            models.Index(fields=["type_ref_hash", "network"]),
+        ]
 
     @property
     def get_spent_status(self):
@@ -95,63 +115,10 @@ class OutputStat(models.Model):
         Returns:
             dict: Output metrics dictionary.
         """
-        old_output_value = tracked_fiat_value
-        is_tracked = False
-        if not fiat_currency:
-            fiat_currency = "USD"
-        # Check if the block time is confirmed
-        if self.confirmed_at_block_time:
-            # Get or create HistoricalPrice instance for the confirmed block time
-            obj, created = HistoricalPrice.get_or_create_from_api(self.user,
-                                        timestamp=self.confirmed_at_block_time
-            )
-            if obj is None:
-                logger.error("No price info found for {}".format(self.confirmed_at_block_time))
-                return {}
-            print ("obj, created  = {} {}, self.confirmed_at_block_time {}".format(
-                obj, created, self.confirmed_at_block_time))
-
-            # Use tracked fiat value if available, otherwise estimate using past price
-            if Decimal(tracked_fiat_value) > Decimal(0):
-                old_output_value = tracked_fiat_value
-                is_tracked = True
-            else:
-                # Get historical price at the confirmed block time
-                old_output_value = (Decimal(self.value)/Decimal("100000000.0"))*obj.get_currency_price(fiat_currency)
-            print ("\old_output_value: {} @ timestamp {}".format(old_output_value, self.confirmed_at_block_time))
-        else:
-            print ("no self.confirmed_at_block_time")
-
-        current_datetime = datetime.datetime.now()
-        timestamp = int(current_datetime.timestamp())
+        from .valuation import value_outputs
 
-        # Get or create HistoricalPrice instance for the current time in UTC
-        obj_now, created = HistoricalPrice.get_or_create_from_api(self.user,
-                                                        timestamp=timestamp
-        )
-
-        # Calculate the current price
-        current_price = (Decimal(self.value)/Decimal("100000000.0"))*obj_now.get_currency_price(fiat_currency)
-
-        # Calculate performance
-        performance = 0
-        if current_price:
-            performance = ((current_price - old_output_value) / old_output_value) * 100
-
-        return {
-            "value": self.value,
-            "type_ref_hash": self.type_ref_hash,
-            "spent": self.spent,
-            "confirmed_at_block_height": self.confirmed_at_block_height,
-            "confirmed_at_block_time": self.confirmed_at_block_time,
-            "network": self.network,
-            "fiat_value_old": old_output_value,
-            "fiat_value": current_price,
-            "fiat_cur": fiat_currency,
-            "performance": performance,
-            "current_price": current_price,
-            "is_tracked": is_tracked,
-        }
+        results, _ = value_outputs([(self, tracked_fiat_value, fiat_currency)], self.user)
+        return results[0]
 
     def output_metrics_dict_OLD(self, tracked_fiat_value=0, fiat_currency="USD"):
         """
@@ -209,8 +176,10 @@ class OutputStat(models.Model):
             return cached_data, False
 
         def get_value_and_spent(txid, vout):
+            from .tx_store import get_mempool_transaction
+
             mempool_api = MempoolAPI()
-            res0 = mempool_api.get_transaction(txid)
+            res0 = get_mempool_transaction(mempool_api, txid)
             vouts = res0.get("vout", [])
             if vouts:
                 value = vouts[int(vout)].get("value", 0)
@@ -218,13 +187,14 @@ class OutputStat(models.Model):
                 return (value,
                         res1.get('spent', False) in [True, "true"],
                         res0.get('status', {}).get('block_height', 0),
-                        res0.get('status', {}).get('block_time', 0))
+                        res0.get('status', {}).get('block_time', 0),
+                        (res1.get('status') or {}).get('block_time', 0))
 
         if txid and vout:
             res = get_value_and_spent(txid, vout)
 
             if res:
-                value, spent, confirmed_at_block_height, confirmed_at_block_time = res
+                value, spent, confirmed_at_block_height, confirmed_at_block_time, spent_at_block_time = res
                 obj, created = cls.objects.get_or_create(user=user,
                         type_ref_hash=type_ref_hash, network=network,
                                 defaults={
@@ -232,19 +202,40 @@ class OutputStat(models.Model):
                                 'value': value,
                                 'confirmed_at_block_height': confirmed_at_block_height,
                                 'confirmed_at_block_time': confirmed_at_block_time,
+                                'spent_at_block_time': spent_at_block_time,
                             })
         return obj, created
 
 
+class RawTransaction(models.Model):
+    """
+    A confirmed transaction as returned by the Electrum server or the
+    mempool API, see finances/tx_store.py. The key is an HMAC of the txid
+    and the data is encrypted, so the store doesn't tell which
+    transactions the users have.
+    """
+    key = models.CharField(max_length=64, unique=True)
+    enc_data = models.TextField()
+    size = models.IntegerField()  # of enc_data, for the eviction
+    last_used = models.IntegerField(db_index=True)
+
+
 class HistoricalPrice(models.Model):
+    """
+    BTC prices are stored as integers in hundredths of the currency unit
+    (JPY included), so reading a price needs no Money or Decimal parsing.
+    """
+    PRICE_SCALE = 100
+    PRICE_FIELDS = {currency: f"{currency.lower()}_minor" for currency in settings.CURRENCIES}
+
     timestamp = models.IntegerField(unique=True)
-    usd_price = MoneyField(max_digits=14, decimal_places=2, default_currency='USD')
-    eur_price = MoneyField(max_digits=14, decimal_places=2, default_currency='EUR')
-    gbp_price = MoneyField(max_digits=14, decimal_places=2, default_currency='GBP')
-    cad_price = MoneyField(max_digits=14, decimal_places=2, default_currency='CAD')
-    chf_price = MoneyField(max_digits=14, decimal_places=2, default_currency='CHF')
-    aud_price = MoneyField(max_digits=14, decimal_places=2, default_currency='AUD')
-    jpy_price = MoneyField(max_digits=14, decimal_places=2, default_currency='JPY')
+    usd_minor = models.BigIntegerField()
+    eur_minor = models.BigIntegerField()
+    gbp_minor = models.BigIntegerField()
+    cad_minor = models.BigIntegerField()
+    chf_minor = models.BigIntegerField()
+    aud_minor = models.BigIntegerField()
+    jpy_minor = models.BigIntegerField()
     usd_to_eur = models.DecimalField(max_digits=10, decimal_places=4)
     usd_to_gbp = models.DecimalField(max_digits=10, decimal_places=4)
     usd_to_cad = models.DecimalField(max_digits=10, decimal_places=4)
@@ -252,6 +243,14 @@ class HistoricalPrice(models.Model):
     usd_to_aud = models.DecimalField(max_digits=10, decimal_places=4)
     usd_to_jpy = models.DecimalField(max_digits=10, decimal_places=4)
 
+    def get_currency_minor(self, currency):
+        """
+        Returns the price in ``currency`` as an integer in hundredths.
+        """
+        if currency not in self.PRICE_FIELDS:
+            raise ValueError(f"Invalid currency code: {currency}")
+        return getattr(self, self.PRICE_FIELDS[currency])
+
     def get_currency_price(self, currency):
         """
         Get the price for the specified currency.
@@ -262,27 +261,58 @@ class HistoricalPrice(models.Model):
         Returns:
             decimal.Decimal: The price for the specified currency.
         """
-        if currency not in settings.CURRENCIES:
-            raise ValueError(f"Invalid currency code: {currency}")
-
-        currency_lower = currency.lower()
-        price_field = getattr(self, f"{currency_lower}_price")
-        return price_field.amount
+        return Decimal(self.get_currency_minor(currency)).scaleb(-2)
 
     def __str__(self):
-        return f"{self.usd_price} @ {self.timestamp}"
+        return f"{self.get_currency_price('USD')} USD @ {self.timestamp}"
 
     class Meta:
         ordering = ['-timestamp']
 
+    @classmethod
+    def fields_from_api(cls, prices, exchange_rates=None):
+        """
+        Returns the field values for an entry of the ``prices`` returned by
+        mempool's historical-price API. Exchange rates missing from
+        ``exchange_rates`` are derived from the prices.
+        """
+        fields = {}
+        for currency in settings.CURRENCIES:
+            price = Decimal(str(prices[currency])) * cls.PRICE_SCALE
+            fields[cls.PRICE_FIELDS[currency]] = int(price.to_integral_value())
+        usd_minor = fields["usd_minor"]
+        for currency in settings.CURRENCIES:
+            if currency == "USD":
+                continue
+            rate = (exchange_rates or {}).get(f"USD{currency}")
+            if rate is not None:
+                rate = Decimal(str(rate))
+            elif usd_minor:
+                rate = (Decimal(fields[cls.PRICE_FIELDS[currency]]) / usd_minor).quantize(Decimal("0.0001"))
+            else:
+                rate = Decimal(0)
+            fields[f"usd_to_{currency.lower()}"] = rate
+        return fields
+
     @classmethod
     def get_or_create_from_api(cls, user=None, timestamp=-1):
+        """
+        Returns the price of the bucket ``timestamp`` falls into (see
+        ``finances.prices``), fetching it from mempool only if neither this
+        process nor the database knows a price of the bucket.
+        """
         if timestamp == -1:
             current_datetime = datetime.datetime.now()
             timestamp = int(current_datetime.timestamp())
-        cached_data = cls.objects.filter(timestamp=timestamp).first()
+        start, end = get_bucket(timestamp)
+        cached_data = price_series.find(start, end)
+        if cached_data:
+            return cached_data, False
+        cached_data = cls.objects.filter(timestamp__gte=start, timestamp__lt=end).order_by("timestamp").first()
         if cached_data:
+            price_series.add(cached_data)
             return cached_data, False
+        timestamp = start
         try:
             if user:
                 mempool_endpoint = user.profile.mempool_endpoint
@@ -302,21 +332,9 @@ class HistoricalPrice(models.Model):
                 logger.error(ex2, exc_info=True)
             return None, None
         try:
-            obj, created = cls.objects.get_or_create(timestamp=timestamp, defaults={
-                'usd_price': Decimal(str(api_response['prices'][0]['USD'])),
-                'eur_price': Decimal(str(api_response['prices'][0]['EUR'])),
-                'gbp_price': Decimal(str(api_response['prices'][0]['GBP'])),
-                'cad_price': Decimal(str(api_response['prices'][0]['CAD'])),
-                'chf_price': Decimal(str(api_response['prices'][0]['CHF'])),
-                'aud_price': Decimal(str(api_response['prices'][0]['AUD'])),
-                'jpy_price': Decimal(str(api_response['prices'][0]['JPY'])),
-                'usd_to_eur': Decimal(str(api_response['exchangeRates']['USDEUR'])),
-                'usd_to_gbp': Decimal(str(api_response['exchangeRates']['USDGBP'])),
-                'usd_to_cad': Decimal(str(api_response['exchangeRates']['USDCAD'])),
-                'usd_to_chf': Decimal(str(api_response['exchangeRates']['USDCHF'])),
-                'usd_to_aud': Decimal(str(api_response['exchangeRates']['USDAUD'])),
-                'usd_to_jpy': Decimal(str(api_response['exchangeRates']['USDJPY']))
-            })
+            obj, created = cls.objects.get_or_create(timestamp=timestamp, defaults=cls.fields_from_api(
+                api_response['prices'][0], api_response['exchangeRates']))
+            price_series.add(obj)
             return obj, created
         except:
             return None, None
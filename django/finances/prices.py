@@ -0,0 +1,197 @@
+"""
+Historical BTC prices as a bucketed series.
+
+Prices are stored (as ``HistoricalPrice`` rows) at most once per bucket:
+per hour for the last ``HOURLY_BUCKETS_FOR`` seconds and per day before
+that. Any row inside a bucket serves the whole bucket, so valuing many
+outputs needs at most one mempool request per bucket and "now" is served
+by the row of the current hour.
+
+Every process keeps the rows of the time ranges it looked up in a sorted
+series, see ``PriceSeries``, lookups are a bisect. ``price_at``
+interpolates between neighbouring rows.
+"""
+import bisect
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Q
+
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+
+# Block times older than this are valued with the daily price.
+HOURLY_BUCKETS_FOR = 30 * DAY
+
+# The price series is loaded in blocks of this size, buckets don't cross them
+BLOCK_SIZE = 30 * DAY
+BLOCK_TTL = HOUR
+
+
+def get_bucket(timestamp, now=None):
+    """
+    Returns ``(start, end)`` of the bucket ``timestamp`` falls into.
+    """
+    if now is None:
+        now = int(time.time())
+    size = HOUR if now - timestamp < HOURLY_BUCKETS_FOR else DAY
+    start = timestamp - timestamp % size
+    return start, start + size
+
+
+def get_block(timestamp):
+    """Returns the start of the ``PriceSeries`` block of ``timestamp``."""
+    return timestamp - timestamp % BLOCK_SIZE
+
+
+class PriceSeries:
+    """
+    Sorted ``HistoricalPrice`` rows of this process, loaded per block of
+    ``BLOCK_SIZE`` seconds when a lookup needs them. At most
+    ``PRICE_SERIES_MAX_BLOCKS`` blocks are kept, the least recently used
+    are dropped first, and a block is reloaded after ``BLOCK_TTL`` to see the
+    rows stored by other processes.
+    """
+
+    def __init__(self):
+        # block start -> (loaded at, timestamps, prices), the lists of a
+        # block are replaced as a whole
+        self._blocks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_blocks(self, starts):
+        """
+        Returns ``{start: (timestamps, prices)}`` of the blocks ``starts``,
+        the missing ones are loaded in one query.
+        """
+        from .models import HistoricalPrice
+
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for start in starts:
+                entry = self._blocks.get(start)
+                if entry is not None and now - entry[0] < BLOCK_TTL:
+                    self._blocks.move_to_end(start)
+                    found[start] = entry[1:]
+        missing = sorted(set(starts) - set(found))
+        if not missing:
+            return found
+
+        # adjacent blocks are loaded as one range
+        ranges = []
+        for start in missing:
+            if ranges and ranges[-1][1] == start:
+                ranges[-1][1] = start + BLOCK_SIZE
+            else:
+                ranges.append([start, start + BLOCK_SIZE])
+        query = Q()
+        for range_start, range_end in ranges:
+            query |= Q(timestamp__gte=range_start, timestamp__lt=range_end)
+        loaded = {start: ([], []) for start in missing}
+        for price in HistoricalPrice.objects.filter(query).order_by("timestamp"):
+            timestamps, prices = loaded[get_block(price.timestamp)]
+            timestamps.append(price.timestamp)
+            prices.append(price)
+
+        with self._lock:
+            for start, (timestamps, prices) in loaded.items():
+                self._blocks.pop(start, None)
+                self._blocks[start] = (now, timestamps, prices)
+                found[start] = (timestamps, prices)
+            while len(self._blocks) > settings.PRICE_SERIES_MAX_BLOCKS:
+                self._blocks.popitem(last=False)
+        return found
+
+    def add(self, price):
+        start = get_block(price.timestamp)
+        with self._lock:
+            entry = self._blocks.get(start)
+            if entry is None:
+                return
+            loaded_at, timestamps, prices = entry[0], list(entry[1]), list(entry[2])
+            i = bisect.bisect_left(timestamps, price.timestamp)
+            if i < len(timestamps) and timestamps[i] == price.timestamp:
+                prices[i] = price
+            else:
+                timestamps.insert(i, price.timestamp)
+                prices.insert(i, price)
+            self._blocks[start] = (loaded_at, timestamps, prices)
+
+    def clear(self):
+        with self._lock:
+            self._blocks.clear()
+
+    def find(self, start, end):
+        """
+        Returns the first known price in ``[start, end)`` or ``None``.
+        """
+        return self.find_many([(start, end)]).get(start)
+
+    def find_many(self, buckets):
+        """
+        Returns ``{start: price}`` for the ``(start, end)`` buckets with a
+        known price, loading only the blocks of the buckets.
+        """
+        buckets = sorted(buckets)
+        blocks = self._get_blocks({block
+                                   for start, end in buckets
+                                   for block in range(get_block(start), end, BLOCK_SIZE)})
+        found = {}
+        for start, end in buckets:
+            for block in range(get_block(start), end, BLOCK_SIZE):
+                timestamps, prices = blocks[block]
+                i = bisect.bisect_left(timestamps, start)
+                if i < len(timestamps) and timestamps[i] < end:
+                    found[start] = prices[i]
+                    break
+        return found
+
+    def _neighbours(self, timestamp):
+        """
+        Returns the last known price before ``timestamp`` and the first at
+        or after it, ``None`` if there is none. Prices outside the block of
+        ``timestamp`` are queried, not loaded.
+        """
+        from .models import HistoricalPrice
+
+        block = get_block(timestamp)
+        timestamps, prices = self._get_blocks([block])[block]
+        i = bisect.bisect_left(timestamps, timestamp)
+        before = prices[i - 1] if i > 0 else HistoricalPrice.objects.filter(
+            timestamp__lt=block).order_by("-timestamp").first()
+        after = prices[i] if i < len(timestamps) else HistoricalPrice.objects.filter(
+            timestamp__gte=block + BLOCK_SIZE).order_by("timestamp").first()
+        return before, after
+
+    def nearest(self, timestamp):
+        """
+        Returns the known price closest to ``timestamp`` or ``None``.
+        """
+        candidates = [price for price in self._neighbours(timestamp) if price is not None]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda price: abs(price.timestamp - timestamp))
+
+    def price_at(self, timestamp, currency):
+        """
+        Returns the price in ``currency``, linearly interpolated between the
+        known prices around ``timestamp``, or ``None`` without prices.
+        """
+        before, after = self._neighbours(timestamp)
+        if after is not None and after.timestamp == timestamp:
+            return after.get_currency_price(currency)
+        if before is None or after is None:
+            price = before or after
+            return price.get_currency_price(currency) if price else None
+        t0, t1 = before.timestamp, after.timestamp
+        p0 = before.get_currency_price(currency)
+        p1 = after.get_currency_price(currency)
+        return p0 + (p1 - p0) * Decimal(timestamp - t0) / Decimal(t1 - t0)
+
+
+price_series = PriceSeries()
@@ -1,7 +1,7 @@
 from django.contrib.auth.signals import user_logged_in
 from django.contrib import messages
 from django.dispatch import receiver
-from finances.models import HistoricalPrice
+from finances.spot_price import get_spot_prices
 
 @receiver(user_logged_in)
 def perform_tasks_on_login(sender, user, request, **kwargs):
@@ -21,5 +21,5 @@ def perform_tasks_on_login(sender, user, request, **kwargs):
             f"{ex}"
         ))
 
-    # Store nearest price information.
-    HistoricalPrice.get_or_create_from_api(user, -1)
+    # Refresh the shared spot price in the background if it is stale.
+    get_spot_prices()
@@ -0,0 +1,104 @@
+"""
+Current BTC price shared by all processes.
+
+The latest prices from mempool's ``/api/v1/prices`` are kept in the Django
+cache without expiry, so the last known price survives an unreachable
+endpoint. Reading never blocks on mempool: prices older than
+``SPOT_PRICE_TTL`` seconds are still returned and a ``refresh_spot_price``
+background task is scheduled (once per TTL for all processes). Before the
+first refresh the latest ``HistoricalPrice`` is used.
+"""
+import logging
+import time
+from decimal import Decimal
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+
+from .prices import price_series
+
+
+logger = logging.getLogger('labelbase')
+
+SPOT_PRICE_KEY = "finances:spot_price"
+REFRESH_SCHEDULED_KEY = "finances:spot_price:refresh_scheduled"
+
+# Valuing many outputs reads the price once, not once per output.
+LOCAL_TTL = 5
+_local = {"read_at": 0.0, "spot": None}
+
+
+def fetch_spot_prices(mempool_endpoint=None):
+    """
+    Returns ``{"time": ..., "prices": {currency: Decimal}}`` from mempool.
+    """
+    if mempool_endpoint is None:
+        mempool_endpoint = settings.SPOT_PRICE_MEMPOOL_ENDPOINT
+    response = requests.get(f"{mempool_endpoint}/api/v1/prices",
+                            timeout=settings.SPOT_PRICE_TIMEOUT)
+    response.raise_for_status()
+    api_response = response.json()
+    return {
+        "time": int(api_response.get("time") or time.time()),
+        "prices": {currency: Decimal(str(api_response[currency]))
+                   for currency in settings.CURRENCIES},
+    }
+
+
+def refresh_spot_prices():
+    """
+    Fetches the current prices into the cache. Keeps the last known prices
+    and returns ``None`` if mempool can't be reached.
+    """
+    try:
+        spot = fetch_spot_prices()
+    except Exception as ex:
+        logger.error(ex, exc_info=True)
+        return None
+    spot["fetched_at"] = time.time()
+    cache.set(SPOT_PRICE_KEY, spot, timeout=None)
+    _local["read_at"] = 0.0
+    return spot
+
+
+def schedule_refresh():
+    # cache.add is atomic, only the first stale reader schedules the task
+    if cache.add(REFRESH_SCHEDULED_KEY, True, timeout=settings.SPOT_PRICE_TTL):
+        from .tasks import refresh_spot_price
+        refresh_spot_price()
+
+
+def get_spot_prices():
+    """
+    Returns ``{currency: Decimal}`` of the latest known prices, or ``None``
+    if no price was ever stored.
+    """
+    now = time.time()
+    if now - _local["read_at"] < min(LOCAL_TTL, settings.SPOT_PRICE_TTL):
+        spot = _local["spot"]
+    else:
+        spot = cache.get(SPOT_PRICE_KEY)
+        _local.update(read_at=now, spot=spot)
+        if spot is None or now - spot["fetched_at"] > settings.SPOT_PRICE_TTL:
+            schedule_refresh()
+    if spot is not None:
+        return spot["prices"]
+
+    latest = price_series.nearest(int(now))
+    if latest is None:
+        return None
+    return {currency: latest.get_currency_price(currency)
+            for currency in settings.CURRENCIES}
+
+
+def get_spot_price(currency="USD"):
+    """
+    Returns the latest known price in ``currency`` or ``None``.
+    """
+    if currency not in settings.CURRENCIES:
+        raise ValueError(f"Invalid currency code: {currency}")
+    prices = get_spot_prices()
+    if prices is None:
+        return None
+    return prices[currency]
@@ -1,28 +1,40 @@
 import logging
 from background_task import background
 from background_task.management.commands.remove_completed import _remove_completed_task
-from labelbase.models import Label
+from labelbase.models import Labelbase
 from finances.electrum import checkup_label
+from finances.electrum_sync import refresh_labelbase, set_refresh_progress
 
 logger = logging.getLogger('labelbase')
 
 
 @background(schedule={'run_at': 0}, remove_existing_tasks=True)
 def check_all_outputs(user_id, labelbase_id=None, loop=None):
+    labelbases = Labelbase.objects.filter(user_id=user_id)
     if labelbase_id:
-        labels = Label.objects.filter(labelbase__id=labelbase_id,
-                                      labelbase__user_id=user_id)
-    else:
-        labels = Label.objects.filter(labelbase__user_id=user_id)
-    logger.debug("found {} labels".format(labels.count()))
-    for label in labels:
-        if label.type == "output":
-            logger.debug("check_spent, label.id {}".format(label.id))
-            check_spent(label.id)
+        labelbases = labelbases.filter(id=labelbase_id)
+    # One refresh job per labelbase, see finances/electrum_sync.py
+    for labelbase_id in labelbases.values_list("id", flat=True):
+        queue_refresh(labelbase_id)
     # Cleanup
     _remove_completed_task()
 
+def queue_refresh(labelbase_id):
+    set_refresh_progress(labelbase_id, "queued")
+    refresh_labelbase_outputs(labelbase_id)
+
+@background(schedule={'run_at': 0}, remove_existing_tasks=True)
+def refresh_labelbase_outputs(labelbase_id, loop=None):
+    if loop:
+        refreshed = refresh_labelbase(labelbase_id, loop)
+        logger.debug("refreshed {} outputs of labelbase {}".format(refreshed, labelbase_id))
+
 @background(schedule={'run_at': 0}, remove_existing_tasks=True)
 def check_spent(label_id, loop=None):
     if loop:
         checkup_label(label_id, loop)
+
+@background(schedule={'run_at': 0}, remove_existing_tasks=True)
+def refresh_spot_price():
+    from finances.spot_price import refresh_spot_prices
+    refresh_spot_prices()
@@ -0,0 +1,142 @@
+import random
+
+from django.test import SimpleTestCase, TestCase
+
+from .coin_selection import Candidate, plan_consolidation, plan_spend
+from .electrum_sync import needs_refresh
+from .models import HistoricalPrice, OutputStat
+from .prices import BLOCK_SIZE, DAY, PriceSeries
+from .timeline import build_timeline
+from .tx_math import (OUTPUT_SIZES, calculate_fee, calculate_transaction_size,
+                      calculate_transaction_sizes)
+
+
+INPUT_TYPES = [
+    ("P2PKH",), ("P2SH-P2WPKH",), ("P2WPKH",), ("P2TR",),
+    ("P2SH", 2, 3), ("P2SH", 1, 1), ("P2WSH", 2, 3), ("P2WSH", 3, 5),
+]
+
+
+class TransactionSizesTest(SimpleTestCase):
+
+    def test_batch_matches_scalar(self):
+        """
+        Random scenarios, including empty ones and counts past the one byte
+        varint, give the sizes and fees of calculate_transaction_size().
+        """
+        rng = random.Random(17)
+        scenarios = []
+        for _ in range(500):
+            inputs = {t: rng.choice([0, 0, 1, 2, rng.randint(0, 300)]) for t in INPUT_TYPES}
+            outputs = {t: rng.choice([0, 1, 2, rng.randint(0, 300)]) for t in OUTPUT_SIZES}
+            scenarios.append((inputs, outputs))
+        scenarios.append(({t: 0 for t in INPUT_TYPES}, {t: 0 for t in OUTPUT_SIZES}))
+
+        fee_rate = 7
+        batch = calculate_transaction_sizes(
+            {t: [inputs[t] for inputs, _ in scenarios] for t in INPUT_TYPES},
+            {t: [outputs[t] for _, outputs in scenarios] for t in OUTPUT_SIZES},
+            fee_rate)
+
+        for i, (inputs, outputs) in enumerate(scenarios):
+            input_list = []
+            for t, count in inputs.items():
+                attrs = {'input_script': t[0]}
+                if len(t) == 3:
+                    attrs.update(input_m=t[1], input_n=t[2])
+                input_list += [attrs] * count
+            expected = calculate_transaction_size(input_list, outputs)
+            for key, value in expected.items():
+                self.assertEqual(batch[key][i], value, (key, inputs, outputs))
+            self.assertEqual(batch['fee'][i], calculate_fee(expected['txVBytes'], fee_rate))
+
+    def test_script_names_and_unequal_lengths(self):
+        sizes = calculate_transaction_sizes({"P2WPKH": [1, 2]}, {'p2wpkh': [2, 1]})
+        self.assertEqual(sizes['txVBytes'], [
+            calculate_transaction_size([{'input_script': 'P2WPKH'}], {'p2wpkh': 2})['txVBytes'],
+            calculate_transaction_size([{'input_script': 'P2WPKH'}] * 2, {'p2wpkh': 1})['txVBytes'],
+        ])
+        with self.assertRaises(ValueError):
+            calculate_transaction_sizes({"P2WPKH": [1, 2]}, {'p2wpkh': [1]})
+
+
+class CoinSelectionTest(SimpleTestCase):
+
+    def setUp(self):
+        rng = random.Random(19)
+        self.candidates = [
+            Candidate(i, "tx{}:0".format(i), rng.randint(1000, 2000000), rng.choice(INPUT_TYPES[:4]))
+            for i in range(3000)
+        ]
+
+    def test_plan_spend_pays_target_and_fee(self):
+        for target in (5000, 150000, 40000000):
+            plan = plan_spend(self.candidates, target, fee_rate=8, long_term_fee_rate=4)
+            self.assertGreaterEqual(plan['input_value'] - plan['fee'] - plan['change'], target)
+            if not plan['change']:
+                # without change the excess is below the cost of a change output
+                self.assertLess(plan['input_value'] - plan['fee'] - target, 8 * 31 + 4 * 68)
+            self.assertEqual(len({i['label_id'] for i in plan['inputs']}), len(plan['inputs']))
+
+    def test_plan_spend_without_changeless_solution(self):
+        candidates = [Candidate(i, "", value, ("P2WPKH",)) for i, value in enumerate([1000, 2000, 3000, 7000])]
+        plan = plan_spend(candidates, 9000, fee_rate=1)
+        self.assertEqual(plan['algorithm'], 'knapsack')
+        with self.assertRaises(ValueError):
+            plan_spend(candidates, 10 ** 8, fee_rate=1)
+
+    def test_plan_consolidation_is_standard(self):
+        plan = plan_consolidation(self.candidates, fee_rate=1, long_term_fee_rate=20)
+        self.assertLessEqual(plan['weight'], 400000)
+        self.assertGreater(plan['savings'], 0)
+        self.assertEqual(plan['target'], plan['input_value'] - plan['fee'])
+
+
+class TimelineTest(SimpleTestCase):
+
+    def test_build_timeline(self):
+        outputs = [
+            (1000, 2 * DAY + 5, False, 0),
+            (500, 3 * DAY, True, 5 * DAY + 7),
+            (700, 4 * DAY, True, 0),        # spend time unknown
+            (300, 0, False, 0),             # unconfirmed
+            (200, 5 * DAY, True, 9 * DAY),  # spent after the end
+        ]
+        balances, unknown_spent = build_timeline(outputs, 2 * DAY, 6 * DAY)
+        self.assertEqual(balances, [1000, 1500, 1500, 1200, 1200])
+        self.assertEqual(unknown_spent, 1)
+
+
+class NeedsRefreshTest(SimpleTestCase):
+
+    def test_spent_outputs_without_spend_time(self):
+        output = OutputStat(value=1, spent=True, confirmed_at_block_time=DAY)
+        self.assertTrue(needs_refresh(output))
+        output.spent_at_block_time = 2 * DAY
+        self.assertFalse(needs_refresh(output))
+        self.assertTrue(needs_refresh(OutputStat(value=1, spent=False, confirmed_at_block_time=DAY)))
+
+
+class PriceSeriesTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        prices = {currency: 1000 + i for i, currency in enumerate(HistoricalPrice.PRICE_FIELDS)}
+        for day in (3, 5, 200):
+            HistoricalPrice.objects.create(timestamp=day * DAY, **HistoricalPrice.fields_from_api(
+                dict(prices, USD=day * 100)))
+
+    def test_loads_the_blocks_of_the_lookups(self):
+        series = PriceSeries()
+        with self.assertNumQueries(1):
+            found = series.find_many([(3 * DAY, 4 * DAY), (4 * DAY, 5 * DAY), (200 * DAY, 201 * DAY)])
+            self.assertEqual(series.find(5 * DAY, 6 * DAY).timestamp, 5 * DAY)
+        self.assertEqual(sorted(found), [3 * DAY, 200 * DAY])
+        self.assertEqual(len(series._blocks), 2)
+
+    def test_neighbours_outside_the_block(self):
+        series = PriceSeries()
+        self.assertEqual(series.nearest(150 * DAY).timestamp, 200 * DAY)
+        self.assertEqual(series.nearest(BLOCK_SIZE + DAY).timestamp, 5 * DAY)
+        self.assertEqual(series.price_at(4 * DAY, "USD"), 400)
+        self.assertEqual(series.price_at(DAY, "USD"), 300)
@@ -0,0 +1,126 @@
+"""
+Fiat value of a labelbase over time.
+
+``portfolio_timeline`` builds the daily holdings of a labelbase from its
+outputs: an output adds its value on the day it confirmed and removes it
+on the day it was spent, the cumulative sum of these changes is the
+balance of each day. The balances are valued with the closing prices of
+the days, loaded in one query, so years of history take one request and
+no price API calls (``import_historical_prices`` fills the history).
+
+The result is cached per labelbase version and state of its outputs.
+"""
+import datetime
+import hashlib
+from itertools import accumulate
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .prices import DAY
+
+
+TIMELINE_KEY = "finances:timeline:{}:{}:{}"
+
+
+def load_outputs(labelbase_id):
+    """
+    Returns ``(value, confirmed_at_block_time, spent, spent_at_block_time)``
+    of the outputs labeled in the labelbase.
+    """
+    from .models import OutputStat
+
+    return list(OutputStat.objects.filter(
+        labels__labelbase_id=labelbase_id,
+    ).distinct().order_by("id").values_list(
+        "value", "confirmed_at_block_time", "spent", "spent_at_block_time"))
+
+
+def load_closing_prices(start, end, currency):
+    """
+    Returns the price in hundredths of ``currency`` at the end of each day
+    from ``start`` to ``end`` (day starts), ``None`` before the first
+    stored price. Days without a price keep the one of the day before.
+    """
+    from .models import HistoricalPrice
+
+    rows = HistoricalPrice.objects.filter(
+        timestamp__gte=start - DAY, timestamp__lt=end + DAY,
+    ).order_by("timestamp").values_list("timestamp", HistoricalPrice.PRICE_FIELDS[currency])
+
+    prices = []
+    price = None
+    rows = iter(rows)
+    row = next(rows, None)
+    for day in range(start, end + DAY, DAY):
+        while row is not None and row[0] < day + DAY:
+            price = row[1]
+            row = next(rows, None)
+        prices.append(price)
+    return prices
+
+
+def build_timeline(outputs, start, end):
+    """
+    Returns the balance in sats of each day from ``start`` to ``end`` and
+    the number of spent outputs left out as their spend time is unknown.
+    """
+    days = (end - start) // DAY + 1
+    changes = [0] * days
+    unknown_spent = 0
+    for value, confirmed_at, spent, spent_at in outputs:
+        if not confirmed_at or not value:
+            continue
+        if spent and not spent_at:
+            unknown_spent += 1
+            continue
+        changes[max(confirmed_at - start, 0) // DAY] += value
+        if spent and spent_at < end + DAY:
+            changes[max(spent_at - start, 0) // DAY] -= value
+    return list(accumulate(changes)), unknown_spent
+
+
+def compute_portfolio_timeline(outputs, currency, today):
+    confirmed = [output[1] for output in outputs if output[1]]
+    if not confirmed:
+        return {"currency": currency, "days": [], "sats": [], "values": [],
+                "unknown_spent": 0}
+    start = min(confirmed) // DAY * DAY
+    balances, unknown_spent = build_timeline(outputs, start, today)
+    prices = load_closing_prices(start, today, currency)
+    scale = 10 ** 8 * 100  # sats per BTC, hundredths per unit
+    return {
+        "currency": currency,
+        "days": list(range(start, today + DAY, DAY)),
+        "sats": balances,
+        "values": [None if price is None else round(sats * price / scale, 2)
+                   for sats, price in zip(balances, prices)],
+        "unknown_spent": unknown_spent,
+    }
+
+
+def portfolio_timeline(labelbase_id, currency="USD", version=None):
+    """
+    Returns the daily series of the balance (``sats``) and its value in
+    ``currency`` (``values``) of the labelbase, one entry per day from
+    the first confirmed output to today (UTC). ``version`` is the result
+    of ``get_labelbase_version`` if the caller has it.
+    """
+    from labelbase.label_cache import get_labelbase_version
+
+    if currency not in settings.CURRENCIES:
+        raise ValueError(f"Invalid currency code: {currency}")
+    if version is None:
+        version = get_labelbase_version(labelbase_id)
+    today = int(datetime.datetime.now(datetime.timezone.utc).timestamp()) // DAY * DAY
+
+    # Spends found by the checkups don't change the labelbase version,
+    # the outputs are part of the key.
+    outputs = load_outputs(labelbase_id)
+    digest = hashlib.sha1(repr((version, today, outputs)).encode()).hexdigest()
+    key = TIMELINE_KEY.format(labelbase_id, currency, digest)
+    timeline = cache.get(key)
+    if timeline is None:
+        timeline = compute_portfolio_timeline(outputs, currency, today)
+        cache.set(key, timeline, DAY)
+    return timeline
@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 # Constants
 P2PKH_IN_SIZE = 148
 P2PKH_OUT_SIZE = 34
@@ -12,6 +14,69 @@ P2WSH_OUT_SIZE = P2TR_OUT_SIZE = 43
 PUBKEY_SIZE = 33
 SIGNATURE_SIZE = 72
 
+OUTPUT_SIZES = {
+    'p2pkh': P2PKH_OUT_SIZE,
+    'p2sh': P2SH_OUT_SIZE,
+    'p2sh_p2wpkh': P2SH_P2WPKH_OUT_SIZE,
+    'p2sh_p2wsh': P2SH_P2WSH_OUT_SIZE,
+    'p2wpkh': P2WPKH_OUT_SIZE,
+    'p2wsh': P2WSH_OUT_SIZE,
+    'p2tr': P2TR_OUT_SIZE,
+}
+
+WITNESS_INPUT_SCRIPTS = ("P2SH-P2WPKH", "P2WPKH", "P2WSH", "P2TR")
+
+
+# Script types of the scriptPubKey "type" reported by bitcoind/electrum
+SCRIPT_PUBKEY_TYPES = {
+    "pubkeyhash": "P2PKH",
+    "scripthash": "P2SH-P2WPKH",
+    "witness_v0_keyhash": "P2WPKH",
+    "witness_v0_scripthash": "P2WSH",
+    "witness_v1_taproot": "P2TR",
+}
+
+# m-of-n assumed for script hash outputs, the script is only known on spend
+DEFAULT_MULTISIG = (2, 3)
+
+
+def detect_script_type(script_pubkey=None, address=None, script_pubkey_type=None):
+    """
+    Returns the input script type (as used by ``get_input_size``) needed to
+    spend an output, from its scriptPubKey hex, its address or the type
+    reported by the node, or ``None``. Nested P2SH outputs are assumed to
+    be P2SH-P2WPKH.
+    """
+    if script_pubkey_type in SCRIPT_PUBKEY_TYPES:
+        return SCRIPT_PUBKEY_TYPES[script_pubkey_type]
+    if script_pubkey:
+        script_pubkey = script_pubkey.lower()
+        if len(script_pubkey) == 50 and script_pubkey.startswith("76a914") and script_pubkey.endswith("88ac"):
+            return "P2PKH"
+        if len(script_pubkey) == 46 and script_pubkey.startswith("a914") and script_pubkey.endswith("87"):
+            return "P2SH-P2WPKH"
+        if len(script_pubkey) == 44 and script_pubkey.startswith("0014"):
+            return "P2WPKH"
+        if len(script_pubkey) == 68 and script_pubkey.startswith("0020"):
+            return "P2WSH"
+        if len(script_pubkey) == 68 and script_pubkey.startswith("5120"):
+            return "P2TR"
+    if address:
+        lowered = address.lower()
+        for prefix in ("bc1", "tb1", "bcrt1"):
+            if lowered.startswith(prefix):
+                program = lowered[len(prefix):]
+                if program.startswith("q"):
+                    return "P2WPKH" if len(program) == 39 else "P2WSH"
+                if program.startswith("p"):
+                    return "P2TR"
+                return None
+        if address[0] in "1mn":
+            return "P2PKH"
+        if address[0] in "32":
+            return "P2SH-P2WPKH"
+    return None
+
 
 def get_size_of_var_int(length):
     if length <= 252:
@@ -80,6 +145,12 @@ def get_input_size(input_attr):
         raise ValueError(f"Unsupported input script type: {script_type}")
 
 
+@lru_cache(maxsize=None)
+def get_input_type_size(script_type, m=0, n=0):
+    """Memoized ``get_input_size`` by script type and multisig m/n."""
+    return get_input_size({'input_script': script_type, 'input_m': m, 'input_n': n})
+
+
 def calculate_transaction_size(inputs, output_counts):
     """
     inputs: list of dicts with keys: input_script, input_m, input_n
@@ -143,6 +214,75 @@ def calculate_fee(tx_vbytes, fee_rate_sats_per_vbyte):
     return round(tx_vbytes * fee_rate_sats_per_vbyte)
 
 
+def calculate_transaction_sizes(input_counts, output_counts, fee_rate=None):
+    """
+    Batch version of calculate_transaction_size() for many spend scenarios,
+    e.g. the candidates of a consolidation.
+
+    input_counts: dict mapping an input type, either an input_script or an
+                  (input_script, input_m, input_n) tuple, to a list with the
+                  number of such inputs per scenario
+    output_counts: dict mapping output types to a list of counts per scenario
+    fee_rate: optional fee rate in sats per vbyte
+
+    All lists have one entry per scenario. Returns a dict of lists with the
+    keys of calculate_transaction_size(), plus 'fee' if fee_rate is given.
+    """
+    lengths = {len(counts) for counts in input_counts.values()}
+    lengths |= {len(counts) for counts in output_counts.values()}
+    if len(lengths) > 1:
+        raise ValueError("All counts need one entry per scenario")
+    size = lengths.pop() if lengths else 0
+
+    input_count = [0] * size
+    output_count = [0] * size
+    total_base = [0] * size
+    total_witness = [0] * size
+    has_witness = [False] * size
+
+    # One pass per column, the sizes are looked up once per input type
+    for input_type, counts in input_counts.items():
+        if isinstance(input_type, str):
+            input_type = (input_type,)
+        base, witness = get_input_type_size(*input_type)
+        is_witness = input_type[0] in WITNESS_INPUT_SCRIPTS
+        for i, count in enumerate(counts):
+            if count:
+                input_count[i] += count
+                total_base[i] += base * count
+                total_witness[i] += witness * count
+                if is_witness:
+                    has_witness[i] = True
+
+    for output_type, counts in output_counts.items():
+        out_size = OUTPUT_SIZES.get(output_type, 0)
+        for i, count in enumerate(counts):
+            if count:
+                output_count[i] += count
+                total_base[i] += out_size * count
+
+    tx_bytes = []
+    tx_vbytes = []
+    tx_weight = []
+    for i in range(size):
+        # version(4) + varints + locktime(4), see calculate_transaction_size()
+        base = total_base[i] + 8 + get_size_of_var_int(input_count[i]) + get_size_of_var_int(output_count[i])
+        witness = total_witness[i] + (2 if has_witness[i] else 0)
+        weight = base * 4 + witness
+        tx_weight.append(weight)
+        tx_vbytes.append(round(weight / 4))
+        tx_bytes.append(round(base + witness / 4))
+
+    sizes = {
+        'txBytes': tx_bytes,
+        'txVBytes': tx_vbytes,
+        'txWeight': tx_weight
+    }
+    if fee_rate is not None:
+        sizes['fee'] = [calculate_fee(vbytes, fee_rate) for vbytes in tx_vbytes]
+    return sizes
+
+
 
 def run_tests():
     fee_rate = 20  # sats per vbyte
@@ -0,0 +1,157 @@
+"""
+Store of confirmed transactions.
+
+Confirmed transactions don't change, so each is fetched from the network
+once and kept in ``RawTransaction``: the checkups (Electrum verbose
+format, ``ELECTRUM``) and the mempool API calls (Esplora format,
+``ESPLORA``) read it first. Transactions are stored in the format they
+came in, compressed and encrypted, keyed by an HMAC of format and txid.
+
+The store is bounded by ``RAW_TRANSACTION_STORE_MAX_BYTES``, the least
+recently used transactions are evicted first. The total size is kept in
+the cache, counted up by the stores and recounted by the evictions and
+once per ``SIZE_TIMEOUT``. Reads update the use time at most once per
+``TOUCH_INTERVAL`` to spare the writes.
+"""
+import hashlib
+import hmac
+import json
+import time
+import zlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
+
+from shared.encryption import blind_index_key, cipher_suite
+
+from .prices import DAY, HOUR
+
+ELECTRUM = "electrum"
+ESPLORA = "esplora"
+
+TOUCH_INTERVAL = HOUR
+
+SIZE_KEY = "tx_store:size"
+SIZE_TIMEOUT = DAY
+
+
+def get_key(txid, kind):
+    msg = "rawtx:{}:{}".format(kind, txid).encode()
+    return hmac.new(blind_index_key, msg, hashlib.sha256).hexdigest()
+
+
+def is_confirmed(tx, kind):
+    if not tx or not isinstance(tx, dict):
+        return False
+    if kind == ESPLORA:
+        return bool((tx.get("status") or {}).get("confirmed"))
+    return bool(tx.get("confirmations")) and bool(tx.get("blocktime"))
+
+
+def encrypt_transaction(tx):
+    data = zlib.compress(json.dumps(tx, separators=(",", ":")).encode("utf-8"))
+    return cipher_suite.encrypt(data).decode("utf-8")
+
+
+def decrypt_transaction(enc_data):
+    data = cipher_suite.decrypt(enc_data.encode("utf-8"))
+    return json.loads(zlib.decompress(data).decode("utf-8"))
+
+
+def load_transactions(txids, kind):
+    """Returns ``{txid: transaction}`` of the stored ones of ``txids``."""
+    from .models import RawTransaction
+
+    keys = {get_key(txid, kind): txid for txid in set(txids)}
+    if not keys:
+        return {}
+    now = int(time.time())
+    found = {}
+    stale = []
+    for pk, key, enc_data, last_used in RawTransaction.objects.filter(
+            key__in=keys).values_list("id", "key", "enc_data", "last_used"):
+        found[keys[key]] = decrypt_transaction(enc_data)
+        if last_used < now - TOUCH_INTERVAL:
+            stale.append(pk)
+    if stale:
+        RawTransaction.objects.filter(id__in=stale).update(last_used=now)
+    return found
+
+
+def store_transactions(txs, kind):
+    """
+    Stores the confirmed ones of ``txs``, ``{txid: transaction}``, and
+    evicts the least recently used transactions if the store is full.
+    """
+    from .models import RawTransaction
+
+    now = int(time.time())
+    objs = []
+    for txid, tx in txs.items():
+        if is_confirmed(tx, kind):
+            enc_data = encrypt_transaction(tx)
+            objs.append(RawTransaction(key=get_key(txid, kind), enc_data=enc_data,
+                                       size=len(enc_data), last_used=now))
+    if objs:
+        RawTransaction.objects.bulk_create(objs, batch_size=500, ignore_conflicts=True)
+        if add_size(sum(obj.size for obj in objs)) > settings.RAW_TRANSACTION_STORE_MAX_BYTES:
+            evict()
+
+
+def get_size():
+    """Total size of the stored transactions, counted if not cached."""
+    from .models import RawTransaction
+
+    size = cache.get(SIZE_KEY)
+    if size is None:
+        size = RawTransaction.objects.aggregate(total=Sum("size"))["total"] or 0
+        cache.set(SIZE_KEY, size, SIZE_TIMEOUT)
+    return size
+
+
+def add_size(size):
+    """
+    Counts ``size`` more bytes stored and returns the total. Transactions
+    stored by someone else meanwhile are counted again, the eviction
+    recounts.
+    """
+    try:
+        return cache.incr(SIZE_KEY, size)
+    except ValueError:
+        return get_size()
+
+
+def evict(max_bytes=None):
+    from .models import RawTransaction
+
+    if max_bytes is None:
+        max_bytes = settings.RAW_TRANSACTION_STORE_MAX_BYTES
+    total = RawTransaction.objects.aggregate(total=Sum("size"))["total"] or 0
+    if total > max_bytes:
+        ids = []
+        for pk, size in RawTransaction.objects.order_by("last_used", "id").values_list("id", "size").iterator():
+            ids.append(pk)
+            total -= size
+            if total <= max_bytes:
+                break
+        for i in range(0, len(ids), 500):
+            RawTransaction.objects.filter(id__in=ids[i:i + 500]).delete()
+    cache.set(SIZE_KEY, total, SIZE_TIMEOUT)
+
+
+def get_transaction(txid, kind, fetch):
+    """
+    Returns the transaction ``txid`` from the store, or ``fetch(txid)``
+    stored if it's confirmed.
+    """
+    tx = load_transactions([txid], kind).get(txid)
+    if tx is None:
+        tx = fetch(txid)
+        store_transactions({txid: tx}, kind)
+    return tx
+
+
+def get_mempool_transaction(mempool_api, txid):
+    """``mempool_api.get_transaction(txid)`` through the store."""
+    return get_transaction(txid, ESPLORA, mempool_api.get_transaction)
@@ -0,0 +1,144 @@
+"""
+Fiat valuation of many outputs at once.
+
+``value_outputs`` computes the metrics of ``OutputStat.output_metrics_dict``
+for a list of outputs: the historical prices of all confirmation times are
+joined against the price series in one pass (a missing bucket is fetched
+once, not once per output) and the spot price is read once.
+``value_labels`` does the same for the output labels of a labelbase and
+memoizes the result on each label for the templates.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+
+from .prices import get_bucket, price_series
+from .spot_price import get_spot_prices
+
+
+SATS_PER_BTC = Decimal("100000000.0")
+
+
+def get_historical_prices(timestamps, user=None):
+    """
+    Returns ``{timestamp: HistoricalPrice}`` for the buckets of
+    ``timestamps``. Timestamps without a price are left out.
+    """
+    from .models import HistoricalPrice
+
+    buckets = {timestamp: get_bucket(timestamp) for timestamp in set(timestamps)}
+    found = price_series.find_many(set(buckets.values()))
+    for start, end in set(buckets.values()):
+        if start not in found:
+            obj, _ = HistoricalPrice.get_or_create_from_api(user, timestamp=start)
+            if obj is not None:
+                found[start] = obj
+    return {timestamp: found[start]
+            for timestamp, (start, _) in buckets.items() if start in found}
+
+
+def value_outputs(outputs, user=None):
+    """
+    ``outputs`` is a sequence of ``(output_stat, tracked_fiat_value,
+    fiat_currency)``. Returns the list of metrics dictionaries in the same
+    order and the totals per fiat currency. An output without price
+    information gets an empty dictionary, like ``output_metrics_dict``.
+    """
+    historical = get_historical_prices(
+        [output.confirmed_at_block_time for output, _, _ in outputs
+         if output.confirmed_at_block_time], user)
+    spot_prices = get_spot_prices() or {}
+    # price lookups per (bucket, currency) are shared by outputs
+    old_prices = {}
+
+    results = []
+    totals = {}
+    for output, tracked_fiat_value, fiat_currency in outputs:
+        fiat_currency = fiat_currency or "USD"
+        if fiat_currency not in settings.CURRENCIES:
+            raise ValueError(f"Invalid currency code: {fiat_currency}")
+        btc = Decimal(output.value) / SATS_PER_BTC
+
+        old_output_value = tracked_fiat_value
+        is_tracked = False
+        if output.confirmed_at_block_time:
+            obj = historical.get(output.confirmed_at_block_time)
+            if obj is None:
+                results.append({})
+                continue
+            if Decimal(tracked_fiat_value) > Decimal(0):
+                is_tracked = True
+            else:
+                key = (obj.timestamp, fiat_currency)
+                if key not in old_prices:
+                    old_prices[key] = obj.get_currency_price(fiat_currency)
+                old_output_value = btc * old_prices[key]
+
+        spot_price = spot_prices.get(fiat_currency)
+        if spot_price is None:
+            results.append({})
+            continue
+        current_price = btc * spot_price
+
+        performance = 0
+        if current_price and old_output_value:
+            performance = ((current_price - old_output_value) / old_output_value) * 100
+
+        results.append({
+            "value": output.value,
+            "type_ref_hash": output.type_ref_hash,
+            "spent": output.spent,
+            "confirmed_at_block_height": output.confirmed_at_block_height,
+            "confirmed_at_block_time": output.confirmed_at_block_time,
+            "network": output.network,
+            "fiat_value_old": old_output_value,
+            "fiat_value": current_price,
+            "fiat_cur": fiat_currency,
+            "performance": performance,
+            "current_price": current_price,
+            "is_tracked": is_tracked,
+        })
+
+        total = totals.setdefault(fiat_currency, {
+            "value": 0, "fiat_value_old": Decimal(0), "fiat_value": Decimal(0)})
+        total["value"] += output.value
+        total["fiat_value_old"] += old_output_value
+        total["fiat_value"] += current_price
+
+    for total in totals.values():
+        total["performance"] = 0
+        if total["fiat_value_old"]:
+            total["performance"] = (
+                (total["fiat_value"] - total["fiat_value_old"]) / total["fiat_value_old"]) * 100
+    return results, totals
+
+
+def value_labels(labels):
+    """
+    Values the output labels of one labelbase (loaded with
+    ``select_related("output_stat", "labelbase__user")``) and memoizes the
+    metrics on each label, see ``Label.get_finance_output_metrics_dict``.
+    Returns the totals per fiat currency.
+    """
+    from .models import OutputStat
+
+    valued = []
+    outputs = []
+    for label in labels:
+        output = label.output_stat
+        if output is None:
+            output, _ = OutputStat.get_or_create_from_api(
+                user=label.labelbase.user,
+                type_ref_hash=label.type_ref_hash,
+                network=label.labelbase.network)
+            if output is None:
+                label._finance_output_metrics = {}
+                continue
+        valued.append(label)
+        outputs.append((output, *label.get_extracted_fiat_value()))
+
+    user = valued[0].labelbase.user if valued else None
+    results, totals = value_outputs(outputs, user)
+    for label, metrics in zip(valued, results):
+        label._finance_output_metrics = metrics
+    return totals
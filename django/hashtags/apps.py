@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class HashtagsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'hashtags'
+
+    def ready(self):
+        from django.db.models.signals import pre_save, post_save
+        from labelbase.models import Label
+        from .models import Hashtag
+        from .receivers import update_name_token, update_label_hashtags
+
+        pre_save.connect(update_name_token, sender=Hashtag, dispatch_uid="update_name_token")
+        post_save.connect(update_label_hashtags, sender=Label, dispatch_uid="update_label_hashtags")
@@ -0,0 +1,82 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:48
+
+import hashlib
+import hmac
+import re
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Copies of the code of this migration's time, so later changes of
+# hashtags.utils, labellabor.utils and shared.encryption don't change what
+# it does.
+HASHTAG_RE = re.compile(r'#(\w+)')
+
+
+def extract_hashtags(value):
+    return list(dict.fromkeys(HASHTAG_RE.findall(value or "")))
+
+
+def get_blind_index_key():
+    kdf = PBKDF2HMAC(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt="{}blind-index".format(settings.CRYPTOGRAPHY_SALT).encode(),
+        iterations=100000,
+        backend=default_backend()
+    )
+    return kdf.derive(settings.SECRET_KEY.encode())
+
+
+def hashtag_token(blind_index_key, name):
+    msg = "{}\x1f{}\x1f{}".format("hashtag", "v", name).encode()
+    return hmac.new(blind_index_key, msg, hashlib.sha256).hexdigest()[:16]
+
+
+def link_existing_hashtags(apps, schema_editor):
+    Hashtag = apps.get_model('hashtags', 'Hashtag')
+    Label = apps.get_model('labelbase', 'Label')
+
+    blind_index_key = get_blind_index_key()
+    known = {}
+    for hashtag in Hashtag.objects.all().order_by('id'):
+        hashtag.name_token = hashtag_token(blind_index_key, hashtag.name)
+        hashtag.save(update_fields=['name_token'])
+        known.setdefault((hashtag.labelbase_id, hashtag.name_token), hashtag)
+
+    for label in Label.objects.all().order_by('id').iterator():
+        hashtags = []
+        for name in extract_hashtags(label.label):
+            key = (label.labelbase_id, hashtag_token(blind_index_key, name))
+            if key not in known:
+                known[key] = Hashtag.objects.create(labelbase_id=label.labelbase_id,
+                                                    name=name, name_token=key[1])
+            hashtags.append(known[key])
+        if hashtags:
+            label.hashtags.set(hashtags)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('labelbase', '0013_labelsearchtoken'),
+        ('hashtags', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hashtag',
+            name='labels',
+            field=models.ManyToManyField(blank=True, related_name='hashtags', to='labelbase.Label'),
+        ),
+        migrations.AddField(
+            model_name='hashtag',
+            name='name_token',
+            field=models.CharField(blank=True, db_index=True, max_length=16),
+        ),
+        migrations.RunPython(link_existing_hashtags, migrations.RunPython.noop),
+    ]
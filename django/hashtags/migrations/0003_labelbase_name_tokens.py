@@ -0,0 +1,51 @@
+# Generated by Django 3.2.25 on 2026-10-18 21:10
+
+import hashlib
+import hmac
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from django.conf import settings
+from django.db import migrations
+
+
+# Copies of hashtags.utils.hashtag_token and shared.encryption of this
+# migration's time, so later changes of them don't change what this
+# migration does.
+def get_blind_index_key():
+    kdf = PBKDF2HMAC(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt="{}blind-index".format(settings.CRYPTOGRAPHY_SALT).encode(),
+        iterations=100000,
+        backend=default_backend()
+    )
+    return kdf.derive(settings.SECRET_KEY.encode())
+
+
+def hashtag_token(blind_index_key, labelbase_id, name):
+    msg = "labelbase\x1f{}".format(labelbase_id).encode()
+    labelbase_key = hmac.new(blind_index_key, msg, hashlib.sha256).digest()
+    msg = "{}\x1f{}\x1f{}".format("hashtag", "v", name).encode()
+    return hmac.new(labelbase_key, msg, hashlib.sha256).hexdigest()[:16]
+
+
+def rekey_hashtags(apps, schema_editor):
+    Hashtag = apps.get_model('hashtags', 'Hashtag')
+
+    blind_index_key = get_blind_index_key()
+    for hashtag in Hashtag.objects.all().order_by('id').iterator():
+        hashtag.name_token = hashtag_token(blind_index_key, hashtag.labelbase_id, hashtag.name)
+        hashtag.save(update_fields=['name_token'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hashtags', '0002_hashtag_labels'),
+    ]
+
+    operations = [
+        migrations.RunPython(rekey_hashtags, migrations.RunPython.noop),
+    ]
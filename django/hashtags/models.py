@@ -2,7 +2,7 @@ from django.db import models
 from django.contrib.auth.models import User
 from django_cryptography.fields import encrypt
 from django.urls import reverse
-from labelbase.models import Labelbase
+from labelbase.models import Labelbase, Label
 
 class Hashtag(models.Model):
     labelbase = models.ForeignKey(Labelbase, on_delete=models.CASCADE)
@@ -15,5 +15,10 @@ class Hashtag(models.Model):
     )
     description = encrypt(models.TextField(default="", blank=True))
 
+    # Blind index of the name, see hashtags.utils.hashtag_token
+    name_token = models.CharField(max_length=16, blank=True, db_index=True)
+
+    labels = models.ManyToManyField(Label, related_name="hashtags", blank=True)
+
     def get_absolute_url(self):
         return reverse('hashtag_edit', kwargs={'pk': self.pk})
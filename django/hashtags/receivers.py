@@ -0,0 +1,15 @@
+from .utils import hashtag_token, index_label_hashtags
+
+
+def update_name_token(sender, instance, **kwargs):
+    instance.name_token = hashtag_token(instance.labelbase_id, instance.name)
+
+
+def update_label_hashtags(sender, instance, raw=False, **kwargs):
+    """
+    Keeps the Hashtag <-> Label links in sync with the label text. Links of
+    deleted labels are removed by the database together with the label.
+    """
+    if raw:
+        return
+    index_label_hashtags(instance)
@@ -0,0 +1,29 @@
+from labelbase.blind_index import compute_token, get_labelbase_key, KIND_VALUE
+from labellabor.utils import extract_hashtags
+
+
+def hashtag_token(labelbase_id, name):
+    """
+    Hashtags are case sensitive, the token is computed from the name as is.
+    """
+    return compute_token("hashtag", KIND_VALUE, name, get_labelbase_key(labelbase_id))
+
+
+def index_label_hashtags(label):
+    """
+    Links ``label`` to the hashtags used in its text, unknown hashtags
+    are created in the label's labelbase.
+    """
+    from .models import Hashtag
+
+    tokens = {hashtag_token(label.labelbase_id, name): name for name in extract_hashtags(label.label)}
+    hashtags = {
+        hashtag.name_token: hashtag
+        for hashtag in Hashtag.objects.filter(labelbase_id=label.labelbase_id,
+                                              name_token__in=tokens)
+    }
+    for token, name in tokens.items():
+        if token not in hashtags:
+            hashtags[token] = Hashtag.objects.create(labelbase_id=label.labelbase_id,
+                                                     name=name)
+    label.hashtags.set(hashtags.values())
@@ -1,30 +1,14 @@
 from django.views.generic import ListView
 from django.views.generic.edit import UpdateView
-from django.views import View
-from django.http import HttpResponseForbidden, HttpResponseRedirect
+from django.http import HttpResponseForbidden
 from django.urls import reverse
 from django.shortcuts import get_object_or_404
-from django.contrib import messages
+from django.db.models import Count
 
 from labelbase.models import Labelbase
-from .tasks import store_hashtags_as_objects
 from .models import Hashtag
 
 
-class LabelbaseProxyView(View):
-    def get(self, request, *args, **kwargs):
-        labelbase_id = kwargs.get('labelbase_id')
-        labelbase = get_object_or_404(Labelbase, id=labelbase_id,
-                                        user_id=request.user.id)
-        if request.GET.get('sync', 'no') == 'yes':
-            store_hashtags_as_objects(labelbase_id)
-            messages.add_message(
-                request,
-                messages.INFO,
-                "<strong>Processing Hashtags!</strong> Please wait briefly and refresh your page.", 
-            )
-        return HttpResponseRedirect(labelbase.get_hashtags_url())
-
 class HashtagListView(ListView):
     model = Hashtag
     template_name = 'hashtags/labelbase_list.html'
@@ -35,7 +19,9 @@ class HashtagListView(ListView):
             Labelbase, id=labelbase_id, user_id=self.request.user.id
         )
         queryset = Hashtag.objects.filter(labelbase_id=labelbase_id,
-                                        labelbase__user_id=self.request.user.id).order_by('-name')
+                                        labelbase__user_id=self.request.user.id
+                                        ).annotate(label_count=Count('labels')
+                                        ).order_by('-label_count', 'id')
         return queryset
 
     def get_context_data(self, **kwargs):
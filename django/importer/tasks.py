@@ -83,12 +83,13 @@ def process_uploaded_data(uploaded_data_id, passphrase=None, loop=None):
             csv_file_path = fp.name
             mempool_api = labelbase.get_mempool_api()
             from .pocket import validate_csv_format, parse_csv_to_json
+            from finances.tx_store import get_mempool_transaction
             if validate_csv_format(csv_file_path):
                 for item in parse_csv_to_json(csv_file_path):
                     label = "Got {} {} for {:.2f} {} with reference: {} #Pocket".format(item[0].get('outSellAmount'), item[1].get(
                         'inBuyAsset'), decimal.Decimal(item[2].get('inBuyAmount')), item[2].get('inBuyAsset'), item[1].get('operationId'))
                     txid = item[0].get('operationId')
-                    tx = mempool_api.get_transaction(txid)
+                    tx = get_mempool_transaction(mempool_api, txid)
                     potential_utxos = []
                     vouts = tx.get("vout", [])
                     for i in range(len(vouts)):
@@ -8,6 +8,7 @@ from rest_framework.views import APIView
 
 from labelbase.models import Labelbase, Label
 from labelbase.serializers import LabelbaseSerializer, LabelSerializer
+from finances.coin_selection import plan_for_labelbase
 
 
 import logging
@@ -135,3 +136,23 @@ class LabelAPIView(APIView):
         )
         label.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class CoinSelectionAPIView(APIView):
+    """
+    Coin selection
+    """
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [TokenAuthentication]
+
+    def get(self, request, labelbase_id):
+        """
+        Plan which spendable outputs to spend (mode=spend, target in sats)
+        or to consolidate (mode=consolidate) at fee_rate sats per vbyte.
+        """
+        labelbase = get_object_or_404(Labelbase, id=labelbase_id, user_id=request.user.id)
+        try:
+            plan = plan_for_labelbase(labelbase, request.query_params)
+        except ValueError as ex:
+            return Response({"error": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(plan)
@@ -7,9 +7,20 @@ class LabelbaseConfig(AppConfig):
 
     def ready(self):
         from django.db.models.signals import pre_save, post_save
+        from finances.models import OutputStat
         from .models import Label
         from .receivers import update_type_ref_hash
+        from .receivers import update_output_stat, link_output_stat_labels
+        from .receivers import update_fiat_value
+        from .receivers import compute_search_tokens, update_search_tokens
+        from .receivers import update_labelbase_version
         from .receivers import trigger_electrumx_checkup
 
         pre_save.connect(update_type_ref_hash, sender=Label, dispatch_uid="update_type_ref_hash")
+        pre_save.connect(update_output_stat, sender=Label, dispatch_uid="update_output_stat")
+        pre_save.connect(update_fiat_value, sender=Label, dispatch_uid="update_fiat_value")
+        pre_save.connect(compute_search_tokens, sender=Label, dispatch_uid="compute_search_tokens")
+        post_save.connect(update_search_tokens, sender=Label, dispatch_uid="update_search_tokens")
+        post_save.connect(update_labelbase_version, sender=Label, dispatch_uid="update_labelbase_version")
         post_save.connect(trigger_electrumx_checkup, sender=Label, dispatch_uid="trigger_electrumx_checkup")
+        post_save.connect(link_output_stat_labels, sender=OutputStat, dispatch_uid="link_output_stat_labels")
@@ -0,0 +1,138 @@
+"""
+Keyed blind index for the encrypted ``Label`` fields.
+
+``ref``, ``label`` and ``origin`` are stored encrypted, so the database can't
+search them. Instead we store HMAC tokens (see ``LabelSearchToken``) of
+
+* the whole normalized value,
+* all n-grams of one to ``NGRAM_SIZE`` characters of the normalized value,
+
+keyed with a secret derived from ``SECRET_KEY`` and the labelbase, so equal
+values in different labelbases have different tokens. A search computes the
+same tokens for the query and becomes an indexed join, no decryption
+involved.
+
+A label matches if it has all n-grams of the query, of ``NGRAM_SIZE``
+characters or of the length of shorter queries. They may be in different
+places of the value, such false positives are accepted.
+"""
+import hashlib
+import hmac
+from functools import lru_cache
+
+from django.db.models import Count
+
+from shared.encryption import blind_index_key
+
+
+SEARCHABLE_FIELDS = ("ref", "label", "origin")
+
+NGRAM_SIZE = 3
+TOKEN_LENGTH = 16  # hex chars, 64 bits
+
+KIND_VALUE = "v"
+KIND_NGRAM = "g"
+
+
+def normalize(value):
+    return " ".join((value or "").lower().split())
+
+
+@lru_cache(maxsize=1024)
+def get_labelbase_key(labelbase_id):
+    msg = "labelbase\x1f{}".format(labelbase_id).encode()
+    return hmac.new(blind_index_key, msg, hashlib.sha256).digest()
+
+
+def compute_token(field, kind, value, key=blind_index_key):
+    msg = "{}\x1f{}\x1f{}".format(field, kind, value).encode()
+    return hmac.new(key, msg, hashlib.sha256).hexdigest()[:TOKEN_LENGTH]
+
+
+def _ngrams(value, size=NGRAM_SIZE):
+    return {value[i:i + size] for i in range(len(value) - size + 1)}
+
+
+def value_tokens(labelbase_id, field, value):
+    """
+    Returns the set of tokens stored for ``value`` of the given field.
+    """
+    value = normalize(value)
+    if not value:
+        return set()
+    key = get_labelbase_key(labelbase_id)
+    tokens = {compute_token(field, KIND_VALUE, value, key)}
+    for size in range(1, NGRAM_SIZE + 1):
+        tokens.update(compute_token(field, KIND_NGRAM, g, key) for g in _ngrams(value, size))
+    return tokens
+
+
+def query_tokens(labelbase_id, field, query):
+    """
+    Returns the tokens a field value must contain to match ``query``.
+    """
+    query = normalize(query)
+    if not query:
+        return set()
+    key = get_labelbase_key(labelbase_id)
+    return {compute_token(field, KIND_NGRAM, g, key)
+            for g in _ngrams(query, min(len(query), NGRAM_SIZE))}
+
+
+def label_tokens(label):
+    """
+    Returns ``{(field, token), ...}`` for all searchable fields of ``label``.
+    """
+    return {(field, token)
+            for field in SEARCHABLE_FIELDS
+            for token in value_tokens(label.labelbase_id, field, getattr(label, field))}
+
+
+def index_label(label, tokens=None):
+    """
+    Brings the stored tokens of ``label`` in line with its current values,
+    only the difference is written.
+    """
+    from .models import LabelSearchToken
+
+    if tokens is None:
+        tokens = label_tokens(label)
+    existing = set(LabelSearchToken.objects.filter(
+        label_id=label.id, labelbase_id=label.labelbase_id
+    ).values_list("field", "token"))
+    stale = existing - tokens
+    if stale:
+        LabelSearchToken.objects.filter(
+            label_id=label.id, token__in=[token for _, token in stale]
+        ).delete()
+    # tokens left behind by a move to another labelbase
+    LabelSearchToken.objects.filter(label_id=label.id).exclude(
+        labelbase_id=label.labelbase_id).delete()
+    LabelSearchToken.objects.bulk_create([
+        LabelSearchToken(label_id=label.id, labelbase_id=label.labelbase_id,
+                         field=field, token=token)
+        for field, token in tokens - existing
+    ], ignore_conflicts=True)
+
+
+def search_label_ids(labelbase_id, query, fields=SEARCHABLE_FIELDS):
+    """
+    Returns a ``label_id`` values queryset of labels in the labelbase where
+    any of ``fields`` matches ``query``, meant to be used as a subquery.
+    """
+    from .models import LabelSearchToken
+
+    tokens = set()
+    required = 0
+    for field in fields:
+        field_tokens = query_tokens(labelbase_id, field, query)
+        required = len(field_tokens)
+        tokens.update(field_tokens)
+    if not tokens:
+        return LabelSearchToken.objects.none().values("label_id")
+    return LabelSearchToken.objects.filter(
+        labelbase_id=labelbase_id, token__in=tokens
+    ).values("label_id", "field").annotate(
+        matches=Count("token")
+    ).filter(matches=required).values("label_id")
+
@@ -0,0 +1,375 @@
+"""
+Per worker cache of decrypted labels.
+
+Decrypting a labelbase is the expensive part of most pages, so the plaintext
+of all labels of a labelbase can be kept in memory as ``LabelRow`` tuples.
+Entries are keyed by labelbase id, ``Labelbase.version``, which is bumped
+on every label save, and the number of labels, which changes on deletes (a
+delete receiver would make cascading deletes of a labelbase very slow). A
+changed labelbase is a cache miss, except for the save of one label in
+this worker, which updates its row and orderings in place (see
+``update_cached_label``).
+
+The cache is opt-in (``LABEL_CACHE_ENABLED``) as it keeps plaintext in the
+memory of the web workers, ``LABEL_CACHE_MAX_BYTES`` bounds it per worker.
+Sorted orderings of the label ids (see ``get_label_ordering``) and the
+materialized results of filters (see ``materialize_label_ids``) are
+derived from the plaintext and only cached if it is enabled too. Without
+the cache, labels are ordered by their plain fields only, in the database.
+"""
+import bisect
+import sys
+import threading
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+
+
+LABEL_ROW_FIELDS = ("id", "type", "ref", "label", "origin", "spendable",
+                    "type_ref_hash", "height", "time", "fee", "value", "rate",
+                    "keypath", "fmv", "heights", "fiat_value", "fiat_currency")
+
+# Not encrypted, orderings by them come from the database if the cache is off
+PLAIN_FIELDS = ("id", "type", "type_ref_hash")
+
+
+class LabelRow(namedtuple("LabelRow", LABEL_ROW_FIELDS)):
+    """
+    Decrypted, read-only stand-in for a ``Label``.
+    """
+    __slots__ = ()
+
+    def get_type_display(self):
+        from .models import Label
+        return dict(Label.TYPE_CHOICES).get(self.type, self.type)
+
+
+def estimate_size(rows):
+    size = sys.getsizeof(rows)
+    for row in rows:
+        size += sys.getsizeof(row)
+        if isinstance(row, tuple):
+            size += sum(sys.getsizeof(value) for value in row if isinstance(value, str))
+    return size
+
+
+class LabelCache:
+    """
+    LRU of ``key -> (version, value)``, bounded by an estimate of the memory
+    used by the values. Keys are labelbase ids for the decrypted rows and
+    tuples starting with the labelbase id for data derived from them.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, version, value):
+        size = estimate_size(value)
+        with self._lock:
+            self._discard(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (version, value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+
+    def update_label(self, labelbase_id, version, new_version, row):
+        """
+        Moves the entries of the labelbase at ``version`` to ``new_version``
+        with ``row`` written: it replaces or is added to the rows and is
+        moved to its place in the orderings. Materialized filters can't be
+        re-evaluated for one label and are dropped, as are all entries if
+        the rows aren't cached at ``version``.
+        """
+        with self._lock:
+            entry = self._entries.get(labelbase_id)
+            keys = [key for key in self._entries if isinstance(key, tuple) and key[0] == labelbase_id]
+            if entry is None or entry[0] != version:
+                for key in keys + [labelbase_id]:
+                    self._discard(key)
+                return
+
+            rows = list(entry[1])
+            i = bisect.bisect_left([other.id for other in rows], row.id)
+            if i < len(rows) and rows[i].id == row.id:
+                rows[i] = row
+            else:
+                rows.insert(i, row)
+            rows = tuple(rows)
+            self._replace(labelbase_id, new_version, rows)
+
+            by_id = None
+            for key in keys:
+                key_entry = self._entries[key]
+                if key[1] != "ordering" or key_entry[0] != version:
+                    self._discard(key)
+                    continue
+                if by_id is None:
+                    by_id = {other.id: other for other in rows}
+                order = key[2]
+                row_key = _order_key(row, order)
+                ids = [label_id for label_id in key_entry[1] if label_id != row.id]
+                position = next((j for j, label_id in enumerate(ids)
+                                 if row_key < _order_key(by_id[label_id], order)), len(ids))
+                ids.insert(position, row.id)
+                self._replace(key, new_version, tuple(ids))
+
+    def invalidate(self, labelbase_id):
+        """
+        Drops the rows and all derived entries of the labelbase.
+        """
+        with self._lock:
+            for key in list(self._entries):
+                if key == labelbase_id or (isinstance(key, tuple) and key[0] == labelbase_id):
+                    self._discard(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _replace(self, key, version, value):
+        self._discard(key)
+        size = estimate_size(value)
+        self._entries[key] = (version, value, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            self._discard(next(iter(self._entries)))
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+
+label_cache = LabelCache(settings.LABEL_CACHE_MAX_BYTES)
+
+
+def make_label_row(label):
+    return LabelRow(*[getattr(label, field) for field in LABEL_ROW_FIELDS])
+
+
+def load_label_rows(labelbase_id):
+    from .models import Label
+
+    return tuple(
+        make_label_row(label)
+        for label in Label.objects.filter(labelbase_id=labelbase_id).order_by("id")
+    )
+
+
+def get_labelbase_version(labelbase_id):
+    from django.db.models import Count
+    from .models import Labelbase
+
+    return Labelbase.objects.filter(id=labelbase_id).annotate(
+        label_count=Count("label")).values_list("version", "label_count").first()
+
+
+def get_label_rows(labelbase_id, version=None):
+    """
+    Returns the decrypted labels of the labelbase as ``LabelRow`` tuples,
+    ordered by id. ``version`` saves a query when the caller already has
+    the result of ``get_labelbase_version``.
+    """
+    if not settings.LABEL_CACHE_ENABLED:
+        return load_label_rows(labelbase_id)
+
+    if version is None:
+        version = get_labelbase_version(labelbase_id)
+
+    rows = label_cache.get(labelbase_id, version)
+    if rows is None:
+        rows = load_label_rows(labelbase_id)
+        label_cache.put(labelbase_id, version, rows)
+    return rows
+
+
+def _sort_key(value):
+    # NULLs first like MySQL, strings case insensitive like its collation
+    if isinstance(value, str):
+        value = value.casefold()
+    return (value is not None, value)
+
+
+class _Descending:
+    __slots__ = ("key",)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+    def __lt__(self, other):
+        return other.key < self.key
+
+
+def _order_key(row, order):
+    """The position of ``row`` in the ordering ``order``, as a sort key."""
+    key = []
+    for field, descending in order:
+        value = _sort_key(row[LABEL_ROW_FIELDS.index(field)])
+        key.append(_Descending(value) if descending else value)
+    key.append(row.id)
+    return tuple(key)
+
+
+def sort_label_ids(rows, order):
+    """
+    Returns the ids of ``rows`` sorted by ``order``, a sequence of
+    ``(field, descending)`` pairs. Ties are broken by ascending id.
+    """
+    index = [LABEL_ROW_FIELDS.index(field) for field, _ in order]
+    rows = sorted(rows, key=lambda row: row.id)
+    for i, (_, descending) in reversed(list(zip(index, order))):
+        rows.sort(key=lambda row: _sort_key(row[i]), reverse=descending)
+    return tuple(row.id for row in rows)
+
+
+def plain_order_by(order):
+    """
+    Returns the ``order_by`` arguments of the plain fields of ``order``, the
+    encrypted ones can't be ordered by in the database.
+    """
+    return ["-" + field if descending else field
+            for field, descending in order if field in PLAIN_FIELDS] + ["id"]
+
+
+def get_label_ordering(labelbase_id, order, version=None):
+    """
+    Returns all label ids of the labelbase sorted by the plaintext of
+    ``order`` (see ``sort_label_ids``), so a page of any depth is a slice.
+    Without the cache they are sorted by the plain fields of ``order`` only.
+    """
+    order = tuple((field, bool(descending)) for field, descending in order)
+    if not settings.LABEL_CACHE_ENABLED:
+        from .models import Label
+
+        return tuple(Label.objects.filter(labelbase_id=labelbase_id).order_by(
+            *plain_order_by(order)).values_list("id", flat=True))
+
+    if version is None:
+        version = get_labelbase_version(labelbase_id)
+    key = (labelbase_id, "ordering", order)
+
+    ids = label_cache.get(key, version)
+    if ids is None:
+        ids = sort_label_ids(get_label_rows(labelbase_id, version), order)
+        label_cache.put(key, version, ids)
+    return ids
+
+
+class LabelIdSet:
+    """
+    Materialized, ordered ids of the labels of a labelbase which match a
+    filter. It is computed once per labelbase version (see
+    ``materialize_label_ids``) and paged by slicing, so a filtered view is
+    never re-queried with a large ``id__in``.
+    """
+    __slots__ = ("ids",)
+
+    def __init__(self, ids):
+        self.ids = tuple(ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __sizeof__(self):
+        return sys.getsizeof(self.ids)
+
+    def ordered(self, ordering):
+        """
+        Returns the ids in the order of ``ordering``, see ``get_label_ordering``.
+        """
+        members = frozenset(self.ids)
+        return LabelIdSet(label_id for label_id in ordering if label_id in members)
+
+    def page(self, start=0, length=None):
+        if length is None or length == -1:
+            return self.ids[start:]
+        return self.ids[start:start + length]
+
+    def labels(self, queryset, start=0, length=None):
+        """
+        Returns the ``Label`` objects of a page, fetched from ``queryset``
+        (which should restrict the labels to the owner) in one query.
+        """
+        ids = self.page(start, length)
+        labels = queryset.in_bulk(ids)
+        return [labels[label_id] for label_id in ids if label_id in labels]
+
+
+def materialize_label_ids(labelbase_id, key, build, version=None):
+    """
+    Returns the ``LabelIdSet`` of the ids returned by ``build()``, cached
+    under ``key`` (any hashable describing the filter) until the next
+    label write in the labelbase.
+    """
+    if not settings.LABEL_CACHE_ENABLED:
+        return LabelIdSet(build())
+
+    if version is None:
+        version = get_labelbase_version(labelbase_id)
+    key = (labelbase_id, "ids", key)
+
+    id_set = label_cache.get(key, version)
+    if id_set is None:
+        id_set = LabelIdSet(build())
+        label_cache.put(key, version, id_set)
+    return id_set
+
+
+def bump_labelbase_version(labelbase_id):
+    from django.db.models import F
+    from .models import Labelbase
+
+    Labelbase.objects.filter(id=labelbase_id).update(version=F("version") + 1)
+
+
+def update_cached_label(label, created):
+    """
+    Writes ``label``, just saved and the version of its labelbase bumped,
+    into the cached rows and orderings of this worker, so the next page
+    doesn't decrypt the whole labelbase again.
+    """
+    from .models import Label
+
+    if not settings.LABEL_CACHE_ENABLED:
+        return
+    version = get_labelbase_version(label.labelbase_id)
+    if version is None:
+        return
+    # as loaded from the database, like the other rows
+    row = make_label_row(Label.objects.get(id=label.id))
+    previous = (version[0] - 1, version[1] - (1 if created else 0))
+    label_cache.update_label(label.labelbase_id, previous, version, row)
@@ -0,0 +1,63 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from labelbase.models import Label, Labelbase
+from labellabor.views import LabelbaseDatatableView
+
+
+class TimedLabelbaseDatatableView(LabelbaseDatatableView):
+    render_time = 0
+
+    def prepare_results(self, qs):
+        started = time.perf_counter()
+        data = super().prepare_results(qs)
+        TimedLabelbaseDatatableView.render_time = time.perf_counter() - started
+        return data
+
+
+class Command(BaseCommand):
+    help = "Measure the time to serve and render pages of the label table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('labelbase_id', type=int)
+        parser.add_argument('--length', type=int, default=100)
+        parser.add_argument('--pages', type=int, default=5)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        labelbase = Labelbase.objects.filter(id=options['labelbase_id']).first()
+        if labelbase is None:
+            raise CommandError("Labelbase {} does not exist.".format(options['labelbase_id']))
+        count = Label.objects.filter(labelbase_id=labelbase.id).count()
+        length = options['length']
+        self.stdout.write("{} labels in labelbase {}, {} rows per page".format(
+            count, labelbase.id, length))
+
+        view = TimedLabelbaseDatatableView.as_view()
+        factory = RequestFactory()
+        last_page = max(count - 1, 0) // length
+        pages = sorted({round(last_page * i / max(options['pages'] - 1, 1))
+                        for i in range(options['pages'])})
+        for page in pages:
+            request = factory.get("/", {
+                "draw": 1, "start": page * length, "length": length,
+                "order[0][column]": 2, "order[0][dir]": "asc",
+            })
+            request.user = labelbase.user
+            best_total, best_render, queries = None, None, 0
+            for _ in range(options['repeat']):
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    view(request, labelbase_id=labelbase.id)
+                    total = time.perf_counter() - started
+                render = TimedLabelbaseDatatableView.render_time
+                best_total = total if best_total is None else min(best_total, total)
+                best_render = render if best_render is None else min(best_render, render)
+                queries = len(captured.captured_queries)
+            self.stdout.write(
+                "page {}: {:.1f} ms total, {:.1f} ms rendering, {} queries".format(
+                    page, best_total * 1000, best_render * 1000, queries))
@@ -0,0 +1,64 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from labelbase.models import Label, Labelbase
+from labelbase.blind_index import search_label_ids
+
+
+def scan_label_ids(labelbase_id, search):
+    """
+    The search as it used to be done: decrypt everything, compare in Python.
+    """
+    res_ids = []
+    search = search.lower()
+    for record in Label.objects.filter(labelbase_id=labelbase_id):
+        for value in (record.ref, record.label, record.origin):
+            if value and search in value.lower():
+                res_ids.append(record.id)
+                break
+    return set(res_ids)
+
+
+def index_label_ids(labelbase_id, search):
+    return set(Label.objects.filter(
+        labelbase_id=labelbase_id,
+        id__in=search_label_ids(labelbase_id, search)
+    ).values_list("id", flat=True))
+
+
+class Command(BaseCommand):
+    help = "Compare the blind index search with a full decrypting scan."
+
+    def add_arguments(self, parser):
+        parser.add_argument('labelbase_id', type=int)
+        parser.add_argument('queries', nargs='+')
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def _best_of(self, repeat, func, *args):
+        best, result = None, None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = func(*args)
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
+
+    def handle(self, *args, **options):
+        labelbase_id = options['labelbase_id']
+        if not Labelbase.objects.filter(id=labelbase_id).exists():
+            raise CommandError("Labelbase {} does not exist.".format(labelbase_id))
+        self.stdout.write("{} labels in labelbase {}".format(
+            Label.objects.filter(labelbase_id=labelbase_id).count(), labelbase_id))
+
+        for query in options['queries']:
+            scan_time, scan_ids = self._best_of(
+                options['repeat'], scan_label_ids, labelbase_id, query)
+            index_time, index_ids = self._best_of(
+                options['repeat'], index_label_ids, labelbase_id, query)
+            self.stdout.write(
+                "{!r}: scan {:.1f} ms ({} hits), index {:.1f} ms ({} hits), "
+                "{} only in scan, {} only in index".format(
+                    query, scan_time * 1000, len(scan_ids),
+                    index_time * 1000, len(index_ids),
+                    len(scan_ids - index_ids), len(index_ids - scan_ids)))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+
+from labelbase.models import Label
+from labelbase.blind_index import index_label
+from labelbase.label_cache import bump_labelbase_version
+from hashtags.utils import index_label_hashtags
+
+
+class Command(BaseCommand):
+    help = ("Rebuild the data derived from encrypted label fields, "
+            "e.g. for labels stored before the search index existed.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--labelbase', type=int, default=None, dest='labelbase_id',
+            help='Only reindex the labels of this labelbase',
+        )
+
+    def handle(self, *args, **options):
+        labels = Label.objects.all().order_by("id")
+        if options['labelbase_id']:
+            labels = labels.filter(labelbase_id=options['labelbase_id'])
+
+        count = 0
+        batch = []
+        labelbase_ids = set()
+        for label in labels.iterator(chunk_size=1000):
+            labelbase_ids.add(label.labelbase_id)
+            index_label(label)
+            index_label_hashtags(label)
+            label.update_fiat_value()
+            batch.append(label)
+            count += 1
+            if count % 1000 == 0:
+                Label.objects.bulk_update(batch, ["fiat_value", "fiat_currency"])
+                batch = []
+                self.stdout.write("{} labels reindexed".format(count))
+        Label.objects.bulk_update(batch, ["fiat_value", "fiat_currency"])
+        # bulk_update skips post_save, the cached rows have the old values
+        for labelbase_id in labelbase_ids:
+            bump_labelbase_version(labelbase_id)
+        self.stdout.write(self.style.SUCCESS("Reindexed {} labels.".format(count)))
@@ -0,0 +1,32 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('labelbase', '0012_auto_20251122_0800'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LabelSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(max_length=16)),
+                ('token', models.CharField(max_length=16)),
+                ('label', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='labelbase.label')),
+                ('labelbase', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='labelbase.labelbase')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='labelsearchtoken',
+            index=models.Index(fields=['labelbase', 'token'], name='labelbase_l_labelba_16da36_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='labelsearchtoken',
+            unique_together={('label', 'token')},
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('labelbase', '0013_labelsearchtoken'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='labelbase',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
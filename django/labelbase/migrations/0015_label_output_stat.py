@@ -0,0 +1,38 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def link_existing_output_stats(apps, schema_editor):
+    Label = apps.get_model('labelbase', 'Label')
+    OutputStat = apps.get_model('finances', 'OutputStat')
+
+    output_stats = {
+        (user_id, type_ref_hash, network): output_stat_id
+        for output_stat_id, user_id, type_ref_hash, network in OutputStat.objects.order_by(
+            'id').values_list('id', 'user_id', 'type_ref_hash', 'network')
+    }
+    labels = Label.objects.filter(type='output').values_list(
+        'id', 'labelbase__user_id', 'type_ref_hash', 'labelbase__network')
+    for label_id, user_id, type_ref_hash, network in labels.iterator():
+        output_stat_id = output_stats.get((user_id, type_ref_hash, network))
+        if output_stat_id:
+            Label.objects.filter(id=label_id).update(output_stat_id=output_stat_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finances', '0012_auto_20240701_0932'),
+        ('labelbase', '0014_labelbase_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='label',
+            name='output_stat',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='labels', to='finances.outputstat'),
+        ),
+        migrations.RunPython(link_existing_output_stats, migrations.RunPython.noop),
+    ]
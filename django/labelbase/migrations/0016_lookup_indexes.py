@@ -0,0 +1,21 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('labelbase', '0015_label_output_stat'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='label',
+            index=models.Index(fields=['labelbase', 'type'], name='labelbase_l_labelba_6ab4bc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='label',
+            index=models.Index(fields=['labelbase', 'type_ref_hash'], name='labelbase_l_labelba_21aa5d_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:15
+
+from django.db import migrations, models
+import django_cryptography.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('labelbase', '0016_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='label',
+            name='fiat_currency',
+            field=django_cryptography.fields.encrypt(models.CharField(blank=True, default='', editable=False, max_length=3)),
+        ),
+        migrations.AddField(
+            model_name='label',
+            name='fiat_value',
+            field=django_cryptography.fields.encrypt(models.DecimalField(blank=True, decimal_places=10, editable=False, max_digits=30, null=True)),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 3.2.25 on 2026-10-18 21:10
+
+import hashlib
+import hmac
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from django.conf import settings
+from django.db import migrations
+
+
+# Copies of labelbase.blind_index and shared.encryption of this migration's
+# time, so later changes of them don't change what this migration does.
+SEARCHABLE_FIELDS = ("ref", "label", "origin")
+NGRAM_SIZE = 3
+TOKEN_LENGTH = 16
+
+
+def get_blind_index_key():
+    kdf = PBKDF2HMAC(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt="{}blind-index".format(settings.CRYPTOGRAPHY_SALT).encode(),
+        iterations=100000,
+        backend=default_backend()
+    )
+    return kdf.derive(settings.SECRET_KEY.encode())
+
+
+def normalize(value):
+    return " ".join((value or "").lower().split())
+
+
+def value_tokens(labelbase_key, field, value):
+    value = normalize(value)
+    if not value:
+        return set()
+    values = {("v", value)}
+    for size in range(1, NGRAM_SIZE + 1):
+        values.update(("g", value[i:i + size]) for i in range(len(value) - size + 1))
+    return {hmac.new(labelbase_key, "{}\x1f{}\x1f{}".format(field, kind, v).encode(),
+                     hashlib.sha256).hexdigest()[:TOKEN_LENGTH]
+            for kind, v in values}
+
+
+def reindex_labels(apps, schema_editor):
+    blind_index_key = get_blind_index_key()
+    Label = apps.get_model('labelbase', 'Label')
+    LabelSearchToken = apps.get_model('labelbase', 'LabelSearchToken')
+
+    LabelSearchToken.objects.all().delete()
+    keys = {}
+    objs = []
+    for label in Label.objects.all().order_by('id').iterator():
+        if label.labelbase_id not in keys:
+            msg = "labelbase\x1f{}".format(label.labelbase_id).encode()
+            keys[label.labelbase_id] = hmac.new(blind_index_key, msg, hashlib.sha256).digest()
+        for field in SEARCHABLE_FIELDS:
+            for token in value_tokens(keys[label.labelbase_id], field, getattr(label, field)):
+                objs.append(LabelSearchToken(labelbase_id=label.labelbase_id, label_id=label.id,
+                                             field=field, token=token))
+        if len(objs) >= 5000:
+            LabelSearchToken.objects.bulk_create(objs, batch_size=1000)
+            objs = []
+    LabelSearchToken.objects.bulk_create(objs, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('labelbase', '0017_label_fiat_value'),
+    ]
+
+    operations = [
+        migrations.RunPython(reindex_labels, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,5 @@
+from decimal import Decimal
+
 from django.db import models
 from django.contrib.auth.models import User
 from django.urls import reverse
@@ -91,6 +93,9 @@ class Labelbase(models.Model):
         help_text="Choose the network for this labelbase."
     )
 
+    # Bumped on every label write, see labelbase/label_cache.py
+    version = models.PositiveIntegerField(default=0, editable=False)
+
     @property
     def is_mainnet(self):
         return self.network == self.MAINNET
@@ -99,13 +104,13 @@ class Labelbase(models.Model):
     def is_testnet(self):
         return self.network == self.TESTNET
 
-    def get_mempool_api(self):
+    def get_mempool_endpoint(self):
         if self.network != "mainnet":
-            mempool_endpoint = \
-                "{}/{}".format(self.user.profile.mempool_endpoint, self.network)
-        else:
-            mempool_endpoint = self.user.profile.mempool_endpoint
-        return MempoolAPI(api_base_url="{}{}".format(mempool_endpoint, "/api/"))
+            return "{}/{}".format(self.user.profile.mempool_endpoint, self.network)
+        return self.user.profile.mempool_endpoint
+
+    def get_mempool_api(self):
+        return MempoolAPI(api_base_url="{}{}".format(self.get_mempool_endpoint(), "/api/"))
 
     def get_absolute_url(self):
         return reverse("labelbase", args=[self.id])
@@ -190,6 +195,17 @@ class Label(models.Model):
         max_length=64,
         blank=True)
 
+    # Stats of an output label, maintained by receivers (see receivers.py)
+    # so finance views can select_related them.
+    output_stat = models.ForeignKey(
+        OutputStat,
+        null=True,
+        blank=True,
+        editable=False,
+        on_delete=models.SET_NULL,
+        related_name="labels"
+    )
+
     # All additional fields (from the BIP-329 upgrade) encrypted for maximum privacy
     height = encrypt(
         models.CharField(
@@ -253,18 +269,49 @@ class Label(models.Model):
         )
     )
 
+    # Tracked fiat value parsed from the label when it is saved, see
+    # update_fiat_value and labellabor.utils.extract_fiat_value.
+    fiat_value = encrypt(
+        models.DecimalField(
+            max_digits=30,
+            decimal_places=10,
+            null=True,
+            blank=True,
+            editable=False,
+        )
+    )
+    fiat_currency = encrypt(
+        models.CharField(
+            max_length=3,
+            default="",
+            blank=True,
+            editable=False,
+        )
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["labelbase", "type"]),
+            models.Index(fields=["labelbase", "type_ref_hash"]),
+        ]
+
+    def update_fiat_value(self):
+        value, currency = extract_fiat_value(self.label)
+        self.fiat_value = value if currency else None
+        self.fiat_currency = currency
+
     def get_extracted_fiat_value(self):
-        return extract_fiat_value(self.label)
+        if self.fiat_value is None:
+            return (Decimal(-1), "")
+        return (self.fiat_value, self.fiat_currency)
 
     def get_finance_output_metrics_dict(self):
-        type_ref_hash = compute_type_ref_hash(self.type, self.ref)
-        output, _ = OutputStat.get_or_create_from_api(
-                                user=self.labelbase.user,
-                                type_ref_hash=type_ref_hash,
-                                network=self.labelbase.network)
-
-        val, cur = extract_fiat_value(self.label)
-        return output.output_metrics_dict(tracked_fiat_value=val, fiat_currency=cur)
+        # Templates look up several keys, compute it once per instance.
+        # Views listing many outputs value them at once with value_labels.
+        if getattr(self, "_finance_output_metrics", None) is None:
+            from finances.valuation import value_labels
+            value_labels([self])
+        return self._finance_output_metrics
 
     def get_label_attachment(self):
         type_ref_hash = compute_type_ref_hash(self.type, self.ref)
@@ -282,13 +329,13 @@ class Label(models.Model):
         return self.labelbase.get_absolute_url()
 
 
-    def get_mempool_url(self):
-        if self.labelbase and self.labelbase.network != "mainnet":
-            mempool_endpoint = \
-                "{}/{}".format(self.labelbase.user.profile.mempool_endpoint,
-                               self.labelbase.network)
-        else:
-            mempool_endpoint = self.labelbase.user.profile.mempool_endpoint
+    def get_mempool_url(self, mempool_endpoint=None):
+        """
+        ``mempool_endpoint`` can be passed in when rendering many labels of
+        the same labelbase, see ``Labelbase.get_mempool_endpoint``.
+        """
+        if mempool_endpoint is None:
+            mempool_endpoint = self.labelbase.get_mempool_endpoint()
         try:
             if self.type == "addr":
                 return "{}/address/{}".format(mempool_endpoint, self.ref)
@@ -304,73 +351,13 @@ class Label(models.Model):
     def get_fee_health_status(self):
         """
         Calculate fee health status for this label if it's a spendable unspent output.
+        Views listing many labels compute it for all of them at once with
+        ``finances.fee_health.fee_health_statuses``.
         """
-        # Only calculate for spendable outputs
-        if self.type != self.TYPE_OUTPUT or not self.spendable:
-            return {
-                'status': None,
-                'fee_sats': None,
-                'value_sats': None,
-                'fee_percentage': None,
-                'threshold_healthy': None,
-                'threshold_warning': None,
-                'threshold_high': None
-            }
-
-        try:
-            value_sats = int(self.value) if self.value else None
-        except (ValueError, TypeError):
-            value_sats = None
-
-        if not value_sats or value_sats <= 0:
-            return {
-                'status': None,
-                'fee_sats': None,
-                'value_sats': value_sats,
-                'fee_percentage': None,
-                'threshold_healthy': None,
-                'threshold_warning': None,
-                'threshold_high': None
-            }
-
-        # Get user's fee rate from profile
-        user_fee_rate = self.labelbase.user.profile.my_fee  # sats per vbyte
-        threshold_adjustment = self.labelbase.user.profile.my_fee_rate_threshold  # percentage points
-
-        # Use P2WPKH as default - most common modern type
-        # Simple 1-in, 2-out transaction
-        from finances.tx_math import calculate_transaction_size, calculate_fee
-
-        inputs = [{'input_script': 'P2WPKH'}]
-        output_counts = {'p2wpkh': 2}
-
-        tx_size = calculate_transaction_size(inputs, output_counts)
-        fee_sats = calculate_fee(tx_size['txVBytes'], user_fee_rate)
-
-        # Calculate fee as percentage of output value
-        fee_percentage = (fee_sats / value_sats) * 100
-
-        # Define thresholds (base + user adjustment)
-        threshold_healthy = 1.0 + threshold_adjustment
-        threshold_warning = 3.0 + threshold_adjustment
-
-        # Determine status
-        if fee_percentage < threshold_healthy:
-            status = 'green'
-        elif fee_percentage < threshold_warning:
-            status = 'yellow'
-        else:
-            status = 'red'
-
-        return {
-            'status': status,
-            'fee_sats': fee_sats,
-            'value_sats': value_sats,
-            'fee_percentage': round(fee_percentage, 3),
-            'threshold_healthy': threshold_healthy,
-            'threshold_warning': threshold_warning,
-            'threshold_high': threshold_warning
-        }
+        if getattr(self, "_fee_health", None) is None:
+            from finances.fee_health import fee_health_statuses
+            fee_health_statuses([self])
+        return self._fee_health
 
 
     @property
@@ -388,13 +375,32 @@ class Label(models.Model):
             'yellow': '🟡',
             'red': '🔴'
         }
-        # FIXME: escaping in data tables
-        #status_map = {
-        #    'green': '<span data-feather="circle-check" class="align-text-bottom"></span>',
-        #    'yellow': '<span data-feather="alert-circle" class="align-text-bottom"></span>',
-        #    'red': '<span color:red; data-feather="alert-triangle" class="align-text-bottom"></span>'
-        #}
+        # Plain text, the data tables escape it (LabelbaseHealthDatatableView)
 
         emoji = status_map.get(health['status'], '')
 
         return f"{emoji} {health['fee_percentage']}%"
+
+
+class LabelSearchToken(models.Model):
+    """
+    Blind index entry for one of the encrypted fields of a ``Label``,
+    see ``labelbase.blind_index``.
+    """
+    labelbase = models.ForeignKey(
+        Labelbase,
+        on_delete=models.CASCADE
+    )
+    label = models.ForeignKey(
+        Label,
+        on_delete=models.CASCADE,
+        related_name="search_tokens"
+    )
+    field = models.CharField(max_length=16)
+    token = models.CharField(max_length=16)
+
+    class Meta:
+        unique_together = (("label", "token"),)
+        indexes = [
+            models.Index(fields=["labelbase", "token"]),
+        ]
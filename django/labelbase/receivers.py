@@ -1,4 +1,8 @@
+from django.db.models import F
+
 from .utils import compute_type_ref_hash
+from .blind_index import label_tokens, index_label
+from .label_cache import bump_labelbase_version, update_cached_label
 
 
 def update_type_ref_hash(sender, instance, **kwargs):
@@ -9,6 +13,67 @@ def update_type_ref_hash(sender, instance, **kwargs):
     instance.type_ref_hash = compute_type_ref_hash(instance.type, instance.ref)
 
 
+def update_output_stat(sender, instance, raw=False, **kwargs):
+    """
+    Links an output label to the ``OutputStat`` of its owner and network,
+    runs after ``update_type_ref_hash``.
+    """
+    if raw:
+        return
+    if instance.type != instance.TYPE_OUTPUT:
+        instance.output_stat = None
+        return
+    from finances.models import OutputStat
+    instance.output_stat_id = OutputStat.objects.filter(
+        type_ref_hash=instance.type_ref_hash,
+        user__labelbase=instance.labelbase_id,
+        user__labelbase__network=F("network"),
+    ).values_list("id", flat=True).last()
+
+
+def link_output_stat_labels(sender, instance, created=False, raw=False, **kwargs):
+    """
+    Links the output labels which were saved before their ``OutputStat``.
+    """
+    if raw or not created:
+        return
+    from .models import Label
+    Label.objects.filter(
+        type=Label.TYPE_OUTPUT,
+        type_ref_hash=instance.type_ref_hash,
+        labelbase__user_id=instance.user_id,
+        labelbase__network=instance.network,
+        output_stat__isnull=True,
+    ).update(output_stat=instance)
+
+
+def update_fiat_value(sender, instance, **kwargs):
+    """
+    Parses the tracked fiat value once on save instead of on every read.
+    """
+    instance.update_fiat_value()
+
+
+def compute_search_tokens(sender, instance, **kwargs):
+    """
+    Computes the blind index tokens while the plaintext is at hand,
+    they are stored by ``update_search_tokens`` once the label has an id.
+    """
+    instance._search_tokens = label_tokens(instance)
+
+
+def update_search_tokens(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    index_label(instance, tokens=getattr(instance, "_search_tokens", None))
+
+
+def update_labelbase_version(sender, instance, created=False, raw=False, **kwargs):
+    bump_labelbase_version(instance.labelbase_id)
+    if not raw:
+        update_cached_label(instance, created)
+
+
 def trigger_electrumx_checkup(sender, instance, **kwargs):
     if instance.type == "output":
         from finances.tasks import check_spent
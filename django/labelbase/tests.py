@@ -0,0 +1,221 @@
+import json
+import re
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+
+from attachments.models import LabelAttachment
+from finances.models import OutputStat
+from finances.valuation import value_labels
+from labellabor.query_budget import QueryBudgetTestMixin
+from labellabor.views import LabelbaseDatatableView
+from .blind_index import search_label_ids
+from .label_cache import (get_label_ordering, get_label_rows, label_cache,
+                          load_label_rows, sort_label_ids)
+from .models import Label, Labelbase
+
+
+class LabelbaseDatatableBudgetTest(QueryBudgetTestMixin, TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("alice", password="secret")
+        self.labelbase = Labelbase.objects.create(user=self.user, name="budget")
+
+    def get_page(self, **params):
+        request = RequestFactory().get("/", dict({"draw": 1, "start": 0, "length": 100}, **params))
+        request.user = self.user
+        return LabelbaseDatatableView.as_view()(request, labelbase_id=self.labelbase.id)
+
+    def add_labels(self, count):
+        for i in range(count):
+            Label.objects.create(labelbase=self.labelbase, type="addr",
+                                 ref="bc1q{:04d}".format(i), label="#tag label {}".format(i))
+
+    def test_queries_do_not_grow_with_rows(self):
+        self.add_labels(5)
+        with self.assertWithinBudget("labelbase_label_data") as few:
+            self.get_page()
+        self.add_labels(95)
+        with self.assertWithinBudget("labelbase_label_data") as many:
+            response = self.get_page(**{"search[value]": "label"})
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(many.queries, few.queries + 1)
+
+
+class SearchLabelIdsTest(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user("bob", password="secret")
+        self.labelbase = Labelbase.objects.create(user=user, name="search")
+        self.other = Labelbase.objects.create(user=user, name="other")
+        self.labels = {}
+        for name in ("abcd", "abc bcd", "Cold Storage", "xcd"):
+            self.labels[name] = Label.objects.create(labelbase=self.labelbase, type="addr",
+                                                     ref="bc1q" + name, label=name).id
+        Label.objects.create(labelbase=self.other, type="addr", ref="bc1qother", label="abcd")
+
+    def search(self, query):
+        return sorted(search_label_ids(self.labelbase.id, query, fields=("label",))
+                      .values_list("label_id", flat=True))
+
+    def test_matches_all_ngrams_of_the_query(self):
+        # "abc bcd" has all trigrams of "abcd", a false positive
+        self.assertEqual(self.search("abcd"), sorted([self.labels["abcd"], self.labels["abc bcd"]]))
+        self.assertEqual(self.search("COLD st"), [self.labels["Cold Storage"]])
+        self.assertEqual(self.search("abce"), [])
+
+    def test_short_queries_match_anywhere(self):
+        self.assertEqual(self.search("cd"), sorted([self.labels["abcd"], self.labels["abc bcd"],
+                                                    self.labels["xcd"]]))
+        self.assertEqual(self.search("g"), [self.labels["Cold Storage"]])
+
+
+class ValueLabelsTest(TestCase):
+
+    def test_output_without_output_stat(self):
+        user = User.objects.create_user("carol", password="secret")
+        labelbase = Labelbase.objects.create(user=user, name="values")
+        label = Label.objects.create(labelbase=labelbase, type="output",
+                                     ref="{}:0".format("ab" * 32), label="no output stat")
+        OutputStat.objects.filter(type_ref_hash=label.type_ref_hash).delete()
+        label = Label.objects.select_related("output_stat", "labelbase__user").get(id=label.id)
+
+        self.assertEqual(value_labels([label]), {})
+        with self.assertNumQueries(0):
+            self.assertEqual(label.get_finance_output_metrics_dict(), {})
+
+
+@override_settings(LABEL_CACHE_ENABLED=True)
+class LabelCacheTest(TestCase):
+
+    def setUp(self):
+        label_cache.clear()
+        self.user = User.objects.create_user("dave", password="secret")
+        self.labelbase = Labelbase.objects.create(user=self.user, name="cache")
+        for i in range(20):
+            Label.objects.create(labelbase=self.labelbase, type="addr",
+                                 ref="bc1q{:04d}".format(i), label="Label {}".format(i % 7))
+
+    def test_save_updates_rows_and_orderings_in_place(self):
+        orders = [(("label", True), ("ref", False)), (("id", False),)]
+        for order in orders:
+            get_label_ordering(self.labelbase.id, order)
+        label = Label.objects.filter(labelbase=self.labelbase).order_by("id")[3]
+        label.label = "a renamed label"
+        label.save()
+        Label.objects.create(labelbase=self.labelbase, type="tx", ref="ab" * 32, label="new")
+
+        misses = label_cache.misses
+        rows = get_label_rows(self.labelbase.id)
+        for order in orders:
+            self.assertEqual(get_label_ordering(self.labelbase.id, order),
+                             sort_label_ids(load_label_rows(self.labelbase.id), order))
+        self.assertEqual(label_cache.misses, misses)
+        self.assertEqual(rows, load_label_rows(self.labelbase.id))
+
+
+class LookupIndexTest(TestCase):
+    """
+    Checks with EXPLAIN that the hot lookups are served by a composite
+    index on a synthetic dataset of 100k rows per table.
+    """
+    ROWS = 100000
+    LABELBASES = 100
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("bob", password="secret")
+        Labelbase.objects.bulk_create([
+            Labelbase(user=cls.user, name="lb {}".format(i)) for i in range(cls.LABELBASES)])
+        labelbase_ids = list(Labelbase.objects.values_list("id", flat=True))
+        types = [choice for choice, _ in Label.TYPE_CHOICES]
+
+        # Encrypting 100k labels one by one would dominate the test, the
+        # encrypted columns get the same prepared value on every row.
+        template = Label(labelbase_id=labelbase_ids[0], ref="ref", label="label")
+        fields = [f for f in Label._meta.concrete_fields if not f.primary_key]
+        prepared = {f.attname: f.get_db_prep_save(f.pre_save(template, True), connection)
+                    for f in fields}
+        rows = []
+        for i in range(cls.ROWS):
+            prepared.update(labelbase_id=labelbase_ids[i % cls.LABELBASES],
+                            type=types[i % len(types)],
+                            type_ref_hash="{:064x}".format(i))
+            rows.append([prepared[f.attname] for f in fields])
+        with connection.cursor() as cursor:
+            cursor.executemany("INSERT INTO {} ({}) VALUES ({})".format(
+                connection.ops.quote_name(Label._meta.db_table),
+                ", ".join(connection.ops.quote_name(f.column) for f in fields),
+                ", ".join(["%s"] * len(fields))), rows)
+
+        OutputStat.objects.bulk_create([
+            OutputStat(user=cls.user, type_ref_hash="{:064x}".format(i), value=i,
+                       network=("mainnet", "testnet")[i % 2])
+            for i in range(cls.ROWS)], batch_size=5000)
+        LabelAttachment.objects.bulk_create([
+            LabelAttachment(user=cls.user, type_ref_hash="{:064x}".format(i),
+                            network=("mainnet", "testnet")[i % 2])
+            for i in range(cls.ROWS)], batch_size=5000)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE" if connection.vendor == "sqlite" else
+                           "ANALYZE TABLE {}".format(", ".join(
+                               m._meta.db_table for m in (Label, OutputStat, LabelAttachment))))
+        cls.labelbase_id = labelbase_ids[7]
+
+    def used_indexes(self, qs):
+        if connection.vendor == "mysql":
+            used = []
+
+            def walk(node):
+                if isinstance(node, dict):
+                    if "table" in node and isinstance(node["table"], dict):
+                        used.append(node["table"].get("key"))
+                    for value in node.values():
+                        walk(value)
+                elif isinstance(node, list):
+                    for value in node:
+                        walk(value)
+            walk(json.loads(qs.explain(format="json")))
+            return [key for key in used if key]
+        return re.findall(r"USING (?:COVERING )?INDEX (\w+)", qs.explain())
+
+    def assertUsesIndex(self, qs, columns):
+        """
+        Asserts the plan uses an index whose leading columns are ``columns``.
+        """
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, qs.model._meta.db_table)
+        used = self.used_indexes(qs)
+        self.assertTrue(
+            any(set(constraints[name]["columns"][:len(columns)]) == set(columns)
+                for name in used if name in constraints),
+            "{} uses {}, expected an index on {}".format(qs.query, used or "no index", columns))
+
+    def test_label_by_labelbase_and_type(self):
+        self.assertUsesIndex(
+            Label.objects.filter(labelbase_id=self.labelbase_id, type=Label.TYPE_OUTPUT),
+            ["labelbase_id", "type"])
+
+    def test_label_by_labelbase_and_type_ref_hash(self):
+        self.assertUsesIndex(
+            Label.objects.filter(labelbase_id=self.labelbase_id, type_ref_hash="{:064x}".format(7)),
+            ["labelbase_id", "type_ref_hash"])
+
+    def test_output_stat_by_user_type_ref_hash_and_network(self):
+        self.assertUsesIndex(
+            OutputStat.objects.filter(user=self.user, type_ref_hash="{:064x}".format(7),
+                                      network="testnet"),
+            ["user_id", "type_ref_hash"])
+
+    def test_output_stat_by_type_ref_hash_and_network(self):
+        self.assertUsesIndex(
+            OutputStat.objects.filter(type_ref_hash="{:064x}".format(7), network="testnet"),
+            ["type_ref_hash", "network"])
+
+    def test_label_attachment_by_user_network_and_type_ref_hash(self):
+        self.assertUsesIndex(
+            LabelAttachment.objects.filter(user=self.user, network="testnet",
+                                           type_ref_hash="{:064x}".format(7)),
+            ["user_id", "network", "type_ref_hash"])
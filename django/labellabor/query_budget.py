@@ -0,0 +1,180 @@
+"""
+Per request accounting of SQL queries, database time and decrypted values.
+
+``QueryBudgetMiddleware`` records every request and compares the numbers
+with ``settings.QUERY_BUDGETS``, keyed by URL name or, for unnamed routes
+such as the API, by the dotted path of the view::
+
+    QUERY_BUDGETS = {
+        "default": {"queries": 100},
+        "labelbase_label_data": {"queries": 15, "decrypts": 2000},
+    }
+
+The middleware is on with ``DEBUG`` by default. Going over budget is
+logged, or raises ``QueryBudgetExceeded`` when
+``settings.QUERY_BUDGET_RAISE`` is set, as it is in the tests using
+``QueryBudgetTestMixin``. Tests can use its ``assertWithinBudget`` directly.
+
+Decrypts are counted by a wrapper of ``EncryptedMixin._load``, installed by
+the first recording. It counts for the recordings of the current context
+only, see ``_current_recorders``.
+"""
+import contextvars
+import logging
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.test.utils import override_settings
+from django_cryptography.fields import EncryptedMixin
+
+
+logger = logging.getLogger('labelbase')
+
+# all recorders of the current context, recordings can be nested
+_current_recorders = contextvars.ContextVar("query_budget_recorders", default=())
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryRecorder:
+    """
+    Installed as ``connection.execute_wrapper`` while recording.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.decrypts = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - started
+
+    def as_dict(self):
+        return {
+            "queries": self.queries,
+            "db_time_ms": round(self.db_time * 1000, 1),
+            "decrypts": self.decrypts,
+        }
+
+    def over_budget(self, budget):
+        """
+        Returns ``{metric: (measured, allowed), ...}`` for every metric of
+        ``budget`` that was exceeded.
+        """
+        measured = self.as_dict()
+        return {metric: (measured[metric], allowed)
+                for metric, allowed in budget.items()
+                if allowed is not None and measured[metric] > allowed}
+
+
+def _counting_load(load):
+    def _load(self, value):
+        for recorder in _current_recorders.get():
+            recorder.decrypts += 1
+        return load(self, value)
+    _load.counts_decrypts = True
+    return _load
+
+
+_load_lock = threading.Lock()
+
+
+def install_decrypt_counter():
+    if getattr(EncryptedMixin._load, "counts_decrypts", False):
+        return
+    with _load_lock:
+        if not getattr(EncryptedMixin._load, "counts_decrypts", False):
+            EncryptedMixin._load = _counting_load(EncryptedMixin._load)
+
+
+@contextmanager
+def record_queries():
+    """
+    Records queries, database time and decrypts of the enclosed block on
+    all database connections of the current thread.
+    """
+    install_decrypt_counter()
+    recorder = QueryRecorder()
+    token = _current_recorders.set(_current_recorders.get() + (recorder,))
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            yield recorder
+    finally:
+        _current_recorders.reset(token)
+
+
+def get_budget_name(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return None
+    return match.url_name or match._func_path
+
+
+def get_budget(name):
+    budgets = getattr(settings, "QUERY_BUDGETS", {})
+    return budgets.get(name, budgets.get("default", {}))
+
+
+class QueryBudgetMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.QUERY_BUDGET_ENABLED:
+            return self.get_response(request)
+
+        with record_queries() as recorder:
+            response = self.get_response(request)
+
+        name = get_budget_name(request)
+        exceeded = recorder.over_budget(get_budget(name))
+        if exceeded:
+            message = "Query budget of {} exceeded ({}): {}".format(
+                name, request.path, ", ".join(
+                    "{} {} > {}".format(metric, measured, allowed)
+                    for metric, (measured, allowed) in exceeded.items()))
+            if settings.QUERY_BUDGET_RAISE:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+
+class QueryBudgetTestMixin:
+    """
+    Mixin for ``TestCase`` classes, the budgets of requests are checked in
+    its tests and exceeding them raises ``QueryBudgetExceeded``.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        budget_raise = override_settings(QUERY_BUDGET_ENABLED=True, QUERY_BUDGET_RAISE=True)
+        budget_raise.enable()
+        cls.addClassCleanup(budget_raise.disable)
+        super().setUpClass()
+
+    @contextmanager
+    def assertWithinBudget(self, name, budget=None):
+        """
+        Fails if the enclosed block exceeds ``budget``, by default the budget
+        declared in the settings for ``name``.
+        """
+        if budget is None:
+            budget = get_budget(name)
+        with record_queries() as recorder:
+            yield recorder
+        exceeded = recorder.over_budget(budget)
+        if exceeded:
+            self.fail("Query budget of {} exceeded: {}".format(name, exceeded))
@@ -128,6 +128,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "labellabor.query_budget.QueryBudgetMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     # "django.middleware.cache.UpdateCacheMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -172,6 +173,55 @@ TEMPLATES = [
 
 CURRENCIES = ['USD', 'EUR', 'GBP', 'CAD', 'CHF', 'AUD', 'JPY']
 
+# Per worker cache of decrypted labels, see labelbase/label_cache.py. The label
+# table is only sorted by the encrypted columns (ref, label, ...) with it.
+LABEL_CACHE_ENABLED = proj_config.getboolean("performance", "label_cache_enabled", fallback=False)
+LABEL_CACHE_MAX_BYTES = proj_config.getint("performance", "label_cache_max_mb", fallback=64) * 1024 * 1024
+
+# Query budgets per URL name (or view path), see labellabor/query_budget.py
+QUERY_BUDGET_ENABLED = proj_config.getboolean("performance", "query_budget_enabled", fallback=DEBUG)
+QUERY_BUDGET_RAISE = proj_config.getboolean("performance", "query_budget_raise", fallback=False)
+QUERY_BUDGETS = {
+    "default": {"queries": 100, "db_time_ms": 2000},
+    "labelbase": {"queries": 20},
+    "labelbase_label_data": {"queries": 15},
+    "labelbase.api.LabelAPIView": {"queries": 10},
+    "labelbase.api.LabelbaseAPIView": {"queries": 10},
+}
+
+# Shared by the web workers and process_tasks (python manage.py createcachetable)
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "labelbase_cache",
+    }
+}
+
+# Blocks of 30 days of historical prices kept per process, see finances/prices.py
+PRICE_SERIES_MAX_BLOCKS = proj_config.getint("performance", "price_series_max_blocks", fallback=120)
+
+# Current BTC price, see finances/spot_price.py
+SPOT_PRICE_TTL = proj_config.getint("performance", "spot_price_ttl", fallback=60)
+SPOT_PRICE_TIMEOUT = proj_config.getint("performance", "spot_price_timeout", fallback=10)
+SPOT_PRICE_MEMPOOL_ENDPOINT = proj_config.get("performance", "spot_price_mempool_endpoint", fallback="https://mempool.space")
+
+# Electrum connections kept open by process_tasks, see finances/electrum_pool.py
+ELECTRUM_POOL_MAX_CONNECTIONS = proj_config.getint("performance", "electrum_pool_max_connections", fallback=8)
+# Idle seconds after which a connection is pinged before it's reused
+ELECTRUM_POOL_IDLE_CHECK = proj_config.getint("performance", "electrum_pool_idle_check", fallback=60)
+ELECTRUM_TIMEOUT = proj_config.getint("performance", "electrum_timeout", fallback=30)
+# Requests per JSON-RPC batch of the output refresh, see finances/electrum_sync.py
+ELECTRUM_BATCH_SIZE = proj_config.getint("performance", "electrum_batch_size", fallback=50)
+# Batches in flight at once, in all and per Electrum server
+ELECTRUM_REFRESH_CONCURRENCY = proj_config.getint("performance", "electrum_refresh_concurrency", fallback=16)
+ELECTRUM_SERVER_CONCURRENCY = proj_config.getint("performance", "electrum_server_concurrency", fallback=4)
+
+# Size of the store of confirmed transactions, see finances/tx_store.py
+RAW_TRANSACTION_STORE_MAX_BYTES = proj_config.getint("performance", "raw_transaction_store_max_mb", fallback=256) * 1024 * 1024
+
+# Seconds a coin selection search may take, see finances/coin_selection.py
+COIN_SELECTION_TIME_BUDGET = proj_config.getfloat("performance", "coin_selection_time_budget", fallback=0.5)
+
 
 WSGI_APPLICATION = "labellabor.wsgi.application"
 
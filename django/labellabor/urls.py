@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.contrib.auth.views import LogoutView
 from django.urls import include, path
 from two_factor.urls import urlpatterns as tf_urls
-from labelbase.api import LabelAPIView, LabelbaseAPIView
+from labelbase.api import LabelAPIView, LabelbaseAPIView, CoinSelectionAPIView
 from rest_framework.documentation import include_docs_urls
 from django.contrib.auth.decorators import login_required
 
@@ -17,7 +17,7 @@ from userprofile.views import has_seen_welcome_popup
 
 
 
-from hashtags.views import HashtagListView, HashtagUpdateView, LabelbaseProxyView
+from hashtags.views import HashtagListView, HashtagUpdateView
 
 
 from .views import (
@@ -44,6 +44,10 @@ from .views import (
     ExportLabelsView,
     # StatsAndKPIView,
     TreeMapsView,
+    CoinSelectionView,
+    PortfolioTimelineView,
+    PortfolioTimelineDataView,
+    RefreshProgressView,
     FixAndMergeLabelsView,
     LabelbaseDatatableView,
     #LabelbasePortfolioView,
@@ -78,6 +82,10 @@ urlpatterns = [
         "api/v0/labelbase/<int:labelbase_id>/label/<int:id>/",
         LabelAPIView.as_view()
     ),
+    path(
+        "api/v0/labelbase/<int:labelbase_id>/coin-selection/",
+        CoinSelectionAPIView.as_view()
+    ),
     path(
         "api-reference/",
         include_docs_urls(title="Labelbase API")
@@ -141,11 +149,6 @@ urlpatterns = [
         login_required(HashtagListView.as_view()),
         name="labelbase_hashtags"
     ),
-    path(
-        "labelbase/<int:labelbase_id>/hashtags/proxy/",
-        login_required(LabelbaseProxyView.as_view()),
-        name="labelbase_hashtags_proxy"
-    ),
     path(
         "labelbase/hashtag/<int:pk>/edit/",
         login_required(HashtagUpdateView.as_view()),
@@ -218,6 +221,26 @@ urlpatterns = [
     #    login_required(StatsAndKPIView.as_view()),
     #    name="labelbase_stats_and_kpi"
     # ),
+    path(
+        "labelbase/<int:pk>/coin-selection/",
+        login_required(CoinSelectionView.as_view()),
+        name="labelbase_coin_selection"
+    ),
+    path(
+        "labelbase/<int:pk>/timeline/",
+        login_required(PortfolioTimelineView.as_view()),
+        name="labelbase_timeline"
+    ),
+    path(
+        "labelbase/<int:pk>/timeline/data/",
+        login_required(PortfolioTimelineDataView.as_view()),
+        name="labelbase_timeline_data"
+    ),
+    path(
+        "labelbase/<int:pk>/refresh/progress/",
+        login_required(RefreshProgressView.as_view()),
+        name="labelbase_refresh_progress"
+    ),
     path(
         "labelbase/<int:pk>/tree-maps/",
         login_required(TreeMapsView.as_view()),
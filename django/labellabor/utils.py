@@ -1,38 +1,58 @@
 import re
 import decimal
+import functools
 
 from django.conf import settings
 
 
+HASHTAG_RE = re.compile(r'#(\w+)')
+
+
+def extract_hashtags(value):
+    """
+    Returns the distinct hashtag names in ``value``, without the '#'.
+    """
+    return list(dict.fromkeys(HASHTAG_RE.findall(value or "")))
+
+
+HASHTAG_BADGE = r'<a href="?tag=\1" class="badge badge-hashtag">\1</a>'
+
+# Label cells are rendered over and over while paging through a table.
+HASHTAG_BADGE_CACHE_SIZE = 4096
+
+
+@functools.lru_cache(maxsize=HASHTAG_BADGE_CACHE_SIZE)
 def hashtag_to_badge(value):
-    hashtags = re.findall(r'#\w+', value)
-    for tag in hashtags:
-        clean_tag = re.search(r'#(\w+)', tag).group(1)  # Extract the word after the '#' symbol
-        value = value.replace(tag, f'<a href="?tag={clean_tag}" class="badge badge-hashtag">{clean_tag}</a>')
-    return value
+    """
+    Replaces every '#tag' in ``value`` with a badge linking to the tag filter.
+    """
+    return HASHTAG_RE.sub(HASHTAG_BADGE, value)
+
+
+def hashtags_to_badges(values):
+    """
+    Batch version of ``hashtag_to_badge`` for a page of labels, returns the
+    rendered values in the same order.
+    """
+    rendered = {value: hashtag_to_badge(value) for value in set(values)}
+    return [rendered[value] for value in values]
+
+
+# "CHF 12.50" or "12.50 CHF", one alternation for all currencies
+FIAT_VALUE_RE = re.compile(
+    r"(?:({currencies})\s?(\d+(?:\.\d+)?))|(?:(\d+(?:\.\d+)?)\s?({currencies}))".format(
+        currencies="|".join(map(re.escape, settings.CURRENCIES))))
 
 
 def extract_fiat_value(s):
-    # CHF XXX
-    pattern = r"({})\s?(\d+(?:\.\d+)?)"
-    for currency in settings.CURRENCIES:
-        match = re.search(pattern.format(currency), s)
-        if match:
-            print(f"Currency: {match.group(1)}, Value: {match.group(2)}")
-            return (decimal.Decimal(match.group(2)), match.group(1))
-
-    # XXX CHF
-    pattern = r"(\d+(?:\.\d+)?)\s?({})"
-    for currency in settings.CURRENCIES:
-        match = re.search(pattern.format(currency), s)
-        if match:
-            value = decimal.Decimal(match.group(1))
-            currency_symbol = currency
-            # Find the currency symbol position in the string
-            symbol_start = match.start(2)
-            symbol_end = match.end(2)
-            if symbol_start > 0:
-                currency_symbol = s[symbol_start:symbol_end]
-            print(f"Currency: {currency_symbol}, Value: {value}")
-            return (value, currency_symbol)
-    return (decimal.Decimal(-1), "")
+    """
+    Returns ``(value, currency)`` of the first fiat amount in ``s``, or
+    ``(Decimal(-1), "")`` if there is none. Labels store the result in
+    ``fiat_value`` and ``fiat_currency`` when they are saved.
+    """
+    match = FIAT_VALUE_RE.search(s or "")
+    if match is None:
+        return (decimal.Decimal(-1), "")
+    if match.group(1):
+        return (decimal.Decimal(match.group(2)), match.group(1))
+    return (decimal.Decimal(match.group(3)), match.group(4))
@@ -20,8 +20,10 @@ from django.shortcuts import get_object_or_404
 from django.http import HttpResponseRedirect
 from django.http import FileResponse
 from django.urls import reverse
-from django.template.loader import render_to_string
+from django.utils.html import escape
 from django.contrib import messages
+from django.db.models import CharField, Q
+from django.db.models.functions import Cast
 from django_datatables_view.base_datatable_view import BaseDatatableView
 from two_factor.views import OTPRequiredMixin
 from two_factor.views.utils import class_view_decorator
@@ -30,10 +32,22 @@ from bip329.bip329_writer import BIP329JSONLWriter, BIP329JSONLEncryptedWriter
 from labelbase.models import Label, Labelbase
 from labelbase.forms import LabelForm, LabelbaseForm
 from labelbase.forms import ExportLabelsForm
+from labelbase.blind_index import search_label_ids
+from labelbase.label_cache import get_label_rows, get_label_ordering, plain_order_by
+from labelbase.label_cache import LabelIdSet, materialize_label_ids
+from labelbase.label_cache import get_labelbase_version
+from hashtags.utils import hashtag_token
 from finances.models import OutputStat
-from finances.tasks import check_all_outputs
+from finances.tasks import queue_refresh
+from finances.electrum_sync import get_refresh_progress
 from finances.models import HistoricalPrice
-from .utils import hashtag_to_badge, extract_fiat_value
+from finances.spot_price import get_spot_prices
+from finances.coin_selection import plan_for_labelbase
+from finances.fee_health import fee_health_statuses
+from finances.timeline import portfolio_timeline
+from finances.tx_store import get_mempool_transaction
+from finances.valuation import value_labels
+from .utils import hashtag_to_badge, hashtags_to_badges, extract_fiat_value
 from embit import bip32, script
 from embit.networks import NETWORKS
 from django.http import JsonResponse
@@ -45,6 +59,32 @@ logger = logging.getLogger('labelbase')
 
 DEFAULT_DERIVE_ADDRESS_COUNT = 100
 
+# Same markup as the former labelbase_dt_ref.html, rendered without the
+# template engine as it is needed for every row of a table page.
+REF_CELL_HTML = (
+    '{link_open}\n'
+    '<tt>\n'
+    '  <span style="display:none;">{ref}</span>\n'
+    '  <span class="connector-float-left d-block d-md-none">{head_8}… {tail_8}</span>\n'
+    '  <span class="connector-float-left d-none d-md-block d-lg-none">{head_4}… {tail_4}</span>\n'
+    '  <span class="connector-float-left d-none d-lg-block">{head_10}… {tail_10}</span>\n'
+    '</tt>\n'
+    '{link_close}\n'
+)
+
+
+def render_ref_cell(ref, mempool_url):
+    ref = ref or ""
+    return REF_CELL_HTML.format(
+        link_open='<a href="{}">'.format(escape(mempool_url)) if mempool_url else "",
+        link_close="</a>" if mempool_url else "",
+        ref=escape(ref),
+        head_8=escape(ref[:8]), tail_8=escape(ref[-8:]),
+        head_4=escape(ref[:4]), tail_4=escape(ref[-4:]),
+        head_10=escape(ref[:10]), tail_10=escape(ref[-10:]),
+    )
+
+
 class BitcoinAddressDatatableView(BaseDatatableView):
     label_id = None  # Variable to store label ID and verify if all is okay.
 
@@ -244,6 +284,9 @@ class LabelbaseDatatableView(BaseDatatableView):
 
     max_display_length = 100
 
+    matching = None  # LabelIdSet of the filtered labels
+    filtered_qs = None
+
     def get_initial_queryset(self):
         labelbase_id = self.kwargs["labelbase_id"]
 
@@ -251,35 +294,42 @@ class LabelbaseDatatableView(BaseDatatableView):
 
         qs = Label.objects.filter(labelbase__user_id=self.request.user.id,
                                   labelbase_id=labelbase_id).order_by("id")
+        self.labels = qs
 
         if search_tag:
-            # Due to encryption, we need to use a super slow process here...
-            res_ids = []
-            search = f'#{search_tag}'
-            print(search)
-            for record in qs:
-                if record.label and search in record.label:
-                    res_ids.append(record.id)
-                    continue
-            qs = qs.filter(id__in=res_ids)
+            qs = qs.filter(hashtags__name_token=hashtag_token(labelbase_id, search_tag))
         return qs
 
+    def prepare_results(self, qs):
+        """
+        All rows of a page belong to the same labelbase, so everything
+        derived from the labelbase and its owner is resolved once per page.
+        """
+        labels = list(qs)
+        if labels:
+            labelbase = labels[0].labelbase
+            self.mempool_endpoint = labelbase.get_mempool_endpoint()
+            self.use_hashtags = labelbase.user.profile.use_hashtags
+            if self.use_hashtags:
+                with_label = [l for l in labels if l.label is not None]
+                self.label_cells = dict(zip(
+                    (l.id for l in with_label),
+                    hashtags_to_badges([f'<tt>{l.label}</tt>' for l in with_label])))
+            fee_health_statuses(labels, labelbase.user.profile)
+        return super().prepare_results(labels)
+
     def render_column(self, row, column):
         if column == 'id':
             return f'<tt><a href="{reverse("edit_label", args=[row.id])}">{row.id}</a></tt>'
         elif column == 'type':
             return "<tt>{}</tt>".format(row.get_type_display())
         elif column == 'ref':
-            ctx = {
-                'row': row,
-                'mempool_url': row.get_mempool_url(),
-            }
-            return render_to_string('labelbase_dt_ref.html', context=ctx, request=self.request)
+            return render_ref_cell(row.ref, row.get_mempool_url(self.mempool_endpoint))
         elif column == 'label':
             if row.label is None:
                 return ""
-            if row.labelbase.user.profile.use_hashtags:
-                return hashtag_to_badge(f'<tt>{row.label}</tt>')
+            if self.use_hashtags:
+                return self.label_cells[row.id]
             else:
                 return f'<tt>{row.label}</tt>'
         elif column == 'origin':
@@ -303,32 +353,82 @@ class LabelbaseDatatableView(BaseDatatableView):
     def filter_queryset(self, qs):
         search = self.request.GET.get('search[value]', None)
         type_filter = self.request.GET.get('type', None)
+        search_tag = self.request.GET.get('tag', None)
         if search:
-            # Due to encryption, we need to use a super slow process here...
-            res_ids = []
-            search = search.lower()
-            for record in qs:
-                if record.type and search in record.type.lower():
-                    res_ids.append(record.id)
-                    continue
-                if record.ref and search in record.ref.lower():
-                    res_ids.append(record.id)
-                    continue
-                if record.label and search in record.label.lower():
-                    res_ids.append(record.id)
-                    continue
-                if record.origin and search in record.origin.lower():
-                    res_ids.append(record.id)
-                    continue
-            qs = qs.filter(id__in=res_ids)
+            # Encrypted fields are searched through the blind index.
+            qs = qs.filter(
+                Q(type__icontains=search) |
+                Q(id__in=search_label_ids(self.kwargs["labelbase_id"], search))
+            )
         if type_filter and type_filter != 'all':
             qs = qs.filter(type=type_filter)
+
+        # The matching ids are computed once and reused for every page,
+        # ordering and count until the labelbase changes.
+        self.version = get_labelbase_version(self.kwargs["labelbase_id"])
+        self.filter_key = None
+        if settings.LABEL_CACHE_ENABLED and (
+                search or search_tag or (type_filter and type_filter != 'all')):
+            self.filter_key = (search, search_tag, type_filter)
+            self.matching = materialize_label_ids(
+                self.kwargs["labelbase_id"], self.filter_key,
+                lambda: qs.values_list("id", flat=True), self.version)
+        self.filtered_qs = qs
         return qs
 
+    def count_records(self, qs):
+        if self.matching is not None and qs is self.filtered_qs:
+            return len(self.matching)
+        return super().count_records(qs)
+
+    def ordering(self, qs):
+        """
+        Most columns are ciphertext in the database, so the ordering is
+        applied to the decrypted labels in ``paging``.
+        """
+        self.order = []
+        order_columns = self.get_order_columns()
+        i = 0
+        while "order[{0}][column]".format(i) in self._querydict:
+            try:
+                column = order_columns[int(self._querydict.get("order[{0}][column]".format(i)))]
+            except (ValueError, IndexError):
+                column = "id"
+            descending = self._querydict.get("order[{0}][dir]".format(i)) == "desc"
+            self.order.append((column, descending))
+            i += 1
+        return qs
+
+    def paging(self, qs):
+        """
+        Pages are slices of the sorted ids of the labelbase, so their cost
+        doesn't depend on the depth of the page. Without the label cache
+        they are ordered and sliced in the database, by the plain columns.
+        """
+        limit = min(int(self._querydict.get("length", 10)), self.max_display_length)
+        start = int(self._querydict.get("start", 0))
+
+        labelbase_id = self.kwargs["labelbase_id"]
+        order = tuple(self.order or [("id", False)])
+        if not settings.LABEL_CACHE_ENABLED:
+            qs = qs.select_related("output_stat", "labelbase__user__profile").order_by(
+                *plain_order_by(order))
+            return qs[start:] if limit == -1 else qs[start:start + limit]
+        ordering = get_label_ordering(labelbase_id, order, self.version)
+        if self.matching is not None:
+            ids = materialize_label_ids(labelbase_id, (self.filter_key, order),
+                                        lambda: self.matching.ordered(ordering),
+                                        self.version)
+        else:
+            ids = LabelIdSet(ordering)
+
+        return ids.labels(self.labels.select_related("output_stat", "labelbase__user__profile"),
+                          start, limit)
+
 
 
 class LabelbaseHealthDatatableView(BaseDatatableView):
-    columns = ["id", "ref", "label", "value"]
+    columns = ["id", "ref", "label", "value", "health"]
 
     order_columns = ["id", "ref", "label"]
 
@@ -340,30 +440,29 @@ class LabelbaseHealthDatatableView(BaseDatatableView):
         qs = Label.objects.filter(type=Label.TYPE_OUTPUT,
                                   labelbase__user_id=self.request.user.id,
                                   labelbase_id=labelbase_id).order_by("id")
+        qs = qs.select_related("output_stat", "labelbase__user__profile")
 
         if search_tag:
-            # Due to encryption, we need to use a super slow process here...
-            res_ids = []
-            search = f'#{search_tag}'
-
-            for record in qs:
-                if record.label and search in record.label:
-                    res_ids.append(record.id)
-                    continue
-            qs = qs.filter(id__in=res_ids)
+            qs = qs.filter(hashtags__name_token=hashtag_token(labelbase_id, search_tag))
         return qs
 
+    def prepare_results(self, qs):
+        """
+        The values and fee health of a page are computed in one batch.
+        """
+        labels = list(qs)
+        if labels:
+            value_labels(labels)
+            fee_health_statuses(labels, labels[0].labelbase.user.profile)
+        return super().prepare_results(labels)
+
     def render_column(self, row, column):
         if column == 'id':
             return f'<tt><a href="{reverse("edit_label", args=[row.id])}">{row.id}</a></tt>'
         elif column == 'type':
             return "<tt>{}</tt>".format(row.get_type_display())
         elif column == 'ref':
-            ctx = {
-                'row': row,
-                'mempool_url': row.get_mempool_url(),
-            }
-            return render_to_string('labelbase_dt_ref.html', context=ctx, request=self.request)
+            return render_ref_cell(row.ref, row.get_mempool_url())
         elif column == 'label':
             if row.label is None:
                 return ""
@@ -376,29 +475,29 @@ class LabelbaseHealthDatatableView(BaseDatatableView):
                 return row.get_finance_output_metrics_dict().get('value')
             except Exception as ex:
                 return "{}".format(ex)
+        elif column == 'health':
+            return escape(row.get_fee_health_status_display)
         else:
             return super(LabelbaseHealthDatatableView, self).render_column(row, column)
 
     def filter_queryset(self, qs):
         search = self.request.GET.get('search[value]', None)
         if search:
-            # Due to encryption, we need to use a super slow process here...
-            res_ids = []
-            search = search.lower()
-            for record in qs:
-                if record.type and search in record.type.lower():
-                    res_ids.append(record.id)
-                    continue
-                if record.ref and search in record.ref.lower():
-                    res_ids.append(record.id)
-                    continue
-                if record.label and search in record.label.lower():
-                    res_ids.append(record.id)
-                    continue
-                if search in "{}".format(record.get_finance_output_metrics_dict().get('value')):
-                    res_ids.append(record.id)
-                    continue
-            return qs.filter(id__in=res_ids)
+            # Encrypted fields are searched through the blind index,
+            # the output value is plaintext in OutputStat.
+            labelbase_id = self.kwargs["labelbase_id"]
+            matching_values = OutputStat.objects.annotate(
+                value_str=Cast("value", CharField())
+            ).filter(
+                user_id=self.request.user.id,
+                network__in=Labelbase.objects.filter(id=labelbase_id).values("network"),
+                value_str__contains=search
+            ).values("type_ref_hash")
+            return qs.filter(
+                Q(type__icontains=search) |
+                Q(id__in=search_label_ids(labelbase_id, search, fields=("ref", "label"))) |
+                Q(type_ref_hash__in=matching_values)
+            )
         return qs
 
 
@@ -408,7 +507,7 @@ class LabelbaseViewActionView(View):
             Labelbase, id=self.kwargs["labelbase_id"], user_id=self.request.user.id
         )
         if self.kwargs["action"] == "update-spent-outputs":
-            check_all_outputs(self.request.user.id, labelbase_id=labelbase.id)
+            queue_refresh(labelbase.id)
         return HttpResponseRedirect(labelbase.get_absolute_url())
 
 
@@ -434,6 +533,7 @@ class LabelbaseView(ListView):
             request=self.request, labelbase_id=labelbase_id
         )
         context["api_token"] = Token.objects.get(user_id=self.request.user.id)
+        context["refresh_progress"] = get_refresh_progress(labelbase_id)
         return context
 
     def post(self, request, *args, **kwargs):
@@ -475,15 +575,13 @@ class LabelbaseMergeView(LabelbaseView):
 
     def get_queryset(self):
         labels = []
-        qs = Label.objects.filter(
-            labelbase__user_id=self.request.user.id,
-            labelbase_id=self.kwargs["labelbase_id"],
-        )
         lbl_type = self.request.GET.get("type", None)
         lbl_ref = self.request.GET.get("ref", None)
         lbl_label = self.request.GET.get("label", None)
 
-        for l in qs:
+        get_object_or_404(Labelbase, id=self.kwargs["labelbase_id"],
+                          user_id=self.request.user.id)
+        for l in get_label_rows(self.kwargs["labelbase_id"]):
             if lbl_type and lbl_ref and lbl_label:
                 if l.type == lbl_type and l.ref == lbl_ref and l.label == lbl_label:
                     labels.append(l)
@@ -505,16 +603,8 @@ class LabelbaseMergeView(LabelbaseView):
             elif lbl_label or lbl_label == '':
                 if l.label == lbl_label:
                     labels.append(l)
-        label_ids = []
-        for l in labels:
-            label_ids.append(l.id)
-        if label_ids:
-            qs = Label.objects.filter(id__in=label_ids,
-                                      labelbase__user_id=self.request.user.id,
-                                      labelbase_id=self.kwargs["labelbase_id"])
-        else:
-            qs = Label.objects.none()
-        return qs.order_by("id")
+        # already decrypted and ordered by id, no need to query them again
+        return labels
 
 
 class StatsAndKPIView(View):
@@ -548,10 +638,8 @@ class TreeMapsView(ListView):
     def get_context_data(self, **kwargs):
 
 
-        # Store nearest price information.
-        # TODO: This should (or could) be done on new blocks too.
-        from finances.models import HistoricalPrice
-        HistoricalPrice.get_or_create_from_api(self.request.user, -1)
+        # Refresh the shared spot price in the background if it is stale.
+        get_spot_prices()
 
         context = super().get_context_data(**kwargs)
 
@@ -564,69 +652,95 @@ class TreeMapsView(ListView):
         context['action'] = self.kwargs.get('action', 'unspent-outputs')
         return context
 
-    def get_queryset_OLD(self):
-        #action = self.kwargs.get('action', 'unspent-outputs')
-        label_ids = []
+    def get_queryset(self):
+        labels = []
 
         qs = Label.objects.filter(
+            type=Label.TYPE_OUTPUT,
             labelbase__user_id=self.request.user.id,
             labelbase_id=self.kwargs["pk"],
-        )
+            output_stat__spent=False,
+        ).select_related("output_stat", "labelbase__user__profile").order_by("id")
+
+        action = self.kwargs.get('action', 'unspent-outputs')
 
         for l in qs:
-            if l.type == "output":
-                output = OutputStat.objects.filter(
-                                            user=l.labelbase.user,
-                                            type_ref_hash=l.type_ref_hash,
-                                            network=l.labelbase.network).last()
-                if output and output.spent is False:
-                    # FIXME: redundend code.
-                    # The template processes each output and adds or drops it,
-                    # depending of its state.
-
-                    #if action == 'unspent-spendable-outputs' and l.spendable is True:
-                    #    label_ids.append(l.id)
-                    #else:
-                    label_ids.append(l.id)
-        if label_ids:
-            qs = qs.filter(id__in=label_ids,
-                           labelbase__user_id=self.request.user.id,
-                           labelbase_id=self.kwargs["pk"])
-        else:
-            qs = Label.objects.none()
-        return qs.order_by("id")
+            # For fee-efficiency, only show spendable outputs
+            if action == 'fee-efficiency':
+                if l.spendable is True:
+                    labels.append(l)
+            else:
+                labels.append(l)
+        # value all outputs and their fee health at once instead of per
+        # label in the template
+        value_labels(labels)
+        if labels:
+            fee_health_statuses(labels, labels[0].labelbase.user.profile)
+        # the labels are already loaded, no need to query them again
+        return labels
+
+
+class CoinSelectionView(TemplateView):
+    """
+    Plans a spend or a consolidation of the spendable outputs, next to
+    the fee efficiency tree map. The same plan is available as JSON from
+    the coin selection API.
+    """
+    template_name = "labelbase_coin_selection.html"
 
-    def get_queryset(self):
-        label_ids = []
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        labelbase = get_object_or_404(
+            Labelbase, id=self.kwargs["pk"], user_id=self.request.user.id
+        )
+        context['labelbase'] = labelbase
+        context['active_labelbase_id'] = labelbase.id
+        context['action'] = 'coin-selection'
+        context['params'] = self.request.GET
+        if self.request.GET.get('mode'):
+            try:
+                context['plan'] = plan_for_labelbase(labelbase, self.request.GET)
+            except ValueError as ex:
+                context['error'] = str(ex)
+        return context
 
-        qs = Label.objects.filter(
-            labelbase__user_id=self.request.user.id,
-            labelbase_id=self.kwargs["pk"],
+
+class PortfolioTimelineView(TemplateView):
+    """
+    Chart of the value of the outputs of a labelbase over time, the daily
+    series is loaded from ``PortfolioTimelineDataView``.
+    """
+    template_name = "labelbase_timeline.html"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        labelbase = get_object_or_404(
+            Labelbase, id=self.kwargs["pk"], user_id=self.request.user.id
         )
+        context['labelbase'] = labelbase
+        context['active_labelbase_id'] = labelbase.id
+        context['action'] = 'timeline'
+        return context
 
-        action = self.kwargs.get('action', 'unspent-outputs')
 
-        for l in qs:
-            if l.type == "output":
-                output = OutputStat.objects.filter(
-                                            user=l.labelbase.user,
-                                            type_ref_hash=l.type_ref_hash,
-                                            network=l.labelbase.network).last()
-                if output and output.spent is False:
-                    # For fee-efficiency, only show spendable outputs
-                    if action == 'fee-efficiency':
-                        if l.spendable is True:
-                            label_ids.append(l.id)
-                    else:
-                        label_ids.append(l.id)
+class PortfolioTimelineDataView(View):
+    def get(self, request, *args, **kwargs):
+        labelbase = get_object_or_404(
+            Labelbase, id=self.kwargs["pk"], user_id=request.user.id
+        )
+        currency = request.GET.get("currency") or request.user.profile.my_currency
+        try:
+            return JsonResponse(portfolio_timeline(labelbase.id, currency))
+        except ValueError as ex:
+            return JsonResponse({"error": str(ex)}, status=400)
 
-        if label_ids:
-            qs = qs.filter(id__in=label_ids,
-                           labelbase__user_id=self.request.user.id,
-                           labelbase_id=self.kwargs["pk"])
-        else:
-            qs = Label.objects.none()
-        return qs.order_by("id")
+
+class RefreshProgressView(View):
+    def get(self, request, *args, **kwargs):
+        labelbase = get_object_or_404(
+            Labelbase, id=self.kwargs["pk"], user_id=request.user.id
+        )
+        return JsonResponse(get_refresh_progress(labelbase.id) or {"state": None})
 
 
 class LabelbasePortfolioView(LabelbaseView):
@@ -634,26 +748,18 @@ class LabelbasePortfolioView(LabelbaseView):
 
     def get_queryset(self):
         self.balances = {}
-        label_ids = []
-        qs = Label.objects.filter(
-            labelbase__user_id=self.request.user.id,
-            labelbase_id=self.kwargs["labelbase_id"],
-        )
-        for l in qs:
+        labels = []
+        get_object_or_404(Labelbase, id=self.kwargs["labelbase_id"],
+                          user_id=self.request.user.id)
+        for l in get_label_rows(self.kwargs["labelbase_id"]):
             if l.type == "output":
-                val, cur = extract_fiat_value(l.label)
-                if val > 0:
-                    if self.balances.get(cur, None) is None:
-                        self.balances[cur] = 0
-                    self.balances[cur] += val
-                label_ids.append(l.id)
-        if label_ids:
-            qs = Label.objects.filter(id__in=label_ids,
-                                      labelbase__user_id=self.request.user.id,
-                                      labelbase_id=self.kwargs["labelbase_id"])
-        else:
-            qs = Label.objects.none()
-        return qs.order_by("id")
+                # parsed when the label was saved, see Label.update_fiat_value
+                if l.fiat_value is not None and l.fiat_value > 0:
+                    if self.balances.get(l.fiat_currency, None) is None:
+                        self.balances[l.fiat_currency] = 0
+                    self.balances[l.fiat_currency] += l.fiat_value
+                labels.append(l)
+        return labels
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -671,7 +777,7 @@ class FixAndMergeLabelsView(View):
         )
 
         # Fetch all records for the specified Labelbase
-        records = Label.objects.filter(labelbase_id=labelbase_id)
+        records = get_label_rows(labelbase.id)
 
         # Create a dictionary to store records grouped by type, ref, and label
         record_groups_type_and_ref = {}
@@ -769,10 +875,8 @@ class CurrencySyncView(View):
         labelbase = get_object_or_404(Labelbase, id=labelbase_id, user_id=request.user.id)
 
         # Get all output and input labels (types that support fmv)
-        labels = Label.objects.filter(
-            labelbase_id=labelbase_id,
-            type__in=['output', 'input']
-        )
+        labels = [row for row in get_label_rows(labelbase.id)
+                  if row.type in ['output', 'input']]
 
         # Categorize
         text_only = []  # Has currency in label, no FMV
@@ -1014,10 +1118,8 @@ class ExportLabelsView(View):
                     label_writer = BIP329JSONLEncryptedWriter(temp_file.name, passphrase, remove_existing=True)
                 else:
                     label_writer = BIP329JSONLWriter(temp_file.name, remove_existing=True)
-                labels = Label.objects.filter(labelbase_id=labelbase_id,
-                                              labelbase__user_id=request.user.id,
-                                              type__in=selected_type_attributes
-                                             ).order_by("id")
+                labels = [row for row in get_label_rows(labelbase.id)
+                          if row.type in selected_type_attributes]
                 for label in labels:
                     label_entry = {
                         "type": label.type,
@@ -1138,17 +1240,14 @@ class LabelUpdateView(UpdateView):
             if self.object.type == "tx":
                 # used by "labeling"
                 mempool_api = self.object.labelbase.get_mempool_api()
-                context["res_tx"] = mempool_api.get_transaction(self.object.ref)
+                context["res_tx"] = get_mempool_transaction(mempool_api, self.object.ref)
 
         if self.object.type == "xpub":
             context["address_count"] = self.request.GET.get("address_count", DEFAULT_DERIVE_ADDRESS_COUNT)
             context["offset"] = int(self.request.GET.get("offset", 0))
 
         if self.object.type == "output":
-            output_stat = OutputStat.objects.filter(
-                user=self.object.labelbase.user,
-                type_ref_hash=self.object.type_ref_hash
-            ).last()
+            output_stat = self.object.output_stat
             context["output"] = output_stat
 
             # Convert Unix timestamp to human-readable UTC formats
@@ -1286,7 +1385,7 @@ class FillMissingDataView(View):
         output_labels = Label.objects.filter(
             labelbase_id=labelbase_id,
             type='output'
-        )
+        ).select_related("output_stat")
 
         can_fill_from_outputstat = []
         already_complete = []
@@ -1298,11 +1397,7 @@ class FillMissingDataView(View):
                 continue
 
             # Check if OutputStat exists
-            output_stat = OutputStat.objects.filter(
-                user=label.labelbase.user,
-                type_ref_hash=label.type_ref_hash,
-                network=label.labelbase.network
-            ).first()
+            output_stat = label.output_stat
 
             if output_stat:
                 can_fill_from_outputstat.append({
@@ -1356,7 +1451,7 @@ class FillMissingDataActionView(View):
             labelbase_id=labelbase_id,
             labelbase__user_id=user_id,
             type='output'
-        )
+        ).select_related("output_stat")
         count = 0
         for label in labels:
             if self._fill_label_from_outputstat(label):
@@ -1366,11 +1461,7 @@ class FillMissingDataActionView(View):
 
     def _fill_label_from_outputstat(self, label):
         """Fill a single label from OutputStat data"""
-        output_stat = OutputStat.objects.filter(
-            user=label.labelbase.user,
-            type_ref_hash=label.type_ref_hash,
-            network=label.labelbase.network
-        ).first()
+        output_stat = label.output_stat
 
         if not output_stat:
             return False
@@ -1423,11 +1514,7 @@ class FillOutputFieldsActionView(View):
 
     def _fill_label_from_outputstat(self, label):
         """Fill a single label from OutputStat data (reused from FillMissingDataActionView)"""
-        output_stat = OutputStat.objects.filter(
-            user=label.labelbase.user,
-            type_ref_hash=label.type_ref_hash,
-            network=label.labelbase.network
-        ).first()
+        output_stat = label.output_stat
 
         if not output_stat:
             return False
@@ -17,8 +17,23 @@ def get_fernet_key(secret_key, salt):
     key = base64.urlsafe_b64encode(kdf.derive(secret_key.encode()))
     return Fernet(key)
 
+def get_blind_index_key(secret_key, salt):
+    """
+    Derive the HMAC key for blind index tokens, kept separate from the
+    Fernet key so tokens can never be used to decrypt anything.
+    """
+    kdf = PBKDF2HMAC(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt="{}blind-index".format(salt).encode(),
+        iterations=100000,
+        backend=default_backend()
+    )
+    return kdf.derive(secret_key.encode())
+
 # Create a Fernet cipher suite using the derived key
 cipher_suite = get_fernet_key(settings.SECRET_KEY, settings.CRYPTOGRAPHY_SALT)
+blind_index_key = get_blind_index_key(settings.SECRET_KEY, settings.CRYPTOGRAPHY_SALT)
 
 def encrypt_data(data):
     json_data = json.dumps(data).encode('utf-8')